@@ -0,0 +1,136 @@
+"""
+Command latency of toyota_bot_fixed while a /search scrape is running
+
+Runs /search against a slow fake ss.lv and meanwhile sends /start every
+POLL seconds, measuring how long each /start takes to be answered:
+- "blocking": the scrape is called directly in the handler (old behaviour)
+- "worker":   the real search_command, scrape in scrape_executor
+
+Usage:
+    python bench_command_latency.py [page_delay_seconds]
+"""
+import sys
+import time
+import asyncio
+import logging
+import statistics
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+from ss_fetcher import PageCache
+from singleflight import SingleFlight
+from fixtures.fake_sslv import read_fixture, DEFECTS_URL
+
+POLL = 0.1
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+class SlowSession:
+    """Every list page takes ``delay`` seconds to download"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.sent = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent.append(url)
+        time.sleep(self.delay)
+        fixture = "defects_list.html" if url == DEFECTS_URL else "toyota_list.html"
+        return FakeResponse(read_fixture(fixture))
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+        self.markups = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None):
+        self.replies.append((time.monotonic(), text))
+        self.markups.append(reply_markup)
+
+
+def make_update(user_id: int = 1):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=FakeMessage())
+
+
+async def blocking_search(update, context):
+    """search_command as it was: the scrape runs on the event loop"""
+    await update.message.reply_text("🔍 Searching for matching listings...")
+    listings = toyota_bot_fixed.scrape_listings()
+    message, keyboard = toyota_bot_fixed.format_listings_message(toyota_bot_fixed.filter_all_listings(listings or []))
+    await update.message.reply_text(message, reply_markup=keyboard)
+
+
+def setup(page_delay: float) -> SlowSession:
+    session = SlowSession(page_delay)
+    toyota_bot_fixed.http_session = session
+    toyota_bot_fixed.page_cache = PageCache()
+    toyota_bot_fixed.source_fetched_at.clear()
+    toyota_bot_fixed.source_listings.clear()  # cold start: /search has to scrape
+    toyota_bot_fixed.search_flight = SingleFlight(max_age=toyota_bot_fixed.SEARCH_MAX_AGE)
+    toyota_bot_fixed.wait_for_request_slot = lambda cancel=None: True
+    return session
+
+
+async def measure(search_handler, page_delay: float):
+    """
+    Run one /search while /start updates arrive every POLL seconds.
+    Latency is counted from the moment an update arrives, so a stalled
+    event loop shows up in it (an update arriving during a blocking scrape
+    waits for the scrape to finish).
+
+    Returns (search duration, [latency of each /start])
+    """
+    setup(page_delay)
+    context = SimpleNamespace(bot_data={}, args=[])
+    latencies = []
+    started = time.monotonic()
+    search = asyncio.create_task(search_handler(make_update(), context))
+
+    async def user(arrives_at: float):
+        await asyncio.sleep(max(0.0, arrives_at - time.monotonic()))
+        update = make_update(2)
+        await toyota_bot_fixed.start_command(update, context)
+        latencies.append(update.message.replies[0][0] - arrives_at)
+
+    users = []
+    tick = started + POLL
+    expected = len(toyota_bot_fixed.SS_LV_URLS) * page_delay
+    while tick < started + expected:
+        users.append(asyncio.create_task(user(tick)))
+        tick += POLL
+    await asyncio.gather(search, *users)
+    return time.monotonic() - started, latencies
+
+
+def report(name: str, duration: float, latencies):
+    print(
+        f"{name:>9}: /search took {duration:5.2f}s, {len(latencies)} x /start during it: "
+        f"median {statistics.median(latencies) * 1000:7.1f} ms, max {max(latencies) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    page_delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    logging.getLogger('toyota_bot_fixed').setLevel(logging.WARNING)
+    original_slot = toyota_bot_fixed.wait_for_request_slot
+    try:
+        report("blocking", *asyncio.run(measure(blocking_search, page_delay)))
+        report("worker", *asyncio.run(measure(toyota_bot_fixed.search_command, page_delay)))
+    finally:
+        toyota_bot_fixed.wait_for_request_slot = original_slot
+        toyota_bot_fixed.http_session = None
+
+
+if __name__ == "__main__":
+    main()
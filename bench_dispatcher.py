@@ -0,0 +1,111 @@
+"""
+Notification fan-out against a fake Telegram with flood control
+
+The fake Bot API answers RetryAfter when the bot sends more than
+GLOBAL_LIMIT messages in one second, or a second message to the same
+chat within CHAT_INTERVAL. Three ways of sending LISTINGS notifications
+to SUBSCRIBERS chats are compared:
+- "serial":     one message after another with a fixed sleep (toyota.py)
+- "gather":     every (listing x user) send at once (toyota_bot_fixed)
+- "dispatcher": NotificationDispatcher
+
+Usage:
+    python bench_dispatcher.py [subscribers] [listings]
+"""
+import sys
+import time
+import asyncio
+import logging
+from collections import deque
+sys.path.insert(0, '.')
+
+import telegram.error
+
+from telegram_dispatcher import NotificationDispatcher
+
+GLOBAL_LIMIT = 30  # messages per rolling second
+CHAT_INTERVAL = 0.95  # seconds between two messages to one chat
+LATENCY = 0.02  # request round trip
+SERIAL_SLEEP = 0.3
+
+
+class FakeTelegram:
+    """send_message with Telegram-like flood control"""
+
+    def __init__(self, latency: float = LATENCY):
+        self.latency = latency
+        self.recent = deque()
+        self.last_in_chat = {}
+        self.delivered = []
+        self.flood_errors = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] >= 1.0:
+            self.recent.popleft()
+        too_fast_in_chat = now - self.last_in_chat.get(chat_id, float("-inf")) < CHAT_INTERVAL
+        if len(self.recent) >= GLOBAL_LIMIT or too_fast_in_chat:
+            self.flood_errors += 1
+            await asyncio.sleep(self.latency)
+            raise telegram.error.RetryAfter(1)
+        self.recent.append(now)
+        self.last_in_chat[chat_id] = now
+        await asyncio.sleep(self.latency)
+        self.delivered.append((now, chat_id, text))
+        return len(self.delivered)
+
+
+async def run_serial(api, chats, listings):
+    for listing in listings:
+        for chat_id in chats:
+            try:
+                await api.send_message(chat_id=chat_id, text=listing)
+            except telegram.error.RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            await asyncio.sleep(SERIAL_SLEEP)
+
+
+async def run_gather(api, chats, listings):
+    await asyncio.gather(
+        *(api.send_message(chat_id=chat_id, text=listing) for listing in listings for chat_id in chats),
+        return_exceptions=True
+    )
+
+
+async def run_dispatcher(api, chats, listings):
+    dispatcher = NotificationDispatcher(api.send_message)
+    for listing in listings:
+        dispatcher.broadcast(chats, text=listing)
+    await dispatcher.join()
+    return dispatcher.stats()
+
+
+async def measure(strategy, subscribers: int, listings: int):
+    api = FakeTelegram()
+    chats = list(range(1, subscribers + 1))
+    texts = [f"listing {i}" for i in range(listings)]
+    started = time.monotonic()
+    await strategy(api, chats, texts)
+    elapsed = time.monotonic() - started
+    return elapsed, len(api.delivered), api.flood_errors, subscribers * listings
+
+
+def report(name, elapsed, delivered, flood_errors, total):
+    print(
+        f"{name:>10}: {delivered:4d}/{total} delivered in {elapsed:6.1f}s "
+        f"({delivered / elapsed:5.1f} msg/s), {flood_errors} flood errors"
+    )
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    listings = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.getLogger('telegram_dispatcher').setLevel(logging.ERROR)
+
+    report("dispatcher", *asyncio.run(measure(run_dispatcher, subscribers, listings)))
+    report("gather", *asyncio.run(measure(run_gather, subscribers, listings)))
+    report("serial", *asyncio.run(measure(run_serial, subscribers, listings)))
+
+
+if __name__ == "__main__":
+    main()
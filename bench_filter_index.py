@@ -0,0 +1,84 @@
+"""
+Matching new listings against saved user filters: full scan vs index
+
+USERS random users (1-3 filters each, /search criteria) and LISTINGS
+random listings; every listing is matched against all filters once with
+a scan over every user and once through SubscriptionIndex. Both must
+return the same users.
+
+Usage:
+    python bench_filter_index.py [users] [listings]
+"""
+import sys
+import time
+import random
+sys.path.insert(0, '.')
+
+from listing_index import SearchQuery
+from subscriptions import SubscriptionIndex, scan_matches
+
+MODELS = ["corolla", "yaris", "avensis", "rav4", "auris", "hilux", "land cruiser", "prius", "camry", "aygo"]
+FUELS = ["petrol", "diesel", "hybrid"]
+
+
+def random_query(rng: random.Random) -> SearchQuery:
+    query = SearchQuery()
+    if rng.random() < 0.85:
+        query.model = rng.choice(MODELS + ["land"])
+    if rng.random() < 0.5:
+        query.fuel = rng.choice(FUELS)
+    if rng.random() < 0.15:
+        query.defect = True
+    if rng.random() < 0.7:
+        low = rng.choice([None, 1000, 2000, 5000])
+        query.price_min, query.price_max = low, (low or 0) + rng.choice([3000, 5000, 10000, 20000])
+    if rng.random() < 0.5:
+        query.year_min = rng.randint(1998, 2015)
+        query.year_max = rng.choice([None, query.year_min + rng.randint(2, 8)])
+    return query
+
+
+def random_features(rng: random.Random) -> dict:
+    return {
+        "model": rng.choice(MODELS + [""]),
+        "fuel": rng.choice(FUELS + [""]),
+        "defect": rng.random() < 0.2,
+        "year": rng.choice([None] + list(range(1995, 2024))),
+        "price": rng.choice([None, rng.randint(300, 40000)]),
+    }
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    listings = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    rng = random.Random(42)
+
+    filters = {user_id: [random_query(rng) for _ in range(rng.randint(1, 3))] for user_id in range(users)}
+    features = [random_features(rng) for _ in range(listings)]
+
+    started = time.perf_counter()
+    index = SubscriptionIndex()
+    for user_id, queries in filters.items():
+        index.set(user_id, queries)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed = [index.match_features(f) for f in features]
+    index_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scanned = [scan_matches(filters, f) for f in features]
+    scan_time = time.perf_counter() - started
+
+    assert indexed == scanned, "index and scan disagree"
+    recipients = sum(len(users) for users in indexed)
+    print(f"{users} users, {index.stats()['filters']} filters, {listings} listings, "
+          f"{recipients / listings:.0f} recipients per listing")
+    print(f"  index build: {build * 1000:8.1f} ms ({index.stats()['buckets']} buckets)")
+    print(f"  scan:        {scan_time * 1000:8.1f} ms ({scan_time / listings * 1e6:7.1f} µs per listing)")
+    print(f"  index:       {index_time * 1000:8.1f} ms ({index_time / listings * 1e6:7.1f} µs per listing)")
+    print(f"  speedup:     {scan_time / index_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
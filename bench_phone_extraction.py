@@ -0,0 +1,86 @@
+"""
+Phone extraction latency per listing on recorded pages served locally
+
+Serves the fixtures/phone_*.html listing pages (and a /phone endpoint
+answering the reveal request after XHR_DELAY seconds) on localhost and
+runs find_phone_on_page on each in a pooled headless Chrome:
+- phone_direct:  number shown on the page
+- phone_reveal:  "Parādīt tālruni" loads the number with an XHR
+- phone_captcha: the reveal only shows a CAPTCHA
+
+The fixed sleeps the waits replaced (2 s per click, 1.5 s per reveal
+script, 3 s before the DOM rescan) added 11.5 s to phone_reveal and
+phone_captcha each. Needs Chrome / chromedriver.
+
+Usage:
+    python bench_phone_extraction.py [rounds] [xhr_delay_seconds]
+"""
+import sys
+import time
+import threading
+import statistics
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+from browser_pool import BrowserPool
+from fixtures.fake_sslv import FIXTURES_DIR
+
+PAGES = ["phone_direct.html", "phone_reveal.html", "phone_captcha.html"]
+PHONE = "+371 29123456"
+
+
+def serve_fixtures(xhr_delay: float) -> ThreadingHTTPServer:
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(FIXTURES_DIR), **kwargs)
+
+        def do_GET(self):
+            if self.path.startswith("/phone?"):
+                time.sleep(xhr_delay)
+                body = PHONE.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    xhr_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    server = serve_fixtures(xhr_delay)
+    base = f"http://127.0.0.1:{server.server_address[1]}/"
+    pool = BrowserPool(size=1)
+    try:
+        pool.run(lambda driver: driver.get(base + PAGES[0]))  # start Chrome outside the measurement
+    except Exception as e:
+        print(f"Chrome not available: {e}")
+        sys.exit(1)
+
+    try:
+        print(f"{rounds} rounds, reveal request takes {xhr_delay:.1f}s")
+        for page in PAGES:
+            times, results = [], set()
+            for _ in range(rounds):
+                started = time.monotonic()
+                results.add(pool.run(partial(toyota_bot_fixed.find_phone_on_page, base + page)))
+                times.append(time.monotonic() - started)
+            print(f"  {page:20s} median {statistics.median(times):.2f}s, max {max(times):.2f}s -> {', '.join(sorted(results))}")
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
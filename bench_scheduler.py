@@ -0,0 +1,117 @@
+"""
+Simulated comparison of fixed-interval polling and PollScheduler
+
+Replays one day of Poisson listing arrivals with a day/night profile
+for the two toyota.py sources and reports, for each polling strategy,
+how many list-page requests it sent and how long new listings waited
+before the next poll detected them.
+
+Usage:
+    python bench_scheduler.py [days] [seed]
+"""
+import sys
+import random
+import statistics
+sys.path.insert(0, '.')
+
+from poll_scheduler import PollScheduler
+
+# New listings per hour: (day 08-22, night 22-08)
+SOURCES = {
+    "toyota": (20.0, 1.0),
+    "defects": (4.0, 0.3),
+}
+DAY = 24 * 3600
+
+
+def hourly_rate(source: str, t: float) -> float:
+    hour = (t % DAY) / 3600
+    day_rate, night_rate = SOURCES[source]
+    return day_rate if 8 <= hour < 22 else night_rate
+
+
+def generate_arrivals(days: int, rng: random.Random):
+    """Arrival times per source (thinning of a Poisson process)"""
+    arrivals = {}
+    for source, (day_rate, _) in SOURCES.items():
+        peak = day_rate / 3600
+        times, t = [], 0.0
+        while True:
+            t += rng.expovariate(peak)
+            if t >= days * DAY:
+                break
+            if rng.random() < hourly_rate(source, t) / day_rate:
+                times.append(t)
+        arrivals[source] = times
+    return arrivals
+
+
+def simulate(arrivals, days: int, next_interval, on_poll=None):
+    """
+    Poll every source on its own clock: next_interval(source, now) gives the
+    wait after each poll, on_poll(source, new, now) sees each poll result.
+    Returns (requests, detection latencies).
+    """
+    pending = {source: list(times) for source, times in arrivals.items()}
+    clock = {source: 0.0 for source in arrivals}
+    requests = 0
+    latencies = []
+
+    while True:
+        source = min(clock, key=clock.get)
+        now = clock[source]
+        if now >= days * DAY:
+            break
+        requests += 1
+        found = 0
+        queue = pending[source]
+        while queue and queue[0] <= now:
+            latencies.append(now - queue.pop(0))
+            found += 1
+        if on_poll:
+            on_poll(source, found, now)
+        clock[source] = now + next_interval(source, now)
+    return requests, latencies
+
+
+def run_fixed(arrivals, days: int, rng: random.Random, interval: float = 20.0, jitter: float = 5.0):
+    return simulate(arrivals, days, lambda source, now: interval + rng.random() * jitter)
+
+
+def run_adaptive(arrivals, days: int):
+    scheduler = PollScheduler(
+        SOURCES,
+        target_latency=8.0,
+        request_budget=400 / 3600,
+        jitter=0.0,
+    )
+    last_interval = {}
+
+    def on_poll(source, found, now):
+        last_interval[source] = scheduler.record_poll(source, found, now=now)
+
+    return simulate(arrivals, days, lambda source, now: last_interval[source], on_poll)
+
+
+def report(name: str, requests: int, latencies, days: int):
+    latencies = sorted(latencies)
+    p90 = latencies[int(len(latencies) * 0.9)] if latencies else 0.0
+    print(
+        f"{name:>10}: {requests:6d} requests ({requests / (24 * days):5.1f}/h), "
+        f"latency median {statistics.median(latencies):5.1f}s, "
+        f"mean {statistics.mean(latencies):5.1f}s, p90 {p90:5.1f}s "
+        f"over {len(latencies)} listings"
+    )
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    arrivals = generate_arrivals(days, random.Random(seed))
+
+    report("fixed 20s", *run_fixed(arrivals, days, random.Random(seed)), days)
+    report("adaptive", *run_adaptive(arrivals, days), days)
+
+
+if __name__ == "__main__":
+    main()
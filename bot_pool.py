@@ -0,0 +1,250 @@
+"""
+Notification fan-out over several bot tokens
+
+Telegram limits every bot token to about 30 messages per second. A pool
+of bots multiplies that: each bot has its own NotificationDispatcher
+(its own global and per-chat token buckets), and every chat is pinned to
+one bot of the pool with consistent hashing, so messages to one chat
+still go through one queue, in order. Adding or removing a token only
+moves the chats of that token.
+
+Each bot has a health state. A token Telegram rejects (InvalidToken) is
+disabled; after FAILURES_BEFORE_DOWN network errors in a row a bot is
+skipped for DOWN_FOR seconds. The chats of a bot that is not available
+go to the next bot on the ring.
+
+A bot can only message users who have started it. When a secondary bot
+gets Forbidden, the chat is moved to the primary bot (the one the
+application runs) for good, and the message is resent from there; only
+a Forbidden of the primary bot means the user blocked the bot. These
+chats are reported to ``on_primary_only`` so the caller can store them
+and pass them back as ``primary_only`` after a restart.
+
+The pool owns the secondary bots: each is initialized before its first
+send (which also checks its token) and shut down by close().
+"""
+
+import asyncio
+import hashlib
+import time
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Set
+
+import telegram.error
+
+from telegram_dispatcher import GLOBAL_RATE, MAX_RETRIES, PER_CHAT_RATE, NotificationDispatcher
+
+VNODES = 100  # points per bot on the hash ring
+FAILURES_BEFORE_DOWN = 3  # network errors in a row that take a bot out
+DOWN_FOR = 60  # seconds a failing bot is skipped
+
+
+def bot_id(token: str) -> str:
+    """Numeric bot ID part of a token ("123456:ABC..." -> "123456")"""
+    return token.split(":", 1)[0]
+
+
+class HashRing:
+    """Consistent hashing of keys (chat IDs) onto nodes (bot IDs)"""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = VNODES):
+        points = sorted((self._hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+        self.node_count = len(set(self._nodes))
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def nodes_for(self, key: Hashable) -> Iterator[str]:
+        """All nodes, in ring order starting with the one ``key`` belongs to"""
+        if not self._nodes:
+            return
+        start = bisect_right(self._hashes, self._hash(str(key)))
+        seen: Set[str] = set()
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == self.node_count:
+                    return
+
+    def get(self, key: Hashable) -> Optional[str]:
+        return next(self.nodes_for(key), None)
+
+
+class BotHealth:
+    """Health of one bot of the pool"""
+
+    def __init__(self):
+        self.failures = 0
+        self.down_until = 0.0
+        self.disabled = False
+        self.error: Optional[str] = None
+
+    def available(self, now: Optional[float] = None) -> bool:
+        return not self.disabled and (now if now is not None else time.monotonic()) >= self.down_until
+
+    def ok(self) -> None:
+        self.failures = 0
+
+    def failed(self, error: BaseException) -> None:
+        self.failures += 1
+        self.error = str(error)
+        if self.failures >= FAILURES_BEFORE_DOWN:
+            self.down_until = time.monotonic() + DOWN_FOR
+            self.failures = 0
+
+    def disable(self, error: BaseException) -> None:
+        self.disabled = True
+        self.error = str(error)
+
+
+class BotPool:
+    """
+    Same interface as NotificationDispatcher (submit, broadcast, join,
+    close, stats), sending through ``bots``; the first one is the primary
+    bot. ``send`` is the primary bot's send_message.
+    """
+
+    def __init__(
+        self,
+        bots: Sequence[Any],
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_retries: int = MAX_RETRIES,
+        on_forbidden: Optional[Callable[[Hashable], None]] = None,
+        chat_rates: Optional[Dict[Hashable, float]] = None,
+        primary_only: Iterable[Hashable] = (),
+        on_primary_only: Optional[Callable[[Hashable], None]] = None,
+    ):
+        if not bots:
+            raise ValueError("at least one bot is required")
+        self.bots = {bot_id(bot.token): bot for bot in bots}
+        self.primary = bot_id(bots[0].token)
+        self.send = bots[0].send_message
+        self.health = {name: BotHealth() for name in self.bots}
+        self.dispatchers = {
+            name: NotificationDispatcher(
+                self._sender(name),
+                global_rate=global_rate,
+                per_chat_rate=per_chat_rate,
+                max_retries=max_retries,
+                on_forbidden=on_forbidden if name == self.primary else None,
+                chat_rates=chat_rates,
+            )
+            for name in self.bots
+        }
+        self.ring = HashRing(self.bots)
+        self._primary_only: Set[Hashable] = set(primary_only)  # chats that didn't start a secondary bot
+        self.on_primary_only = on_primary_only
+        self._started: Dict[str, asyncio.Future] = {}  # secondary bot -> its initialize()
+        # Messages handed to another bot; both dispatchers count them
+        self.rerouted = 0
+
+    def bot_for(self, chat_id: Hashable) -> str:
+        """ID of the bot sending to ``chat_id`` now"""
+        if chat_id in self._primary_only:
+            return self.primary
+        now = time.monotonic()
+        for name in self.ring.nodes_for(chat_id):
+            if self.health[name].available(now):
+                return name
+        return self.primary
+
+    def _sender(self, name: str) -> Callable:
+        async def send(chat_id: Hashable, **kwargs: Any) -> Any:
+            if name != self.primary and chat_id in self._primary_only:
+                return await self._reroute(chat_id, kwargs)
+            try:
+                if name != self.primary:
+                    await self._start(name)
+                result = await self.bots[name].send_message(chat_id=chat_id, **kwargs)
+            except telegram.error.Forbidden:
+                if name == self.primary:
+                    raise
+                if chat_id not in self._primary_only:
+                    self._primary_only.add(chat_id)
+                    if self.on_primary_only:
+                        self.on_primary_only(chat_id)
+                return await self._reroute(chat_id, kwargs)
+            except telegram.error.InvalidToken as e:
+                self.health[name].disable(e)
+                if name == self.primary:
+                    raise
+                return await self._reroute(chat_id, kwargs)
+            except (telegram.error.BadRequest, telegram.error.RetryAfter):
+                raise
+            except telegram.error.NetworkError as e:
+                self.health[name].failed(e)
+                raise
+            self.health[name].ok()
+            return result
+
+        return send
+
+    async def _start(self, name: str) -> None:
+        """Initialize a secondary bot once (a failed attempt is retried by the next send)"""
+        if name not in self._started:
+            self._started[name] = asyncio.ensure_future(self.bots[name].initialize())
+        try:
+            await asyncio.shield(self._started[name])
+        except Exception:
+            self._started.pop(name, None)
+            raise
+
+    async def _reroute(self, chat_id: Hashable, kwargs: Dict[str, Any]) -> Any:
+        """Send through the bot now responsible for ``chat_id`` and wait for it"""
+        self.rerouted += 1
+        return await self.dispatchers[self.bot_for(chat_id)].submit(chat_id, **kwargs)
+
+    def submit(self, chat_id: Hashable, priority: int = 0, **kwargs: Any) -> asyncio.Future:
+        return self.dispatchers[self.bot_for(chat_id)].submit(chat_id, priority, **kwargs)
+
+    def broadcast(self, chat_ids: Iterable[Hashable], priority: int = 0, **kwargs: Any) -> List[asyncio.Future]:
+        return [self.submit(chat_id, priority, **kwargs) for chat_id in chat_ids]
+
+    def pending(self) -> int:
+        return sum(dispatcher.pending() for dispatcher in self.dispatchers.values())
+
+    async def join(self) -> None:
+        # A message moved to the primary bot can arrive after its join returned
+        while self.pending():
+            await asyncio.gather(*(dispatcher.join() for dispatcher in self.dispatchers.values()))
+
+    async def close(self) -> None:
+        """Stop the dispatchers and shut down the secondary bots (the primary belongs to the application)"""
+        await asyncio.gather(*(dispatcher.close() for dispatcher in self.dispatchers.values()))
+        started, self._started = self._started, {}
+        results = await asyncio.gather(*started.values(), return_exceptions=True)
+        await asyncio.gather(
+            *(self.bots[name].shutdown() for name, result in zip(started, results)
+              if not isinstance(result, BaseException)),
+            return_exceptions=True,
+        )
+
+    @property
+    def sent(self) -> int:
+        return sum(dispatcher.sent for dispatcher in self.dispatchers.values())
+
+    @property
+    def failed(self) -> int:
+        return sum(dispatcher.failed for dispatcher in self.dispatchers.values())
+
+    @property
+    def flood_waits(self) -> int:
+        return sum(dispatcher.flood_waits for dispatcher in self.dispatchers.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the whole pool (throughput summed over the bots) and per bot"""
+        per_bot = {name: dispatcher.stats() for name, dispatcher in self.dispatchers.items()}
+        totals = {key: sum(stats[key] for stats in per_bot.values())
+                  for key in ("sent", "failed", "flood_waits", "retries", "pending", "chats", "throughput")}
+        totals["rerouted"] = self.rerouted
+        totals["bots"] = {
+            name: dict(stats, available=self.health[name].available(), error=self.health[name].error)
+            for name, stats in per_bot.items()
+        }
+        return totals
@@ -0,0 +1,236 @@
+"""
+Pool of long-lived headless Chrome workers
+
+Starting Chrome for every page costs seconds and a few hundred MB. The
+pool keeps at most ``size`` browsers running and reuses them:
+
+- every worker owns one driver and one thread (a driver must not be used
+  from two threads), takes jobs from an asyncio queue and runs them as
+  ``fn(driver)``
+- after each job the tab goes back to about:blank and windows the page
+  opened are closed, so the next job starts from a clean, small tab
+- a browser is restarted after ``max_pages`` jobs, when its process tree
+  uses more than ``max_memory_mb`` (needs psutil) or after a job raised;
+  it is shut down after ``idle_timeout`` seconds without jobs and
+  started again on demand
+
+The pool runs its own event loop in a daemon thread, so both the scrape
+threads and coroutines can use it: run() blocks, arun() awaits.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BROWSER_WORKERS = 1  # Chrome needs ~150-250 MB; the container has 512 MB
+MAX_PAGES_PER_BROWSER = 50
+MAX_BROWSER_MEMORY_MB = 350
+BROWSER_IDLE_TIMEOUT = 300  # seconds
+JOB_TIMEOUT = 90  # seconds run() waits for a job, queueing included
+PAGE_LOAD_TIMEOUT = 30
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36')
+
+
+def chrome_driver():
+    """Headless Chrome with the options of the phone extraction"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--blink-settings=imagesEnabled=false')  # less memory, faster loads
+    options.add_argument('--window-size=1920,1080')
+    options.add_argument(f'--user-agent={USER_AGENT}')
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    return driver
+
+
+def process_tree_memory_mb(driver) -> Optional[float]:
+    """Resident memory of chromedriver and the browser processes it started (None: unknown)"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    pid = getattr(getattr(getattr(driver, 'service', None), 'process', None), 'pid', None)
+    if pid is None:
+        return None
+    try:
+        root = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [root] + root.children(recursive=True)) / 2 ** 20
+    except psutil.Error:
+        return None
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        size: int = BROWSER_WORKERS,
+        max_pages: int = MAX_PAGES_PER_BROWSER,
+        max_memory_mb: float = MAX_BROWSER_MEMORY_MB,
+        idle_timeout: float = BROWSER_IDLE_TIMEOUT,
+        driver_factory: Callable[[], Any] = chrome_driver,
+        memory_mb: Callable[[Any], Optional[float]] = process_tree_memory_mb,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.idle_timeout = idle_timeout
+        self.driver_factory = driver_factory
+        self.memory_mb = memory_mb
+        self.started = 0
+        self.recycled = 0
+        self.jobs = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='browser-pool', daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._workers = [self._loop.create_task(self._worker(i)) for i in range(self.size)]
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def submit(self, fn: Callable[[Any], Any]) -> concurrent.futures.Future:
+        """Queue ``fn(driver)``; thread-safe"""
+        return asyncio.run_coroutine_threadsafe(self._enqueue(fn), self._ensure_loop())
+
+    def run(self, fn: Callable[[Any], Any], timeout: float = JOB_TIMEOUT) -> Any:
+        """Run ``fn(driver)`` on a pooled browser and wait for its result"""
+        future = self.submit(fn)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()  # dropped if it has not started yet
+            raise
+
+    async def arun(self, fn: Callable[[Any], Any]) -> Any:
+        return await asyncio.wrap_future(self.submit(fn))
+
+    async def _enqueue(self, fn: Callable[[Any], Any]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, future))
+        return await future
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'browser-{index}')
+        driver = None
+        pages = 0
+        try:
+            while True:
+                try:
+                    fn, future = await asyncio.wait_for(self._queue.get(), self.idle_timeout if driver else None)
+                except asyncio.TimeoutError:
+                    logger.info(f"Browser {index} idle for {self.idle_timeout}s - shutting it down")
+                    await loop.run_in_executor(thread, self._quit, driver)
+                    driver = None
+                    continue
+                if future.done():  # cancelled while queued
+                    continue
+                try:
+                    if driver is None:
+                        driver = await loop.run_in_executor(thread, self.driver_factory)
+                        self.started += 1
+                        pages = 0
+                    result = await loop.run_in_executor(thread, self._job, fn, driver)
+                except Exception as e:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                    reason = f"job failed: {e}"
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                    pages += 1
+                    memory = self.memory_mb(driver)
+                    if pages >= self.max_pages:
+                        reason = f"{pages} pages"
+                    elif memory is not None and memory > self.max_memory_mb:
+                        reason = f"{memory:.0f} MB"
+                    else:
+                        continue
+                finally:
+                    self.jobs += 1
+                if driver is not None:
+                    logger.info(f"Restarting browser {index} ({reason})")
+                    await loop.run_in_executor(thread, self._quit, driver)
+                    self.recycled += 1
+                    driver = None
+        finally:
+            if driver is not None:
+                await loop.run_in_executor(thread, self._quit, driver)
+            thread.shutdown(wait=False)
+
+    @staticmethod
+    def _job(fn: Callable[[Any], Any], driver) -> Any:
+        try:
+            return fn(driver)
+        finally:
+            try:
+                # Back to a single blank tab
+                for handle in driver.window_handles[1:]:
+                    driver.switch_to.window(handle)
+                    driver.close()
+                driver.switch_to.window(driver.window_handles[0])
+                driver.get('about:blank')
+            except Exception as e:
+                logger.debug(f"Resetting the browser tab failed: {e}")
+
+    @staticmethod
+    def _quit(driver) -> None:
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug(f"Quitting the browser failed: {e}")
+
+    def close(self) -> None:
+        """Quit all browsers and stop the pool's loop"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def stop():
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(PAGE_LOAD_TIMEOUT)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'workers': self.size,
+            'started': self.started,
+            'recycled': self.recycled,
+            'jobs': self.jobs,
+            'failed': self.failed,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -0,0 +1,40 @@
+"""
+Shared pytest fixture of the offline tests
+
+The tests point the bots at fixtures by swapping their module globals
+(source URLs, caches, outbox, subscribers, patched functions). Every test
+module gets them back as they were, so one module's setup never leaks
+into the next.
+"""
+import sys
+
+import pytest
+
+BOT_MODULES = ("toyota", "toyota_bot_fixed", "toyota_bot")
+
+
+def snapshot(module):
+    """Module globals; sets / dicts / lists also with their current contents"""
+    return {
+        name: (value, value.copy() if isinstance(value, (set, dict, list)) else None)
+        for name, value in vars(module).items()
+        if not name.startswith("__")
+    }
+
+
+def restore(module, saved):
+    for name, (value, contents) in saved.items():
+        setattr(module, name, value)
+        if isinstance(value, list):
+            value[:] = contents
+        elif contents is not None:
+            value.clear()
+            value.update(contents)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def restore_bot_globals():
+    saved = {module: snapshot(module) for module in map(sys.modules.get, BOT_MODULES) if module}
+    yield
+    for module, globals_ in saved.items():
+        restore(module, globals_)
@@ -0,0 +1,120 @@
+"""
+Persistent detail-page cache
+
+Keeps what we extracted from a listing's detail page (fuel type and the
+other "ads_opt" fields) keyed by listing ID, so a restarted bot does not
+refetch detail pages of listings it already knows.
+
+- JSON file on disk (same approach as toyota_seen.json)
+- TTL per entry (wall clock, so it survives restarts)
+- LRU eviction above ``max_size``
+- hit / miss / eviction counters
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DetailCache:
+    """
+    LRU + TTL cache of detail-page data, optionally persisted to ``path``.
+    Pass ``path=None`` for a purely in-memory cache.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = 3 * 24 * 3600, max_size: int = 5000):
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_fresh(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["stored_at"] < self.ttl
+
+    def __contains__(self, key: str) -> bool:
+        """Membership test without touching counters or LRU order"""
+        entry = self._entries.get(key)
+        return entry is not None and self._is_fresh(entry, time.time())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached value for ``key`` or None if missing / expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if not self._is_fresh(entry, time.time()):
+            del self._entries[key]
+            self._dirty = True
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["value"]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = {"value": value, "stored_at": time.time()}
+        self._entries.move_to_end(key)
+        self._dirty = True
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._dirty = True
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def load(self) -> None:
+        """Load entries from disk, dropping expired ones"""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            # File is written oldest → newest, so LRU order is preserved
+            for key, entry in data.get("entries", {}).items():
+                if self._is_fresh(entry, now):
+                    self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = False
+            logger.info(f"Loaded {len(self._entries)} cached detail pages from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load detail cache: {e}")
+
+    def save(self, force: bool = False) -> None:
+        """Write entries to disk (only if something changed, unless ``force``)"""
+        if not self.path or not (self._dirty or force):
+            return
+        try:
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            logger.debug(f"Saved {len(self._entries)} cached detail pages")
+        except Exception as e:
+            logger.error(f"Failed to save detail cache: {e}")
@@ -0,0 +1,57 @@
+"""
+Offline stand-in for the Telegram Bot API used by the test scripts.
+
+A ``telegram.request.BaseRequest`` answering Bot API calls locally: pass
+it to ``Application.builder().request(...)`` and the bot talks to it
+instead of api.telegram.org. Every call is recorded as (monotonic time,
+method, parameters).
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Toyota Notifier", "username": "toyota_test_bot"}
+
+
+class FakeBotAPI(BaseRequest):
+    def __init__(self):
+        self.calls: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.webhook: Optional[Dict[str, Any]] = None
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def called(self, method: str) -> List[Tuple[float, Dict[str, Any]]]:
+        return [(at, params) for at, name, params in self.calls if name == method]
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        name = url.rsplit("/", 1)[-1]
+        params = {key: json.loads(value) if value[:1] in '[{"' or value.lstrip("-").isdigit() else value
+                  for key, value in (request_data.json_parameters if request_data else {}).items()}
+        self.calls.append((time.monotonic(), name, params))
+        result = self.answer(name, params)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def answer(self, name: str, params: Dict[str, Any]) -> Any:
+        if name == "getMe":
+            return BOT_USER
+        if name == "setWebhook":
+            self.webhook = params
+            return True
+        if name == "deleteWebhook":
+            self.webhook = None
+            return True
+        if name == "sendMessage":
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": params["chat_id"], "type": "private"}, "from": BOT_USER}
+        return True
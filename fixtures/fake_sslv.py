@@ -0,0 +1,89 @@
+"""
+Offline stand-in for ss.lv used by the test scripts.
+
+Serves the recorded HTML pages in this directory through an
+``httpx.MockTransport`` so the scraper can run without network access.
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+FIXTURES_DIR = Path(__file__).parent
+
+TOYOTA_URL = "https://www.ss.lv/lv/transport/cars/toyota/sell/"
+DEFECTS_URL = "https://www.ss.lv/lv/transport/other/transport-with-defects-or-after-crash/sell/"
+
+# Detail page fixture for every listing slug in the list fixtures
+DETAIL_PAGES = {
+    "bxkqpd": "detail_petrol.html",
+    "elmcpx": "detail_diesel.html",
+    "hqbdfe": "detail_hybrid.html",
+    "cgpnkm": "detail_diesel.html",
+    "dffjaa": "detail_diesel.html",
+    "bhphed": "detail_petrol.html",
+    "kjobdx": "detail_petrol.html",
+    "cbpndx": "detail_petrol.html",
+    "aaafwe": "detail_diesel.html",
+    "baqzzz": "detail_diesel.html",
+    "cchilx": "detail_diesel.html",
+    "ddaudi": "detail_petrol.html",
+}
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES_DIR / name).read_bytes()
+
+
+class FakeSSLV:
+    """
+    Records every request it answers as (monotonic time, url, headers)
+    and can add artificial latency to each response.
+    """
+
+    def __init__(self, latency: float = 0.0, pages: Optional[Dict[str, bytes]] = None):
+        self.latency = latency
+        self.pages = {
+            TOYOTA_URL: read_fixture("toyota_list.html"),
+            DEFECTS_URL: read_fixture("defects_list.html"),
+        }
+        if pages:
+            self.pages.update(pages)
+        self.requests: List[Tuple[float, str, httpx.Headers]] = []
+        self.response_headers: Dict[str, Dict[str, str]] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def detail_urls(self) -> List[str]:
+        return [url for _, url, _ in self.requests if "/msg/" in url]
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests.append((time.monotonic(), url, request.headers))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self.respond(request, url)
+        finally:
+            self.in_flight -= 1
+
+    def respond(self, request: httpx.Request, url: str) -> httpx.Response:
+        if url in self.pages:
+            headers = self.response_headers.get(url, {})
+            etag = headers.get("ETag")
+            if etag and request.headers.get("If-None-Match") == etag:
+                return httpx.Response(304, headers=headers)
+            return httpx.Response(200, content=self.pages[url], headers=headers)
+        if "/msg/" in url:
+            slug = url.rsplit("/", 1)[-1].replace(".html", "")
+            if slug in DETAIL_PAGES:
+                return httpx.Response(200, content=read_fixture(DETAIL_PAGES[slug]))
+        return httpx.Response(404, content=b"Not found")
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handler)
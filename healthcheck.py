@@ -0,0 +1,40 @@
+"""
+Container health check (Dockerfile HEALTHCHECK, docker-compose healthcheck)
+
+In webhook mode (WEBHOOK_URL set in the environment or .env) it asks the
+webhook server's GET /health, which only answers while the bot runs.
+Long polling has no endpoint to ask; then only the dependencies are
+checked to import.
+
+Exit status 0: healthy, 1: unhealthy.
+"""
+
+import os
+import sys
+import urllib.request
+
+from dotenv import load_dotenv
+
+from webhook_server import WEBHOOK_PORT
+
+HEALTH_TIMEOUT = 5  # seconds
+
+
+def main() -> int:
+    load_dotenv()
+    if not os.getenv("WEBHOOK_URL"):
+        import requests  # noqa: F401
+        import telegram  # noqa: F401
+        return 0
+
+    url = f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', WEBHOOK_PORT)}/health"
+    try:
+        with urllib.request.urlopen(url, timeout=HEALTH_TIMEOUT) as response:
+            return 0 if response.status == 200 else 1
+    except OSError as e:
+        print(f"Health check failed: {url}: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+In-memory search index over the latest listing snapshot
+
+The monitor keeps the listings of every source page in memory; /search
+answers from an index over them instead of scraping ss.lv again.
+
+- features per listing: model, fuel, defect flag, year, price
+  (from the list row / link; no detail pages are fetched)
+- posting sets for model / fuel / defect, sorted keys for year and price
+  ranges
+- parse_search_query() turns "/search hilux <15000 2010-" arguments
+  into a SearchQuery
+- CursorStore keeps result sets server-side so they can be paged through
+  with inline buttons without searching again
+"""
+
+import re
+import secrets
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from listing_parse import parse_engine, parse_price
+
+YEAR_MIN = 1950
+YEAR_MAX = 2100
+
+# Query words → fuel (checked as prefixes, Latvian and English)
+FUEL_WORDS = {
+    "benz": "petrol", "petrol": "petrol", "gas": "petrol",
+    "dīz": "diesel", "diz": "diesel", "diesel": "diesel",
+    "hibr": "hybrid", "hybrid": "hybrid",
+    "elektr": "electric", "electric": "electric",
+}
+# Same keywords as filter_benzina_toyotas uses on the listing text
+TEXT_FUEL_MARKERS = [
+    ("diesel", ["dīzel", "diesel", "diz.", ".0d ", ".0d,"]),
+    ("hybrid", ["hibrīd", "hybrid"]),
+    ("petrol", ["benzīn", "benz.", "petrol"]),
+]
+DEFECT_WORDS = ("defekt", "avārij", "avarij", "bojāt", "bojat", "crash", "damaged", "defect")
+DEFECT_MARKERS = ("defekt", "avārij", "bojāt", "remontam", "crash")
+CRASH_SECTION = "transport-with-defects-or-after-crash"
+
+PRICE_RE = re.compile(r"^([<>]=?)(\d+)(k?)€?$")
+RANGE_RE = re.compile(r"^(\d*)(k?)-(\d*)(k?)€?$")
+
+
+def listing_model(listing: Dict[str, str]) -> str:
+    """Model name in lower case ('land cruiser'), from the row or the link"""
+    model = listing.get("car_model", "")
+    if not model:
+        match = re.search(r"/(?:toyota|" + CRASH_SECTION + r"/[^/]+)/([^/]+)/[^/]+\.html", listing.get("link", ""))
+        model = match.group(1) if match else ""
+    return model.replace("-", " ").strip().lower()
+
+
+def listing_fuel(listing: Dict[str, str]) -> str:
+    """'petrol' / 'diesel' / 'hybrid' / 'electric', '' if unknown"""
+    engine = parse_engine(listing.get("engine", ""))
+    if engine:
+        return engine[1]
+    text = f"{listing.get('title', '')} {listing.get('description', '')}".lower()
+    for fuel, markers in TEXT_FUEL_MARKERS:
+        if any(marker in text for marker in markers):
+            return fuel
+    return ""
+
+
+def listing_features(listing: Dict[str, str]) -> Dict[str, object]:
+    """Indexed fields of one listing"""
+    text = f"{listing.get('title', '')} {listing.get('description', '')}".lower()
+    year = listing.get("car_year", "")
+    return {
+        "model": listing_model(listing),
+        "fuel": listing_fuel(listing),
+        "defect": CRASH_SECTION in listing.get("link", "") or any(m in text for m in DEFECT_MARKERS),
+        "year": int(year) if year.isdigit() else None,
+        "price": parse_price(listing.get("price", "")),
+    }
+
+
+class SearchQuery:
+    """
+    Parsed /search arguments. Every criterion is optional; an empty query
+    matches the whole snapshot.
+    """
+
+    def __init__(self, model: str = "", fuel: str = "", defect: Optional[bool] = None,
+                 year_min: Optional[int] = None, year_max: Optional[int] = None,
+                 price_min: Optional[int] = None, price_max: Optional[int] = None):
+        self.model = model
+        self.fuel = fuel
+        self.defect = defect
+        self.year_min = year_min
+        self.year_max = year_max
+        self.price_min = price_min
+        self.price_max = price_max
+
+    def is_empty(self) -> bool:
+        return not any(value is not None and value != "" for value in vars(self).values())
+
+    def describe(self) -> str:
+        """Short human readable form, e.g. 'hilux, ≤15000 €, 2010–'"""
+        parts = []
+        if self.model:
+            parts.append(self.model)
+        if self.fuel:
+            parts.append(self.fuel)
+        if self.defect:
+            parts.append("defect")
+        if self.price_min is not None or self.price_max is not None:
+            if self.price_min is None:
+                parts.append(f"≤{self.price_max} €")
+            elif self.price_max is None:
+                parts.append(f"≥{self.price_min} €")
+            else:
+                parts.append(f"{self.price_min}–{self.price_max} €")
+        if self.year_min is not None or self.year_max is not None:
+            if self.year_min == self.year_max:
+                parts.append(str(self.year_min))
+            else:
+                parts.append(f"{self.year_min or ''}–{self.year_max or ''}")
+        return ", ".join(parts)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SearchQuery) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return f"SearchQuery({self.describe()!r})"
+
+
+def _amount(digits: str, thousands: str) -> Optional[int]:
+    if not digits:
+        return None
+    return int(digits) * (1000 if thousands else 1)
+
+
+def _is_year(value: Optional[int]) -> bool:
+    return value is None or YEAR_MIN <= value <= YEAR_MAX
+
+
+def parse_search_query(args: Iterable[str]) -> SearchQuery:
+    """
+    Parse /search arguments (context.args)
+
+    - model words: hilux, land cruiser, rav4 ...
+    - fuel: benzīns / petrol, dīzelis / diesel, hibrīds / hybrid, elektro
+    - defect: defekts, avārija, bojāts, crash
+    - price: <15000, >=5000, 5000-15000, 15k (a bare amount is a maximum)
+    - year: 2010, 2010-, -2015, 2005-2012 (numbers between 1950 and 2100)
+
+    Raises:
+        ValueError: an argument is not understood (message names it)
+    """
+    query = SearchQuery()
+    model_words = []
+
+    for raw in args:
+        token = raw.strip().lower().replace(" ", "")
+        if not token:
+            continue
+
+        match = PRICE_RE.match(token)
+        if match:
+            op, value = match.group(1), _amount(match.group(2), match.group(3))
+            if op.startswith("<"):
+                query.price_max = value - (0 if op.endswith("=") else 1)
+            else:
+                query.price_min = value + (0 if op.endswith("=") else 1)
+            continue
+
+        match = RANGE_RE.match(token)
+        if match and (match.group(1) or match.group(3)):
+            low, high = _amount(match.group(1), match.group(2)), _amount(match.group(3), match.group(4))
+            if not match.group(2) and not match.group(4) and _is_year(low) and _is_year(high):
+                query.year_min, query.year_max = low, high
+            else:
+                query.price_min, query.price_max = low, high
+            continue
+
+        if token.isdigit() and _is_year(int(token)):
+            query.year_min = query.year_max = int(token)
+            continue
+
+        if token.isdigit() or (token.endswith("k") and token[:-1].isdigit()):
+            query.price_max = _amount(token.rstrip("k"), "k" if token.endswith("k") else "")
+            continue
+
+        fuel = next((f for prefix, f in FUEL_WORDS.items() if token.startswith(prefix)), "")
+        if fuel:
+            query.fuel = fuel
+            continue
+
+        if token.startswith(DEFECT_WORDS):
+            query.defect = True
+            continue
+
+        if re.fullmatch(r"[a-zāčēģīķļņšūž0-9\-]+", token):
+            model_words.append(token.replace("-", " "))
+            continue
+
+        raise ValueError(f"Unknown search argument: {raw}")
+
+    query.model = " ".join(model_words)
+    return query
+
+
+class ListingIndex:
+    """
+    Read-only index over one snapshot of listings (built once per snapshot,
+    queried by every /search until the next one).
+    """
+
+    def __init__(self, listings: Iterable[Dict[str, str]]):
+        self.listings: List[Dict[str, str]] = list(listings)
+        self.by_model: Dict[str, Set[int]] = {}
+        self.by_fuel: Dict[str, Set[int]] = {}
+        self.defects: Set[int] = set()
+        self._years: List[Tuple[int, int]] = []
+        self._prices: List[Tuple[int, int]] = []
+
+        for i, listing in enumerate(self.listings):
+            features = listing_features(listing)
+            self.by_model.setdefault(features["model"], set()).add(i)
+            self.by_fuel.setdefault(features["fuel"], set()).add(i)
+            if features["defect"]:
+                self.defects.add(i)
+            if features["year"] is not None:
+                self._years.append((features["year"], i))
+            if features["price"] is not None:
+                self._prices.append((features["price"], i))
+        self._years.sort()
+        self._prices.sort()
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    @staticmethod
+    def _range(keys: List[Tuple[int, int]], low: Optional[int], high: Optional[int]) -> Set[int]:
+        start = bisect_left(keys, (low, -1)) if low is not None else 0
+        end = bisect_right(keys, (high, float("inf"))) if high is not None else len(keys)
+        return {i for _, i in keys[start:end]}
+
+    def models(self) -> List[str]:
+        return sorted(model for model in self.by_model if model)
+
+    def search(self, query: SearchQuery) -> List[Dict[str, str]]:
+        """Listings matching every criterion of ``query``, in snapshot order"""
+        candidates: Optional[Set[int]] = None
+
+        def narrow(ids: Set[int]) -> None:
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates & ids
+
+        if query.model:
+            # "land" matches "land cruiser", "rav" matches "rav4"
+            narrow(set().union(*(ids for model, ids in self.by_model.items() if query.model in model)))
+        if query.fuel:
+            narrow(self.by_fuel.get(query.fuel, set()))
+        if query.defect:
+            narrow(self.defects)
+        if query.year_min is not None or query.year_max is not None:
+            narrow(self._range(self._years, query.year_min, query.year_max))
+        if query.price_min is not None or query.price_max is not None:
+            narrow(self._range(self._prices, query.price_min, query.price_max))
+
+        if candidates is None:
+            return list(self.listings)
+        return [self.listings[i] for i in sorted(candidates)]
+
+
+class CursorStore:
+    """
+    Search results by cursor ID, for paging through them later.
+
+    - TTL counted from the last access (a result set being browsed stays)
+    - LRU eviction above ``max_size``
+    - entries are never recomputed: an expired cursor is simply gone
+    """
+
+    def __init__(self, ttl: float = 15 * 60, max_size: int = 500):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def create(self, results: List[Dict[str, str]], **extra: Any) -> str:
+        """
+        Store ``results`` (plus any ``extra`` fields, e.g. a header line)
+        and return the new cursor ID (8 hex chars, fits callback_data)
+        """
+        cursor_id = secrets.token_hex(4)
+        while cursor_id in self._entries:
+            cursor_id = secrets.token_hex(4)
+        entry = dict(extra)
+        entry["results"] = list(results)
+        entry["accessed_at"] = time.monotonic()
+        self._entries[cursor_id] = entry
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return cursor_id
+
+    def get(self, cursor_id: str) -> Optional[Dict[str, Any]]:
+        """Entry for ``cursor_id`` or None if unknown / expired"""
+        entry = self._entries.get(cursor_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry["accessed_at"] > self.ttl:
+            del self._entries[cursor_id]
+            self.expired += 1
+            return None
+        entry["accessed_at"] = now
+        self._entries.move_to_end(cursor_id)
+        return entry
+
+    @staticmethod
+    def page_starts(
+        entry: Dict[str, Any],
+        page_size: int,
+        size: Optional[Callable[[Dict[str, str]], int]] = None,
+        budget: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Offsets of the first result of every page: up to ``page_size``
+        results, and with ``size`` / ``budget`` only as many as fit in
+        ``budget`` (a result larger than that still gets a page of its
+        own). Computed once per entry.
+        """
+        key = (page_size, budget)
+        cached = entry.get("page_starts")
+        if cached and cached[0] == key:
+            return cached[1]
+        limited = size is not None and budget is not None
+        starts, count, used = [0], 0, 0
+        for i, result in enumerate(entry["results"]):
+            cost = size(result) if limited else 0
+            if count and (count == page_size or (limited and used + cost > budget)):
+                starts.append(i)
+                count = used = 0
+            count += 1
+            used += cost
+        entry["page_starts"] = (key, starts)
+        return starts
+
+    def page(
+        self,
+        cursor_id: str,
+        page: int,
+        page_size: int,
+        size: Optional[Callable[[Dict[str, str]], int]] = None,
+        budget: Optional[int] = None,
+    ) -> Optional[Tuple[List[Dict[str, str]], int, int]]:
+        """
+        One page of a stored result set (see page_starts for ``size`` and
+        ``budget``)
+
+        Returns:
+            (listings on the page, page number clamped to the valid range,
+            number of pages), or None if the cursor expired
+        """
+        entry = self.get(cursor_id)
+        if entry is None:
+            return None
+        starts = self.page_starts(entry, page_size, size, budget)
+        page = min(max(page, 0), len(starts) - 1)
+        end = starts[page + 1] if page + 1 < len(starts) else len(entry["results"])
+        return entry["results"][starts[page]:end], page, len(starts)
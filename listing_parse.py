@@ -0,0 +1,35 @@
+"""
+Parsers of ss.lv list page columns
+
+Shared by the monitor (fuel from the row, price of a listing) and the
+/search index (listing_index), so neither imports the other.
+"""
+
+import re
+from typing import Optional, Tuple
+
+# Engine column of the list page: "1.6" (petrol), "2.0D" (diesel), "1.8H"
+# (hybrid); electric cars have no volume, just "E"
+ENGINE_RE = re.compile(r"^(\d{1,2}[.,]\d)\s*([A-Za-z]?)$")
+ENGINE_SUFFIX_FUEL = {"": "petrol", "D": "diesel", "H": "hybrid"}
+ELECTRIC_ENGINE = "E"
+
+
+def parse_price(text: str) -> Optional[int]:
+    """'14 500  €' → 14500, None if there is no number (e.g. 'maiņai')"""
+    digits = re.sub(r"[^\d]", "", text.split(",")[0].split(".")[0])
+    return int(digits) if digits else None
+
+
+def parse_engine(value: str) -> Optional[Tuple[str, str]]:
+    """
+    Engine column value → (volume, fuel): '2,0D' → ('2.0', 'diesel'),
+    'E' → ('', 'electric'); None for anything else ('-', '1.3X', a year)
+    """
+    value = value.strip()
+    if value.upper() == ELECTRIC_ENGINE:
+        return "", "electric"
+    match = ENGINE_RE.match(value)
+    if not match or match.group(2).upper() not in ENGINE_SUFFIX_FUEL:
+        return None
+    return match.group(1).replace(",", "."), ENGINE_SUFFIX_FUEL[match.group(2).upper()]
@@ -0,0 +1,444 @@
+"""
+Durable notification outbox (SQLite)
+
+Every notification is a delivery of one listing to one chat, stored as a
+row keyed by (listing_id, chat_id) before the listing is marked as seen:
+
+- a crash or restart between "seen" and "sent" no longer loses messages;
+  pending rows are picked up again by the next drain
+- the same listing is never queued twice for a chat (the key is unique),
+  so a listing found again after a restart is not sent again
+- every row knows its chat, so a Forbidden answer marks exactly that chat
+  as dead and drops its other pending rows instead of sending them
+
+Rows are drained through the NotificationDispatcher (per-chat workers
+within Telegram's limits). A row is marked sent as soon as its message
+went out; only a crash in the moment between the send and that commit can
+repeat a single message.
+
+Digest mode: a message queued with a ``digest`` entry (a short line and
+a link) is held back until release_held() (end of a monitor cycle) or
+``hold`` seconds; then all due digest rows of one chat are sent as one
+combined message and settled together. Rows without a digest entry
+(priority listings) are always sent on their own.
+
+Priority: rows of a higher-priority message are claimed first and
+submitted with that priority, so the dispatcher sends them ahead of a
+backlog of ordinary notifications.
+
+The same file remembers the chats a BotPool may only reach through its
+primary bot (primary_only_chats), so a restart doesn't try the
+secondary bots for them again.
+
+Statuses: pending -> sent | failed (gave up after max_attempts) |
+dead (chat blocked the bot) | cancelled (user unsubscribed).
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Union
+
+import telegram.error
+
+from telegram_dispatcher import DispatcherClosed
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5  # sends (each with the dispatcher's own quick retries) before a row fails
+RETRY_BASE = 30.0  # seconds before the first resend, doubled per attempt
+RETRY_MAX = 3600.0
+KEEP_FINISHED = 7 * 24 * 3600  # seconds sent/failed rows are kept (they dedupe re-found listings)
+DIGEST_MAX_ITEMS = 20  # listings per combined message (one button each)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    listing_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    digest TEXT,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    listing_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    error TEXT,
+    PRIMARY KEY (listing_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS dead_chats (
+    chat_id INTEGER PRIMARY KEY,
+    reason TEXT,
+    died_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS primary_only_chats (
+    chat_id INTEGER PRIMARY KEY,
+    since REAL NOT NULL
+);
+"""
+
+
+class Delivery(NamedTuple):
+    listing_id: str
+    chat_id: int
+    attempts: int
+    payload: Dict[str, Any]
+    digest: Optional[Dict[str, Any]] = None
+    priority: int = 0
+
+
+def message_payload(text: str, reply_markup=None, **kwargs: Any) -> Dict[str, Any]:
+    """
+    send_message arguments as JSON-serialisable data for the outbox
+    (the inline keyboard is stored as its Bot API dict)
+    """
+    payload = dict(kwargs, text=text)
+    if reply_markup is not None:
+        payload["reply_markup"] = reply_markup.to_dict()
+    return payload
+
+
+def send_kwargs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of message_payload: keyword arguments for bot.send_message"""
+    from telegram import InlineKeyboardMarkup
+
+    kwargs = dict(payload)
+    if kwargs.get("reply_markup") is not None:
+        kwargs["reply_markup"] = InlineKeyboardMarkup.de_json(kwargs["reply_markup"], None)
+    return kwargs
+
+
+class Outbox:
+    """
+    Delivery ledger in a SQLite file (``":memory:"`` for tests).
+
+    All methods are synchronous and commit immediately; they are small
+    indexed queries, cheap enough to run on the event loop. ``inflight``
+    (in memory) holds the rows handed to the dispatcher, so overlapping
+    drains never send a row twice.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = ":memory:",
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_base: float = RETRY_BASE,
+        retry_max: float = RETRY_MAX,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.inflight = set()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # Outbox files of older versions
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(messages)")]
+        with self._db:
+            if "digest" not in columns:
+                self._db.execute("ALTER TABLE messages ADD COLUMN digest TEXT")
+            if "priority" not in columns:
+                self._db.execute("ALTER TABLE messages ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql: str, params: Iterable = ()) -> int:
+        with self._lock, self._db:
+            return self._db.execute(sql, params).rowcount
+
+    def enqueue(
+        self,
+        listing_id: str,
+        chat_ids: Iterable[int],
+        payload: Dict[str, Any],
+        digest: Optional[Dict[str, Any]] = None,
+        hold: float = 0.0,
+        priority: int = 0,
+    ) -> int:
+        """
+        Queue ``payload`` for every chat in ``chat_ids`` (dead chats and
+        chats that already have this listing are skipped)
+
+        ``digest`` (JSON-serialisable, passed to the combine function of
+        drain_outbox) lets the message be merged with others of the same
+        chat; such rows wait for release_held() or at most ``hold`` seconds.
+        Rows of a higher ``priority`` are claimed and sent first.
+
+        Returns:
+            Number of new deliveries
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO messages (listing_id, payload, created_at, digest, priority) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (listing_id, json.dumps(payload, ensure_ascii=False), now,
+                 None if digest is None else json.dumps(digest, ensure_ascii=False), priority),
+            )
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO deliveries (listing_id, chat_id, next_attempt_at, updated_at) "
+                "SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM dead_chats WHERE chat_id = ?)",
+                [(listing_id, chat_id, now + hold, now, chat_id) for chat_id in chat_ids],
+            )
+            return cursor.rowcount
+
+    def release_held(self) -> int:
+        """Make the held digest rows due now (end of a cycle)"""
+        now = time.time()
+        return self._write(
+            "UPDATE deliveries SET next_attempt_at = ? WHERE status = 'pending' AND attempts = 0 "
+            "AND next_attempt_at > ? AND listing_id IN (SELECT listing_id FROM messages WHERE digest IS NOT NULL)",
+            (now, now),
+        )
+
+    def claim_due(self, limit: int = 1000, now: Optional[float] = None, min_priority: int = 0) -> List[Delivery]:
+        """
+        Pending rows whose next attempt is due, highest priority and oldest
+        first, marked in flight (``min_priority``: only rows of at least it)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT d.listing_id, d.chat_id, d.attempts, m.payload, m.digest, m.priority FROM deliveries d "
+                "JOIN messages m USING (listing_id) "
+                "WHERE d.status = 'pending' AND d.next_attempt_at <= ? AND m.priority >= ? "
+                "ORDER BY m.priority DESC, d.next_attempt_at, m.created_at LIMIT ?",
+                (now, min_priority, limit + len(self.inflight)),
+            ).fetchall()
+        due = []
+        for listing_id, chat_id, attempts, payload, digest, priority in rows:
+            key = (listing_id, chat_id)
+            if key in self.inflight or len(due) >= limit:
+                continue
+            self.inflight.add(key)
+            due.append(Delivery(listing_id, chat_id, attempts, json.loads(payload),
+                                digest and json.loads(digest), priority))
+        return due
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Seconds until the next pending row not in flight is due (None:
+        nothing pending). Rows in flight were due when claimed, so due rows
+        beyond len(inflight) are waiting; otherwise the earliest future
+        attempt counts. Both are indexed queries.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            (due,) = self._db.execute(
+                "SELECT COUNT(*) FROM deliveries WHERE status = 'pending' AND next_attempt_at <= ?", (now,)
+            ).fetchone()
+            (next_at,) = self._db.execute(
+                "SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'pending' AND next_attempt_at > ?", (now,)
+            ).fetchone()
+        if due > len(self.inflight):
+            return 0.0
+        return None if next_at is None else next_at - now
+
+    def mark_sent(self, listing_id: str, chat_id: int) -> None:
+        self.inflight.discard((listing_id, chat_id))
+        self._write(
+            "UPDATE deliveries SET status = 'sent', attempts = attempts + 1, error = NULL, updated_at = ? "
+            "WHERE listing_id = ? AND chat_id = ?",
+            (time.time(), listing_id, chat_id),
+        )
+
+    def mark_retry(self, listing_id: str, chat_id: int, error: str, delay: Optional[float] = None) -> bool:
+        """
+        Schedule another attempt (exponential backoff unless ``delay`` is
+        given), or fail the row after max_attempts
+
+        Returns:
+            False if the row has failed for good
+        """
+        self.inflight.discard((listing_id, chat_id))
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT attempts FROM deliveries WHERE listing_id = ? AND chat_id = ? AND status = 'pending'",
+                (listing_id, chat_id),
+            ).fetchone()
+            if row is None:
+                return False
+            attempts = row[0] + 1
+            if attempts >= self.max_attempts:
+                self._db.execute(
+                    "UPDATE deliveries SET status = 'failed', attempts = ?, error = ?, updated_at = ? "
+                    "WHERE listing_id = ? AND chat_id = ?",
+                    (attempts, error, now, listing_id, chat_id),
+                )
+                return False
+            if delay is None:
+                delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+            self._db.execute(
+                "UPDATE deliveries SET attempts = ?, error = ?, next_attempt_at = ?, updated_at = ? "
+                "WHERE listing_id = ? AND chat_id = ?",
+                (attempts, error, now + delay, now, listing_id, chat_id),
+            )
+            return True
+
+    def mark_failed(self, listing_id: str, chat_id: int, error: str) -> None:
+        """Give up on one row (an error resending cannot fix)"""
+        self.inflight.discard((listing_id, chat_id))
+        self._write(
+            "UPDATE deliveries SET status = 'failed', attempts = attempts + 1, error = ?, updated_at = ? "
+            "WHERE listing_id = ? AND chat_id = ? AND status = 'pending'",
+            (error, time.time(), listing_id, chat_id),
+        )
+
+    def mark_dead(self, chat_id: int, reason: str = "") -> int:
+        """
+        Remember that ``chat_id`` blocked the bot and drop all its pending
+        rows; later enqueues skip the chat until revive()
+
+        Returns:
+            Number of pending rows dropped
+        """
+        now = time.time()
+        self.inflight = {key for key in self.inflight if key[1] != chat_id}
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO dead_chats (chat_id, reason, died_at) VALUES (?, ?, ?)",
+                (chat_id, reason, now),
+            )
+            return self._db.execute(
+                "UPDATE deliveries SET status = 'dead', error = ?, updated_at = ? "
+                "WHERE chat_id = ? AND status = 'pending'",
+                (reason, now, chat_id),
+            ).rowcount
+
+    def is_dead(self, chat_id: int) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM dead_chats WHERE chat_id = ?", (chat_id,)).fetchone() is not None
+
+    def revive(self, chat_id: int) -> bool:
+        """Chat is reachable again (the user talked to the bot)"""
+        return self._write("DELETE FROM dead_chats WHERE chat_id = ?", (chat_id,)) > 0
+
+    def mark_primary_only(self, chat_id: int) -> None:
+        """Chat can only be reached by the primary bot (BotPool on_primary_only)"""
+        self._write("INSERT OR IGNORE INTO primary_only_chats (chat_id, since) VALUES (?, ?)", (chat_id, time.time()))
+
+    def primary_only_chats(self) -> Set[int]:
+        with self._lock:
+            return {chat_id for (chat_id,) in self._db.execute("SELECT chat_id FROM primary_only_chats")}
+
+    def cancel_chat(self, chat_id: int) -> int:
+        """Drop the pending rows of a user who unsubscribed"""
+        return self._write(
+            "UPDATE deliveries SET status = 'cancelled', updated_at = ? WHERE chat_id = ? AND status = 'pending'",
+            (time.time(), chat_id),
+        )
+
+    def purge(self, older_than: float = KEEP_FINISHED) -> int:
+        """Delete finished rows not updated for ``older_than`` seconds"""
+        cutoff = time.time() - older_than
+        with self._lock, self._db:
+            deleted = self._db.execute(
+                "DELETE FROM deliveries WHERE status != 'pending' AND updated_at < ?", (cutoff,)
+            ).rowcount
+            self._db.execute(
+                "DELETE FROM messages WHERE NOT EXISTS "
+                "(SELECT 1 FROM deliveries d WHERE d.listing_id = messages.listing_id)"
+            )
+        return deleted
+
+    def counts(self) -> Dict[str, int]:
+        """Number of rows per status, plus dead chats"""
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status"))
+            (counts["dead_chats"],) = self._db.execute("SELECT COUNT(*) FROM dead_chats").fetchone()
+        return counts
+
+    def settle(self, delivery: Delivery, future: asyncio.Future) -> str:
+        """
+        Record the outcome of a dispatcher future for ``delivery``
+
+        Returns:
+            'sent', 'retry', 'failed' or 'dead'
+        """
+        if future.cancelled() or isinstance(future.exception(), DispatcherClosed):
+            self.mark_retry(delivery.listing_id, delivery.chat_id, "cancelled", delay=0)
+            return "retry"
+        error = future.exception()
+        if error is None:
+            self.mark_sent(delivery.listing_id, delivery.chat_id)
+            return "sent"
+        if isinstance(error, telegram.error.Forbidden):
+            dropped = self.mark_dead(delivery.chat_id, str(error))
+            if dropped:
+                logger.info(f"Chat {delivery.chat_id} is dead, dropped {dropped} pending deliveries")
+            return "dead"
+        if isinstance(error, telegram.error.BadRequest):
+            self.mark_failed(delivery.listing_id, delivery.chat_id, str(error))
+            return "failed"
+        delay = float(error.retry_after) if isinstance(error, telegram.error.RetryAfter) else None
+        if self.mark_retry(delivery.listing_id, delivery.chat_id, str(error) or type(error).__name__, delay):
+            return "retry"
+        logger.error(f"Giving up on {delivery.listing_id} for chat {delivery.chat_id}: {error}")
+        return "failed"
+
+
+async def drain_outbox(
+    outbox: Outbox,
+    dispatcher,
+    limit: int = 1000,
+    combine: Optional[Callable[[List[Delivery]], Dict[str, Any]]] = None,
+    digest_max: int = DIGEST_MAX_ITEMS,
+    min_priority: int = 0,
+) -> Dict[str, int]:
+    """
+    Send all due rows through ``dispatcher`` and wait for them
+
+    Every row is settled in the outbox as soon as its own send finished.
+    With ``combine`` (deliveries -> send_message kwargs), two or more due
+    digest rows of one chat go out as combined messages of up to
+    ``digest_max`` listings; the rows of a combined message share its
+    outcome. ``min_priority`` limits the pass to rows of at least that
+    priority.
+
+    Returns:
+        Outcome counts of this pass (per row) and the number of messages
+    """
+    outcomes = {"sent": 0, "retry": 0, "failed": 0, "dead": 0, "messages": 0}
+    singles: List[Delivery] = []
+    digests: Dict[int, List[Delivery]] = {}
+    for delivery in outbox.claim_due(limit, min_priority=min_priority):
+        if combine is not None and delivery.digest is not None:
+            digests.setdefault(delivery.chat_id, []).append(delivery)
+        else:
+            singles.append(delivery)
+
+    groups = [[delivery] for delivery in singles]
+    for chat_deliveries in digests.values():
+        groups += [chat_deliveries[i:i + digest_max] for i in range(0, len(chat_deliveries), digest_max)]
+
+    futures = []
+    for group in groups:
+        kwargs = combine(group) if len(group) > 1 else group[0].payload
+        priority = max(delivery.priority for delivery in group)
+        future = dispatcher.submit(group[0].chat_id, priority, **send_kwargs(kwargs))
+        future.add_done_callback(partial(_count_outcome, outbox, group, outcomes))
+        futures.append(future)
+    outcomes["messages"] = len(futures)
+    if futures:
+        await asyncio.gather(*futures, return_exceptions=True)
+    return outcomes
+
+
+def _count_outcome(outbox: Outbox, group: List[Delivery], outcomes: Dict[str, int], future: asyncio.Future) -> None:
+    for delivery in group:
+        outcomes[outbox.settle(delivery, future)] += 1
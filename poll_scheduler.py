@@ -0,0 +1,168 @@
+"""
+Adaptive per-source polling scheduler
+
+Instead of polling every source on one fixed interval, each source gets
+its own interval derived from how often new listings actually show up
+there:
+
+- the arrival rate of every source is estimated from the times new
+  listing IDs were detected (sliding window plus a small prior, so a
+  quiet night relaxes polling within a few hours)
+- intervals are allocated to minimise the mean detection latency of all
+  arrivals: with Poisson arrivals a listing waits interval/2 on average,
+  and the optimum under a request budget is interval ∝ 1/sqrt(rate)
+- the result is scaled so the mean detection latency meets
+  ``target_latency`` while the total request rate stays within
+  ``request_budget`` — and within ``max_polls_per_arrival`` polls per
+  expected new listing, so quiet hours are polled rarely
+- after a hit a source is polled ``boost_factor`` times faster for
+  ``boost_duration`` seconds (new posts tend to come in clusters); these
+  short boosts may briefly go above the budget
+"""
+
+import math
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class PollScheduler:
+    """
+    Decides when each source should be polled next.
+
+    Usage:
+        scheduler = PollScheduler(urls, target_latency=15, request_budget=300 / 3600)
+        while True:
+            for url in scheduler.due():
+                new = poll(url)
+                scheduler.record_poll(url, new)
+            await asyncio.sleep(scheduler.seconds_until_next())
+    """
+
+    def __init__(
+        self,
+        sources: Iterable[str],
+        target_latency: float = 15.0,
+        request_budget: float = 300 / 3600,
+        min_interval: float = 10.0,
+        max_interval: float = 300.0,
+        max_polls_per_arrival: float = 30.0,
+        boost_factor: float = 2.0,
+        boost_duration: float = 120.0,
+        window: float = 3 * 3600,
+        prior_rate: float = 1 / 3600,
+        prior_weight: float = 1800.0,
+        jitter: float = 0.1,
+    ):
+        self.sources = list(sources)
+        self.target_latency = target_latency
+        self.request_budget = request_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_polls_per_arrival = max_polls_per_arrival
+        self.boost_factor = boost_factor
+        self.boost_duration = boost_duration
+        self.window = window
+        self.prior_rate = prior_rate
+        self.prior_weight = prior_weight
+        self.jitter = jitter
+
+        self._arrivals: Dict[str, List[float]] = {url: [] for url in self.sources}
+        self._next_poll: Dict[str, float] = {url: 0.0 for url in self.sources}
+        self._boost_until: Dict[str, float] = {url: 0.0 for url in self.sources}
+        self.polls = 0
+
+    # ------------------------------------------------------------------
+    # Arrival history
+    # ------------------------------------------------------------------
+    def arrivals(self, url: str) -> List[float]:
+        """Detection timestamps inside the estimation window (for persisting)"""
+        return list(self._arrivals[url])
+
+    def load_arrivals(self, url: str, timestamps: Iterable[float], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._arrivals[url] = sorted(t for t in timestamps if now - t < self.window)
+
+    def rate(self, url: str, now: Optional[float] = None) -> float:
+        """Estimated new listings per second for ``url``"""
+        now = time.time() if now is None else now
+        arrivals = self._arrivals[url]
+        while arrivals and now - arrivals[0] >= self.window:
+            arrivals.pop(0)
+        # The prior counts as ``prior_weight`` seconds of history at ``prior_rate``
+        return (len(arrivals) + self.prior_rate * self.prior_weight) / (self.window + self.prior_weight)
+
+    # ------------------------------------------------------------------
+    # Interval allocation
+    # ------------------------------------------------------------------
+    def base_intervals(self, now: Optional[float] = None) -> Dict[str, float]:
+        """
+        Interval per source (seconds) ignoring boosts.
+
+        interval_i = c / sqrt(rate_i); the smallest c that meets the target
+        mean latency is 2 * L * sum(rate) / sum(sqrt(rate)), the smallest c
+        that stays within the budget is sum(sqrt(rate)) / budget — the
+        larger of the two wins, so the budget is never exceeded. The budget
+        itself shrinks to max_polls_per_arrival * sum(rate) when little is
+        being posted.
+        """
+        rates = {url: self.rate(url, now) for url in self.sources}
+        total_rate = sum(rates.values())
+        sqrt_sum = sum(math.sqrt(r) for r in rates.values())
+        budget = min(self.request_budget, self.max_polls_per_arrival * total_rate)
+
+        c_latency = 2 * self.target_latency * total_rate / sqrt_sum
+        c_budget = sqrt_sum / budget
+        c = max(c_latency, c_budget)
+
+        return {
+            url: min(self.max_interval, max(self.min_interval, c / math.sqrt(r)))
+            for url, r in rates.items()
+        }
+
+    def interval(self, url: str, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        base = self.base_intervals(now)[url]
+        if now < self._boost_until[url]:
+            return max(self.min_interval, base / self.boost_factor)
+        return base
+
+    # ------------------------------------------------------------------
+    # Polling loop API
+    # ------------------------------------------------------------------
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Sources whose next poll time has come"""
+        now = time.time() if now is None else now
+        return [url for url in self.sources if self._next_poll[url] <= now]
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        return max(0.0, min(self._next_poll.values()) - now)
+
+    def record_poll(self, url: str, new_listings: int = 0, now: Optional[float] = None) -> float:
+        """
+        Register a finished poll of ``url`` that found ``new_listings`` new
+        IDs and schedule the next one. Returns the chosen interval.
+        """
+        now = time.time() if now is None else now
+        self.polls += 1
+        if new_listings:
+            self._arrivals[url].extend([now] * new_listings)
+            self._boost_until[url] = now + self.boost_duration
+
+        interval = self.interval(url, now)
+        if self.jitter:
+            interval *= 1 + random.uniform(0, self.jitter)
+        self._next_poll[url] = now + interval
+        return interval
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+        now = time.time() if now is None else now
+        return {
+            url: {
+                "rate_per_hour": self.rate(url, now) * 3600,
+                "interval": self.interval(url, now),
+                "next_in": max(0.0, self._next_poll[url] - now),
+            }
+            for url in self.sources
+        }
@@ -0,0 +1,74 @@
+"""
+Async token-bucket rate limiter
+
+Used to cap how many requests per second we send to a single host
+(ss.lv) regardless of how many coroutines are fetching concurrently.
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens are added per second up to
+    ``capacity``. ``acquire()`` waits until a token is available.
+
+    Waiters are served in FIFO order so a burst of coroutines cannot
+    starve each other.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        """Seconds until ``tokens`` can be taken (0 if available now)"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take ``tokens`` without waiting. Returns False if not available."""
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        if self._wait_time(tokens, now) > 0:
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until ``tokens`` are available and take them"""
+        async with self._lock:
+            while True:
+                delay = self._wait_time(tokens, time.monotonic())
+                if delay <= 0:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for ``seconds`` (e.g. after a 429).
+        The bucket is also drained so traffic restarts gently.
+        """
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = max(self._updated, self._paused_until)
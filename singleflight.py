@@ -0,0 +1,101 @@
+"""
+Single-flight coalescing of expensive async calls
+
+Used by the bots so that many users pressing /search at the same time
+(and the scheduled check) do not each start their own ss.lv scrape:
+
+- a caller that arrives while a call for the same key is running waits
+  for that call instead of starting another one
+- a caller that arrives shortly after a call finished gets its result
+  (the snapshot) if it is not older than ``max_age`` seconds
+- failures (an exception or a None result) are shared with the callers
+  that were waiting, but never kept as a snapshot
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    At most one running call per key, plus the latest successful result.
+
+    ``max_age`` is the default freshness window for snapshots; pass
+    ``max_age=0`` to ``run()`` to never reuse a finished result but still
+    join a call that is already running.
+    """
+
+    def __init__(self, max_age: float = 0.0):
+        self.max_age = max_age
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._snapshots: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.started = 0
+        self.joined = 0
+        self.snapshot_hits = 0
+
+    def snapshot_age(self, key: Hashable) -> Optional[float]:
+        """Seconds since the snapshot for ``key`` was stored, None if there is none"""
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            return None
+        return time.monotonic() - snapshot[0]
+
+    def forget(self, key: Hashable) -> None:
+        """Drop the snapshot for ``key`` (a running call is not affected)"""
+        self._snapshots.pop(key, None)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._running.get(key) is task:
+            del self._running[key]
+        if task.cancelled():
+            return
+        if task.exception() is None and task.result() is not None:
+            self._snapshots[key] = (time.monotonic(), task.result())
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]], max_age: Optional[float] = None) -> Any:
+        """
+        Result of ``factory()`` for ``key``, shared with concurrent callers
+
+        Args:
+            key: What is being computed (e.g. a source URL)
+            factory: Starts the actual call; only invoked if there is
+                neither a running call nor a fresh enough snapshot
+            max_age: Freshness window for this caller (default self.max_age)
+
+        Returns:
+            The (possibly shared) result. A caller being cancelled does not
+            cancel the call the other callers are waiting for.
+        """
+        self.calls += 1
+        max_age = self.max_age if max_age is None else max_age
+
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and time.monotonic() - snapshot[0] <= max_age:
+            self.snapshot_hits += 1
+            return snapshot[1]
+
+        task = self._running.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(factory())
+            self._running[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.joined += 1
+            logger.debug(f"Joining running call for {key}")
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters: calls, started (real calls), joined, snapshot_hits"""
+        return {
+            "calls": self.calls,
+            "started": self.started,
+            "joined": self.joined,
+            "snapshot_hits": self.snapshot_hits,
+        }
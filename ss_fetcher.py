@@ -0,0 +1,248 @@
+"""
+Concurrent async fetch engine for ss.lv
+
+All HTTP traffic of a scrape cycle goes through one ``AsyncFetcher``:
+- a shared ``httpx.AsyncClient`` (keep-alive connection pool)
+- a global concurrency cap (semaphore)
+- a token-bucket rate limit per host, so running list and detail pages
+  concurrently never sends more requests per second than the old serial
+  loop with its sleeps did
+- conditional GET + body fingerprint per list page (``PageCache``), so
+  unchanged pages are neither parsed nor filtered again
+- incremental reading of list pages (``stream()`` + ``iter_rows()``), so a
+  caller can stop downloading as soon as it has the rows it needs
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import random
+import re
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0",
+]
+
+# Seconds to stop talking to a host after it answers 429
+RATE_LIMIT_COOLDOWN = 30.0
+
+# One listing row of an ss.lv list page (banner rows "tr_bnr_*" are skipped)
+ROW_RE = re.compile(rb'<tr id="tr_(\d+)"[^>]*>.*?</tr>', re.S)
+
+
+async def iter_rows(response: httpx.Response, chunk_size: Optional[int] = None) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Yield ``(listing_id, row_html)`` for each listing row of a streamed
+    list page as soon as its closing ``</tr>`` has been downloaded.
+    Breaking out of the loop stops reading the body.
+
+    By default chunks are processed as they arrive from the network;
+    a ``chunk_size`` would buffer that many bytes before looking at them.
+    """
+    buf = b""
+    async for chunk in response.aiter_bytes(chunk_size):
+        buf += chunk
+        pos = 0
+        while True:
+            match = ROW_RE.search(buf, pos)
+            if not match:
+                break
+            yield match.group(1).decode(), match.group(0)
+            pos = match.end()
+        # Keep only a possibly incomplete row at the end of the buffer
+        keep_from = buf.rfind(b"<tr", pos)
+        buf = buf[keep_from:] if keep_from != -1 else buf[max(pos, len(buf) - 16):]
+
+
+class PageCache:
+    """
+    Remembers ETag / Last-Modified and a fingerprint of the listing rows
+    for every source URL.
+
+    Works with any HTTP client: send ``conditional_headers(url)`` with the
+    request, then ``update()`` tells whether the page changed since the
+    previous poll (304, or 200 with the same fingerprint, means unchanged).
+    """
+
+    ROWS_START = b'id="tr_'
+    ROWS_END = b"</tr>"
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    def fingerprint(cls, body: bytes) -> str:
+        """
+        Hash of the listing rows region only. Banners, counters and the
+        footer around the table change on every request and would make
+        every page look modified.
+        """
+        start = body.find(cls.ROWS_START)
+        end = body.rfind(cls.ROWS_END)
+        if start != -1 and end > start:
+            body = body[start:end]
+        return hashlib.sha1(body).hexdigest()
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        entry = self._entries.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url: str, status_code: int, headers, body: bytes = b"", fingerprint: Optional[str] = None) -> bool:
+        """
+        Record a response for ``url``. Returns True if the page changed.
+        ``fingerprint`` replaces hashing ``body`` when the caller only read
+        part of the page.
+        """
+        entry = self._entries.get(url)
+        if status_code == 304:
+            return entry is None
+
+        new_entry = {
+            "etag": headers.get("ETag", ""),
+            "last_modified": headers.get("Last-Modified", ""),
+            "hash": fingerprint or self.fingerprint(body),
+        }
+        self._entries[url] = new_entry
+        return entry is None or entry["hash"] != new_entry["hash"]
+
+    def invalidate(self, url: str) -> None:
+        """Forget ``url`` so the next poll parses it again"""
+        self._entries.pop(url, None)
+
+
+class AsyncFetcher:
+    """
+    Async HTTP client with a concurrency cap and per-host rate limiting.
+
+    Usage:
+        async with AsyncFetcher(concurrency=4, rate_per_host=1.5) as fetcher:
+            resp = await fetcher.get(url)
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        rate_per_host: float = 1.5,
+        burst: int = 3,
+        timeout: float = 25,
+        user_agents: Optional[Sequence[str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.user_agents = list(user_agents or DEFAULT_USER_AGENTS)
+        self.headers = dict(headers or {})
+        self.transport = transport
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests_sent = 0
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def open(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers=self.headers,
+                transport=self.transport,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        """Token bucket of the host serving ``url``"""
+        host = urlsplit(url).netloc.lower()
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_host, self.burst)
+            self._buckets[host] = bucket
+        return bucket
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        GET ``url`` once the host's rate limit and the concurrency cap allow it.
+
+        Raises httpx.HTTPStatusError for 4xx/5xx responses (other than 304).
+        """
+        self.open()
+        request_headers = {"User-Agent": random.choice(self.user_agents)}
+        if headers:
+            request_headers.update(headers)
+
+        bucket = self.bucket_for(url)
+        async with self._semaphore:
+            await bucket.acquire()
+            self.requests_sent += 1
+            resp = await self._client.get(url, headers=request_headers)
+
+        if resp.status_code == 429:
+            logger.warning(f"Rate limited (429) by {url}, pausing host for {RATE_LIMIT_COOLDOWN:.0f}s")
+            bucket.pause(RATE_LIMIT_COOLDOWN)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+        return resp
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url: str, headers: Optional[Dict[str, str]] = None) -> AsyncIterator[httpx.Response]:
+        """
+        Like ``get()`` but the body is not read up front: iterate it with
+        ``iter_rows()`` / ``aiter_bytes()`` and leave the block to stop the
+        download early.
+        """
+        self.open()
+        request_headers = {"User-Agent": random.choice(self.user_agents)}
+        if headers:
+            request_headers.update(headers)
+
+        bucket = self.bucket_for(url)
+        async with self._semaphore:
+            await bucket.acquire()
+            self.requests_sent += 1
+            async with self._client.stream("GET", url, headers=request_headers) as resp:
+                if resp.status_code == 429:
+                    logger.warning(f"Rate limited (429) by {url}, pausing host for {RATE_LIMIT_COOLDOWN:.0f}s")
+                    bucket.pause(RATE_LIMIT_COOLDOWN)
+                if resp.status_code != 304:
+                    resp.raise_for_status()
+                yield resp
+
+    async def get_if_changed(self, url: str, page_cache: PageCache) -> Optional[httpx.Response]:
+        """
+        Conditional GET of ``url``. Returns None if the page has not changed
+        since the previous call (304 or identical listing rows).
+        """
+        resp = await self.get(url, headers=page_cache.conditional_headers(url))
+        if not page_cache.update(url, resp.status_code, resp.headers, resp.content):
+            return None
+        return resp
@@ -0,0 +1,230 @@
+"""
+Saved per-user filters, matched through an inverted index
+
+A user saves up to MAX_FILTERS_PER_USER filters in /search syntax,
+separated by commas ("/filter hilux <15000 2010-, land cruiser dīzelis");
+a listing is sent to the user if it matches any of them.
+
+New listings are matched against all filters at once through an index
+instead of checking every user:
+
+- buckets keyed by (model, fuel, defects only), "" meaning any; a listing
+  only visits the buckets its own model / fuel / defect flag can match
+  (at most models-containing-it x 2 x 2)
+- inside a bucket, a filter with a price range is listed under every
+  PRICE_BAND wide band its range covers, so a listing only looks at the
+  filters of its own price band; open-ended ranges ("no maximum") are
+  sorted by minimum price instead
+- the few remaining candidates get the exact check (query_matches)
+"""
+
+from bisect import bisect_right, insort
+from typing import Dict, Iterable, List, Set, Tuple
+
+from listing_index import SearchQuery, listing_features, parse_search_query
+
+MAX_FILTERS_PER_USER = 5
+PRICE_BAND = 1000  # € per price band of the index
+MAX_BANDS = 100  # wider price ranges are indexed like open-ended ones
+
+BucketKey = Tuple[str, str, bool]
+
+
+def parse_filters(args: Iterable[str]) -> List[SearchQuery]:
+    """
+    Parse /filter arguments: /search queries separated by commas
+
+    Raises:
+        ValueError: an argument is not understood, a filter is empty or
+            there are too many filters
+    """
+    queries = []
+    for group in " ".join(args).split(","):
+        query = parse_search_query(group.split())
+        if query.is_empty():
+            raise ValueError("Empty filter")
+        queries.append(query)
+    if len(queries) > MAX_FILTERS_PER_USER:
+        raise ValueError(f"At most {MAX_FILTERS_PER_USER} filters")
+    return queries
+
+
+def query_matches(query: SearchQuery, features: Dict[str, object]) -> bool:
+    """Same criteria as ListingIndex.search, for one listing (listing_features)"""
+    if query.model and query.model not in features["model"]:
+        return False
+    if query.fuel and query.fuel != features["fuel"]:
+        return False
+    if query.defect and not features["defect"]:
+        return False
+    for low, high, value in ((query.year_min, query.year_max, features["year"]),
+                             (query.price_min, query.price_max, features["price"])):
+        if low is None and high is None:
+            continue
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+def _bands(query: SearchQuery) -> range:
+    """Price bands covered by the price range of ``query`` (empty: index by minimum)"""
+    if query.price_max is None:
+        return range(0)
+    low, high = (query.price_min or 0) // PRICE_BAND, query.price_max // PRICE_BAND
+    return range(low, high + 1) if high - low < MAX_BANDS else range(0)
+
+
+class _Bucket:
+    """Filters sharing one (model, fuel, defect) key"""
+
+    def __init__(self):
+        self.any_price: List[Tuple[int, SearchQuery]] = []
+        self.by_band: Dict[int, List[Tuple[int, int]]] = {}  # band -> [(user_id, slot)]
+        self.by_price_min: List[Tuple[int, int, int]] = []  # (price_min, user_id, slot)
+        self.priced: Dict[Tuple[int, int], SearchQuery] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.priced or self.any_price)
+
+    def add(self, user_id: int, slot: int, query: SearchQuery) -> None:
+        if query.price_min is None and query.price_max is None:
+            self.any_price.append((user_id, query))
+            return
+        self.priced[(user_id, slot)] = query
+        bands = _bands(query)
+        for band in bands:
+            self.by_band.setdefault(band, []).append((user_id, slot))
+        if not bands:
+            insort(self.by_price_min, (query.price_min or 0, user_id, slot))
+
+    def remove(self, user_id: int, slot: int, query: SearchQuery) -> None:
+        if self.priced.pop((user_id, slot), None) is None:
+            self.any_price = [entry for entry in self.any_price if entry[0] != user_id]
+            return
+        for band in _bands(query):
+            self.by_band[band].remove((user_id, slot))
+            if not self.by_band[band]:
+                del self.by_band[band]
+        self.by_price_min = [entry for entry in self.by_price_min if entry[1:] != (user_id, slot)]
+
+    def candidates(self, price: int) -> Iterable[Tuple[int, SearchQuery]]:
+        """Filters with a price range that may contain ``price``"""
+        for user_id, slot in self.by_band.get(price // PRICE_BAND, ()):
+            yield user_id, self.priced[(user_id, slot)]
+        end = bisect_right(self.by_price_min, (price, float("inf"), 0))
+        for _, user_id, slot in self.by_price_min[:end]:
+            yield user_id, self.priced[(user_id, slot)]
+
+
+class SubscriptionIndex:
+    """
+    User ID -> saved filters, with the index described in the module
+    docstring. Users without filters are not in the index (they get the
+    default rules of the bot).
+    """
+
+    def __init__(self):
+        self._filters: Dict[int, List[SearchQuery]] = {}
+        self._buckets: Dict[BucketKey, _Bucket] = {}
+        self._models: Set[str] = set()
+        self._model_keys: Dict[str, List[str]] = {}  # listing model -> saved models it contains
+
+    def __len__(self) -> int:
+        return len(self._filters)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._filters
+
+    def users(self) -> Set[int]:
+        return set(self._filters)
+
+    def get(self, user_id: int) -> List[SearchQuery]:
+        return list(self._filters.get(user_id, []))
+
+    def set(self, user_id: int, queries: List[SearchQuery]) -> None:
+        """Replace the filters of ``user_id`` (an empty list removes them)"""
+        self.remove(user_id)
+        if not queries:
+            return
+        self._filters[user_id] = list(queries)
+        for slot, query in enumerate(queries):
+            self._buckets.setdefault(self._key(query), _Bucket()).add(user_id, slot, query)
+            if query.model and query.model not in self._models:
+                self._models.add(query.model)
+                self._model_keys.clear()
+
+    def remove(self, user_id: int) -> bool:
+        queries = self._filters.pop(user_id, None)
+        if queries is None:
+            return False
+        for slot, query in enumerate(queries):
+            key = self._key(query)
+            bucket = self._buckets[key]
+            bucket.remove(user_id, slot, query)
+            if not bucket:
+                del self._buckets[key]
+        models = {key[0] for key in self._buckets if key[0]}
+        if models != self._models:
+            self._models = models
+            self._model_keys.clear()
+        return True
+
+    @staticmethod
+    def _key(query: SearchQuery) -> BucketKey:
+        return query.model, query.fuel, bool(query.defect)
+
+    def _saved_models(self, model: str) -> List[str]:
+        keys = self._model_keys.get(model)
+        if keys is None:
+            # "land" matches "land cruiser": every saved model contained in this one
+            keys = self._model_keys[model] = [""] + [saved for saved in self._models if saved in model]
+        return keys
+
+    def match(self, listing: Dict[str, str]) -> Set[int]:
+        """Users with a filter matching ``listing``"""
+        return self.match_features(listing_features(listing))
+
+    def match_features(self, features: Dict[str, object]) -> Set[int]:
+        users: Set[int] = set()
+        price = features["price"]
+        fuels = ["", features["fuel"]] if features["fuel"] else [""]
+        defects = [False, True] if features["defect"] else [False]
+        for model in self._saved_models(features["model"]):
+            for fuel in fuels:
+                for defect in defects:
+                    bucket = self._buckets.get((model, fuel, defect))
+                    if bucket is None:
+                        continue
+                    for user_id, query in bucket.any_price:
+                        if user_id not in users and query_matches(query, features):
+                            users.add(user_id)
+                    if price is None:
+                        continue
+                    for user_id, query in bucket.candidates(price):
+                        if user_id not in users and query_matches(query, features):
+                            users.add(user_id)
+        return users
+
+    def to_dict(self) -> Dict[str, List[Dict[str, object]]]:
+        """JSON-serialisable form (user IDs as strings)"""
+        return {str(user_id): [vars(query) for query in queries] for user_id, queries in self._filters.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[Dict[str, object]]]) -> "SubscriptionIndex":
+        index = cls()
+        for user_id, queries in data.items():
+            index.set(int(user_id), [SearchQuery(**query) for query in queries])
+        return index
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._filters),
+            "filters": sum(len(queries) for queries in self._filters.values()),
+            "buckets": len(self._buckets),
+        }
+
+
+def scan_matches(filters: Dict[int, List[SearchQuery]], features: Dict[str, object]) -> Set[int]:
+    """Reference: check every user's filters one by one"""
+    return {user_id for user_id, queries in filters.items()
+            if any(query_matches(query, features) for query in queries)}
@@ -0,0 +1,258 @@
+"""
+Rate-limited fan-out of Telegram messages
+
+Telegram allows a bot about 30 messages per second overall and about one
+message per second in a single chat; above that it answers with
+RetryAfter (flood control). The dispatcher keeps a queue per chat and
+sends through two token buckets (rate_limit.TokenBucket):
+
+- one global bucket for the whole bot
+- one bucket per chat (groups and channels have their own, lower limit:
+  pass their IDs in ``chat_rates``)
+
+A RetryAfter pauses only the chat it came from; the message is retried
+after the pause while other chats keep being served. Messages to one
+chat are delivered in the order they were submitted.
+
+Messages can have a priority: a higher-priority message goes before
+lower-priority ones already waiting in its chat, and global tokens are
+handed to the highest-priority waiting message first. A few important
+messages therefore don't wait behind a long backlog of ordinary ones.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import telegram.error
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API limits (a little below the documented values)
+GLOBAL_RATE = 28.0  # messages per second for the whole bot
+PER_CHAT_RATE = 1.0  # messages per second in one chat
+GROUP_RATE = 19 / 60  # messages per second in one group or channel (20 per minute)
+MAX_RETRIES = 3  # resends after network errors / flood control
+
+
+class DispatcherClosed(RuntimeError):
+    """The message was not sent because the dispatcher was closed"""
+
+
+class NotificationDispatcher:
+    """
+    Queue per chat, one worker task per chat with pending messages.
+
+    ``send`` is the coroutine function doing the actual request, usually
+    ``bot.send_message``; it is called as ``send(chat_id=..., **kwargs)``.
+    ``on_forbidden(chat_id)`` is called once when a chat blocked the bot
+    (its remaining messages are dropped). ``chat_rates`` overrides
+    ``per_chat_rate`` for single chats (e.g. GROUP_RATE for a channel).
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Any]],
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_retries: int = MAX_RETRIES,
+        on_forbidden: Optional[Callable[[Hashable], None]] = None,
+        chat_rates: Optional[Dict[Hashable, float]] = None,
+    ):
+        self.send = send
+        self.per_chat_rate = per_chat_rate
+        self.chat_rates = dict(chat_rates or {})
+        self.max_retries = max_retries
+        self.on_forbidden = on_forbidden
+        self.global_bucket = TokenBucket(global_rate)
+        self._chat_buckets: Dict[Hashable, TokenBucket] = {}
+        # chat -> [(kwargs, future, attempt, priority)], highest priority first
+        self._queues: Dict[Hashable, Deque[Tuple[Dict[str, Any], asyncio.Future, int, int]]] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        # (-priority, sequence, waiter) of workers waiting for a global token
+        self._global_waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._global_pump: Optional[asyncio.Task] = None
+        self._sequence = itertools.count()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.retries = 0
+        self._first_send: Optional[float] = None
+        self._last_send: Optional[float] = None
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rates.get(chat_id, self.per_chat_rate))
+        return bucket
+
+    def submit(self, chat_id: Hashable, priority: int = 0, **kwargs: Any) -> asyncio.Future:
+        """
+        Queue one message for ``chat_id`` (kwargs go to ``send``); it is
+        sent before the queued messages of lower ``priority``
+
+        Returns:
+            Future with the result of ``send``, or the exception that made
+            the delivery fail for good
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._insert(self._queues.setdefault(chat_id, deque()), (kwargs, future, 0, priority))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run_chat(chat_id))
+        self._idle.clear()
+        return future
+
+    def broadcast(self, chat_ids: Iterable[Hashable], priority: int = 0, **kwargs: Any) -> List[asyncio.Future]:
+        """Queue the same message for every chat in ``chat_ids``"""
+        return [self.submit(chat_id, priority, **kwargs) for chat_id in chat_ids]
+
+    @staticmethod
+    def _insert(queue: Deque, item: Tuple, retry: bool = False) -> None:
+        """
+        Put ``item`` behind the messages of higher priority and behind (new
+        message) or in front of (retry) those of the same priority
+        """
+        priority = item[3]
+        for i, queued in enumerate(queue):
+            if queued[3] < priority or (retry and queued[3] == priority):
+                queue.insert(i, item)
+                return
+        queue.append(item)
+
+    async def _acquire_global(self, priority: int) -> None:
+        """Take a global token; waiting messages get them highest priority first"""
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._global_waiters, (-priority, next(self._sequence), waiter))
+        if self._global_pump is None or self._global_pump.done():
+            self._global_pump = asyncio.create_task(self._pump_global())
+        await waiter
+
+    async def _pump_global(self) -> None:
+        while self._global_waiters:
+            await self.global_bucket.acquire()
+            while self._global_waiters:
+                waiter = heapq.heappop(self._global_waiters)[2]
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+    async def join(self) -> None:
+        """Wait until every queued message has been delivered or has failed"""
+        await self._idle.wait()
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def _run_chat(self, chat_id: Hashable) -> None:
+        queue = self._queues[chat_id]
+        bucket = self._chat_bucket(chat_id)
+        try:
+            while queue:
+                if queue[0][1].cancelled():
+                    queue.popleft()
+                    continue
+                # Wait for the tokens first and only then take the message:
+                # higher-priority ones submitted meanwhile go in front of it
+                await bucket.acquire()
+                await self._acquire_global(queue[0][3])
+                kwargs, future, attempt, priority = item = queue.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    result = await self.send(chat_id=chat_id, **kwargs)
+                except telegram.error.RetryAfter as e:
+                    # Flood control: only this chat waits, the message goes back in front
+                    self.flood_waits += 1
+                    logger.warning(f"RetryAfter {e.retry_after}s for chat {chat_id}")
+                    bucket.pause(float(e.retry_after))
+                    if attempt >= self.max_retries:
+                        self._fail(future, e)
+                    else:
+                        self.retries += 1
+                        self._insert(queue, (kwargs, future, attempt + 1, priority), retry=True)
+                    continue
+                except telegram.error.Forbidden as e:
+                    logger.info(f"Chat {chat_id} blocked the bot, dropping {len(queue) + 1} queued messages")
+                    self._fail(future, e)
+                    while queue:
+                        self._fail(queue.popleft()[1], e)
+                    if self.on_forbidden:
+                        self.on_forbidden(chat_id)
+                    break
+                except telegram.error.NetworkError as e:
+                    # TimedOut / connection problems are retried, a BadRequest never succeeds
+                    if attempt >= self.max_retries or isinstance(e, telegram.error.BadRequest):
+                        logger.error(f"Failed to send to {chat_id}: {e}")
+                        self._fail(future, e)
+                    else:
+                        self.retries += 1
+                        self._insert(queue, (kwargs, future, attempt + 1, priority), retry=True)
+                        bucket.pause(2 ** attempt)
+                    continue
+                except asyncio.CancelledError:
+                    queue.appendleft(item)
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to send to {chat_id}: {e}")
+                    self._fail(future, e)
+                    continue
+
+                self.sent += 1
+                now = time.monotonic()
+                self._first_send = self._first_send or now
+                self._last_send = now
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+            if not self._workers:
+                self._idle.set()
+
+    def _fail(self, future: asyncio.Future, error: BaseException) -> None:
+        self.failed += 1
+        if not future.done():
+            future.set_exception(error)
+            future.exception()  # failures are counted here; nobody has to await them
+
+    async def close(self) -> None:
+        """Stop all workers; messages not sent yet fail with DispatcherClosed"""
+        workers = list(self._workers.values())
+        if self._global_pump is not None:
+            workers.append(self._global_pump)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # A cancelled worker puts its message back, so every unsent one is queued here
+        for queue in self._queues.values():
+            for _, future, _, _ in queue:
+                if not future.done():
+                    future.set_exception(DispatcherClosed("dispatcher closed"))
+                    future.exception()  # nobody has to await them
+        self._queues.clear()
+        for *_, waiter in self._global_waiters:
+            waiter.cancel()
+        self._global_waiters.clear()
+        self._idle.set()
+
+    def stats(self) -> Dict[str, float]:
+        """Delivery counters and throughput (messages/s between first and last delivery)"""
+        elapsed = (self._last_send - self._first_send) if self._first_send else 0.0
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "retries": self.retries,
+            "pending": self.pending(),
+            "chats": len(self._chat_buckets),
+            "throughput": (self.sent - 1) / elapsed if elapsed > 0 else 0.0,
+        }
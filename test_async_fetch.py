@@ -0,0 +1,108 @@
+"""
+Offline test of the async fetch engine used by toyota.scrape_listings
+"""
+import sys
+import time
+import asyncio
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from rate_limit import TokenBucket
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL
+
+
+def reset_state():
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+
+
+def make_fetcher(fake: FakeSSLV, concurrency: int = 4, rate: float = 100.0, burst: int = 3) -> AsyncFetcher:
+    return AsyncFetcher(concurrency=concurrency, rate_per_host=rate, burst=burst, transport=fake.transport())
+
+
+def test_token_bucket_rate():
+    """A 20 req/s bucket with burst 2 must take ~0.4s for 10 tokens"""
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(10)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    print(f"10 tokens at 20/s (burst 2): {elapsed:.2f}s")
+    assert 0.35 <= elapsed < 1.0
+
+
+def test_scrape_contract_and_order():
+    """Same list-of-dicts contract and ordering as the old serial scraper"""
+    reset_state()
+    fake = FakeSSLV()
+
+    async def run():
+        async with make_fetcher(fake) as fetcher:
+            return await toyota.scrape_listings_async(fetcher)
+
+    items = asyncio.run(run())
+    print(f"Scraped {len(items)} listings")
+
+    assert [i["id"] for i in items][:2] == ["53712410", "53712398"]
+    assert items[0]["link"] == "https://www.ss.lv/msg/lv/transport/cars/toyota/corolla/bxkqpd.html"
+    assert items[0]["price"] == "3 500  €"
+    assert items[0]["fuel_type"] == "1.6 benzīns"
+    assert not items[0]["is_defect"]
+    assert items[-1]["is_defect"]
+    assert set(items[0]) == {"id", "title", "price", "link", "description", "is_defect", "car_make", "fuel_type", "fuel_source", "source"}
+
+
+def test_concurrency_cap_and_speedup():
+    """Detail pages run concurrently but never above the cap"""
+    reset_state()
+    fake = FakeSSLV(latency=0.1)
+
+    async def run():
+        async with make_fetcher(fake, concurrency=4) as fetcher:
+            started = time.monotonic()
+            items = await toyota.scrape_listings_async(fetcher)
+            return items, time.monotonic() - started
+
+    # Force a detail request for every row (no list-row shortcuts)
+    original = toyota.classify_fuel_from_row, toyota.ROW_STAGES
+    toyota.classify_fuel_from_row, toyota.ROW_STAGES = (lambda cells, text: ""), []
+    try:
+        items, elapsed = asyncio.run(run())
+    finally:
+        toyota.classify_fuel_from_row, toyota.ROW_STAGES = original
+    serial = len(fake.requests) * fake.latency
+    print(f"{len(fake.requests)} requests in {elapsed:.2f}s (serial would be >= {serial:.2f}s), "
+          f"max in flight {fake.max_in_flight}")
+    assert fake.max_in_flight <= 4
+    assert elapsed < serial / 2
+
+
+def test_per_host_rate_limit():
+    """No more than burst + rate * t requests reach ss.lv in any window"""
+    reset_state()
+    fake = FakeSSLV()
+
+    async def run():
+        async with make_fetcher(fake, concurrency=8, rate=10, burst=2) as fetcher:
+            await toyota.scrape_listings_async(fetcher)
+
+    asyncio.run(run())
+    times = [t for t, _, _ in fake.requests]
+    elapsed = times[-1] - times[0]
+    allowed = 2 + 10 * elapsed + 1
+    print(f"{len(times)} requests over {elapsed:.2f}s (allowed {allowed:.1f})")
+    assert len(times) <= allowed
+
+
+if __name__ == "__main__":
+    test_token_bucket_rate()
+    test_scrape_contract_and_order()
+    test_concurrency_cap_and_speedup()
+    test_per_host_rate_limit()
+    print("All async fetch tests passed")
@@ -0,0 +1,147 @@
+"""
+Offline test of the multi-token sender pool: consistent chat -> bot
+pinning, throughput growing with the number of tokens, health fallbacks
+"""
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.insert(0, '.')
+
+import telegram.error
+
+from bot_pool import BotPool, HashRing
+from outbox import Outbox
+from telegram_dispatcher import NotificationDispatcher
+
+
+class FakeBot:
+    """Bot recording (chat_id, text); ``started`` chats only, unless None (everyone)"""
+
+    def __init__(self, token, started=None, invalid=False, log=None):
+        self.token = token
+        self.started = started
+        self.invalid = invalid
+        self.log = log if log is not None else []
+        self.initialized = self.shut_down = 0
+
+    async def initialize(self):
+        self.initialized += 1
+
+    async def shutdown(self):
+        self.shut_down += 1
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.invalid:
+            raise telegram.error.InvalidToken()
+        if self.started is not None and chat_id not in self.started:
+            raise telegram.error.Forbidden("bot can't initiate conversation with a user")
+        self.log.append((self.token, chat_id, text))
+        return len(self.log)
+
+
+def test_ring_spreads_chats_and_moves_few():
+    chats = range(10_000)
+    ring = HashRing(["1", "2", "3", "4"])
+    owners = {chat: ring.get(chat) for chat in chats}
+    counts = [list(owners.values()).count(node) for node in "1234"]
+    assert min(counts) > 1800 and max(counts) < 3200
+
+    grown = HashRing(["1", "2", "3", "4", "5"])
+    moved = [chat for chat in chats if grown.get(chat) != owners[chat]]
+    assert all(grown.get(chat) == "5" for chat in moved)  # chats only move to the new bot
+    assert 1200 < len(moved) < 2800
+
+
+def send_all(dispatcher, chats, per_chat):
+    async def run():
+        started = time.monotonic()
+        for n in range(per_chat):
+            for chat in chats:
+                dispatcher.submit(chat, text=str(n))
+        await dispatcher.join()
+        return time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def test_throughput_scales_with_tokens():
+    chats = range(100)
+    single_log = []
+    single = NotificationDispatcher(FakeBot("1:a", log=single_log).send_message, global_rate=200, per_chat_rate=1000)
+    single_time = send_all(single, chats, 2)
+
+    log = []
+    pool = BotPool([FakeBot(f"{n}:x", log=log) for n in range(1, 5)], global_rate=200, per_chat_rate=1000)
+    pool_time = send_all(pool, chats, 2)
+    print(f"200 messages: 1 bot {single_time:.2f}s, 4 bots {pool_time:.2f}s")
+
+    assert len(log) == len(single_log) == 200
+    assert pool_time * 2 < single_time
+    for chat in chats:
+        sent = [(token, text) for token, chat_id, text in log if chat_id == chat]
+        assert len({token for token, _ in sent}) == 1  # one bot per chat
+        assert [text for _, text in sent] == ["0", "1"]  # in order
+    assert pool.stats()["sent"] == 200 and len(pool.stats()["bots"]) == 4
+
+
+def test_fallback_to_primary_and_invalid_token():
+    log, blocked = [], []
+    primary = FakeBot("1:a", started={1, 2, 3, 4, 5, 6, 7, 8}, log=log)
+    secondary = FakeBot("2:b", started={1, 2}, log=log)
+    broken = FakeBot("3:c", invalid=True, log=log)
+    pool = BotPool([primary, secondary, broken], global_rate=1000, per_chat_rate=1000, on_forbidden=blocked.append)
+    chats = range(1, 10)
+
+    async def run():
+        futures = [pool.submit(chat, text="x") for chat in chats]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    results = asyncio.run(run())
+    delivered = {chat_id: token for token, chat_id, _ in log}
+    assert sorted(delivered) == list(range(1, 9))
+    assert all(token in ("1:a", "2:b") for token in delivered.values())
+    assert isinstance(results[-1], telegram.error.Forbidden) and blocked == [9]  # only the primary's Forbidden counts
+    assert not pool.health["3"].available() and pool.health["2"].available()
+    assert all(pool.bot_for(chat) != "3" for chat in chats)
+    assert all(pool.bot_for(chat) == "1" for chat in range(3, 9))  # never started bot 2
+
+
+def test_primary_only_chats_persisted_and_bots_shut_down():
+    log = []
+    primary = FakeBot("1:a", log=log)
+    secondary = FakeBot("2:b", started=set(), log=log)
+
+    async def run(pool, chats):
+        await asyncio.gather(*(pool.submit(chat, text="x") for chat in chats))
+        await pool.submit(chats[0], text="y")
+        await pool.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(Path(tmp) / "outbox.db")
+
+        def make_pool():
+            return BotPool([primary, secondary], global_rate=1000, per_chat_rate=1000,
+                           primary_only=outbox.primary_only_chats(), on_primary_only=outbox.mark_primary_only)
+
+        pool = make_pool()
+        chats = [chat for chat in range(1, 50) if pool.bot_for(chat) == "2"][:3]
+        asyncio.run(run(pool, chats))
+        assert outbox.primary_only_chats() == set(chats) and pool.rerouted == 3  # stored once per chat
+        assert all(token == "1:a" for token, _, _ in log)
+        assert secondary.initialized == 1 and secondary.shut_down == 1
+        assert primary.initialized == primary.shut_down == 0  # the application's bot
+
+        # After a restart the chats go straight to the primary bot
+        pool = make_pool()
+        asyncio.run(run(pool, chats))
+        assert pool.rerouted == 0 and len(log) == 8
+        assert secondary.initialized == 1  # never used, never started
+        outbox.close()
+
+if __name__ == "__main__":
+    test_ring_spreads_chats_and_moves_few()
+    test_throughput_scales_with_tokens()
+    test_fallback_to_primary_and_invalid_token()
+    test_primary_only_chats_persisted_and_bots_shut_down()
@@ -0,0 +1,111 @@
+"""
+Offline test of broadcast mode: every new listing posted once to a
+channel (none after a restart), direct messages only for users with
+saved filters
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota
+import toyota_bot_fixed
+from outbox import Outbox
+from subscriptions import SubscriptionIndex, parse_filters
+from telegram_dispatcher import NotificationDispatcher
+from fixtures.fake_sslv import read_fixture, TOYOTA_URL, DEFECTS_URL
+
+CHANNEL = -1001234567890
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.sent.append((chat_id, reply_markup.inline_keyboard[0][0].url if reply_markup else text))
+
+
+def test_restart_posts_nothing_and_new_listings_once():
+    toyota_bot_fixed.BROADCAST_CHAT_ID = CHANNEL
+    toyota_bot_fixed.notification_dispatcher = None
+    toyota_bot_fixed.notification_outbox = Outbox()
+    toyota_bot_fixed.subscription_index = SubscriptionIndex()
+    toyota_bot_fixed.subscription_index.set(7, parse_filters(["hilux"]))
+    pages = {
+        TOYOTA_URL: toyota_bot_fixed.parse_listing_rows(read_fixture("toyota_list.html"), TOYOTA_URL),
+        DEFECTS_URL: toyota_bot_fixed.parse_listing_rows(read_fixture("defects_list.html"), DEFECTS_URL),
+    }
+    everything = pages[TOYOTA_URL] + pages[DEFECTS_URL]
+    defaults = toyota_bot_fixed.filter_all_listings(everything)
+    hilux = [listing for listing in everything if 'hilux' in listing['title'].lower()]
+    fresh = {defaults[0]['link'], hilux[0]['link']}  # posted while the bot runs
+    bot = RecordingBot()
+
+    def start():
+        """A (re)start: nothing seen, nobody subscribed yet"""
+        toyota_bot_fixed.seen_listing_ids.clear()
+        toyota_bot_fixed.seeded_sources.clear()
+        toyota_bot_fixed.subscribed_users.clear()
+        toyota_bot_fixed.subscribed_users.update(range(1, 201))
+
+    async def check(skip=()):
+        context = SimpleNamespace(bot=bot, bot_data={})
+        for url, listings in pages.items():
+            await toyota_bot_fixed.process_source_listings(
+                context, url, [listing for listing in listings if listing['link'] not in skip])
+
+    toyota_bot_fixed.get_notification_dispatcher(bot).chat_rates[CHANNEL] = 1000  # don't wait 3 s per post here
+    start()
+    asyncio.run(check(skip=fresh))
+    assert bot.sent == []  # the first check only records what is listed
+
+    asyncio.run(check())
+    channel = [listing['link'] for listing in defaults if listing['link'] in fresh]
+    assert sorted(link for chat, link in bot.sent if chat == CHANNEL) == sorted(channel)
+    assert [link for chat, link in bot.sent if chat == 7] == [hilux[0]['link']]
+    assert {chat for chat, _ in bot.sent} == {CHANNEL, 7}  # 199 users without filters: no DMs
+    sent = len(bot.sent)
+
+    # After a restart (seen IDs gone) the channel gets nothing again
+    start()
+    asyncio.run(check())
+    asyncio.run(check())
+    assert len(bot.sent) == sent
+
+
+def test_channel_paced_at_group_rate():
+    sent_at = {}
+
+    async def send(chat_id, text):
+        sent_at.setdefault(chat_id, []).append(time.monotonic())
+
+    async def run():
+        dispatcher = NotificationDispatcher(send, global_rate=1000, per_chat_rate=1000, chat_rates={CHANNEL: 20})
+        for n in range(5):
+            dispatcher.submit(CHANNEL, text=str(n))
+            dispatcher.submit(1, text=str(n))
+        await dispatcher.join()
+
+    asyncio.run(run())
+    assert sent_at[CHANNEL][-1] - sent_at[CHANNEL][0] >= 0.19  # 4 intervals of 50 ms
+    assert sent_at[1][-1] - sent_at[1][0] < 0.05
+
+
+def test_toyota_queues_for_channel_only():
+    toyota.BROADCAST_CHAT_ID = CHANNEL
+    toyota.notification_outbox = Outbox()
+    original = toyota.subscribed_users
+    toyota.subscribed_users = set(range(1, 101))
+    try:
+        assert toyota.queue_for_subscribers("1", "text") == 1
+    finally:
+        toyota.subscribed_users = original
+    assert [delivery.chat_id for delivery in toyota.notification_outbox.claim_due()] == [CHANNEL]
+
+
+if __name__ == "__main__":
+    test_restart_posts_nothing_and_new_listings_once()
+    test_channel_paced_at_group_rate()
+    test_toyota_queues_for_channel_only()
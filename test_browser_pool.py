@@ -0,0 +1,166 @@
+"""
+Offline test of the headless browser pool: browsers are reused across
+jobs, restarted after max_pages pages / too much memory / a failed job, and
+never more than ``size`` run at once (fake drivers, no Chrome needed)
+"""
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+from browser_pool import BrowserPool
+
+
+class FakeSwitch:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = handle
+
+
+class FakeDriver:
+    """Just enough of a WebDriver: pages, windows, quit()"""
+    instances = []
+    lock = threading.Lock()
+
+    def __init__(self, startup=0.0):
+        time.sleep(startup)
+        self.visited = []
+        self.window_handles = ["main"]
+        self.current = "main"
+        self.switch_to = FakeSwitch(self)
+        self.quit_called = False
+        self.memory = 100
+        with FakeDriver.lock:
+            FakeDriver.instances.append(self)
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def close(self):
+        self.window_handles.remove(self.current)
+
+    def quit(self):
+        self.quit_called = True
+
+    # Used by find_phone_on_page
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def find_element(self, by, selector):
+        return object()
+
+    def find_elements(self, by, selector):
+        return []
+
+    def execute_script(self, script, *args):
+        return "+371 29123456"
+
+
+def setup_function(function=None):
+    FakeDriver.instances = []
+
+
+def open_page(url):
+    def job(driver):
+        driver.get(url)
+        driver.window_handles.append(f"popup-{url}")
+        return len(driver.visited)
+    return job
+
+
+def test_browser_reused_and_recycled():
+    pool = BrowserPool(size=1, max_pages=5, driver_factory=FakeDriver, memory_mb=lambda d: d.memory)
+    try:
+        for n in range(12):
+            pool.run(open_page(f"https://www.ss.lv/{n}"))
+        # 12 pages: restarted after page 5 and 10
+        assert len(FakeDriver.instances) == 3 and pool.recycled == 2
+        assert all(d.quit_called for d in FakeDriver.instances[:2])
+        first = FakeDriver.instances[0]
+        assert first.visited[:2] == ["https://www.ss.lv/0", "about:blank"]  # tab reset after every job
+        assert first.window_handles == ["main"]  # popups closed
+
+        # Memory above the limit: restarted after the job
+        FakeDriver.instances[-1].memory = 400
+        pool.run(open_page("https://www.ss.lv/big"))
+        assert len(FakeDriver.instances) == 3 and FakeDriver.instances[-1].quit_called
+
+        # A failed job restarts the browser; the next job gets a new one
+        def broken(driver):
+            raise RuntimeError("tab crashed")
+        try:
+            pool.run(broken)
+            assert False, "exception not raised"
+        except RuntimeError:
+            pass
+        assert pool.run(open_page("https://www.ss.lv/ok")) == 1
+        assert len(FakeDriver.instances) == 5 and pool.stats()["failed"] == 1
+    finally:
+        pool.close()
+    assert all(d.quit_called for d in FakeDriver.instances)
+
+
+def test_concurrency_bounded_and_faster_than_new_browsers():
+    startup, page = 0.2, 0.02
+    running = []
+    peak = [0]
+
+    def job(driver):
+        with FakeDriver.lock:
+            running.append(driver)
+            peak[0] = max(peak[0], len(running))
+        time.sleep(page)
+        with FakeDriver.lock:
+            running.remove(driver)
+        return True
+
+    pool = BrowserPool(size=2, driver_factory=lambda: FakeDriver(startup), memory_mb=lambda d: None)
+    try:
+        started = time.monotonic()
+        with ThreadPoolExecutor(8) as threads:
+            assert all(threads.map(lambda _: pool.run(job), range(20)))
+        pooled = time.monotonic() - started
+    finally:
+        pool.close()
+    per_call = 20 * (startup + page) / 2  # a new browser per page, 2 at a time
+    print(f"20 pages: {pooled:.2f}s pooled vs ~{per_call:.2f}s with a browser per page")
+    assert peak[0] <= 2 and len(FakeDriver.instances) == 2
+    assert pooled < per_call / 2
+
+
+def test_idle_browser_shut_down():
+    pool = BrowserPool(size=1, idle_timeout=0.1, driver_factory=FakeDriver, memory_mb=lambda d: None)
+    try:
+        pool.run(open_page("https://www.ss.lv/1"))
+        time.sleep(0.3)
+        assert FakeDriver.instances[0].quit_called
+        pool.run(open_page("https://www.ss.lv/2"))  # started again on demand
+        assert len(FakeDriver.instances) == 2 and pool.stats()["started"] == 2
+    finally:
+        pool.close()
+
+
+def test_extract_phone_uses_pool():
+    pool = BrowserPool(size=1, driver_factory=FakeDriver, memory_mb=lambda d: None)
+    original, toyota_bot_fixed.phone_browsers = toyota_bot_fixed.phone_browsers, pool
+    toyota_bot_fixed.phone_cache.clear()
+    try:
+        for n in range(3):
+            phone = toyota_bot_fixed.extract_phone_with_js(f"https://www.ss.lv/msg/{n}.html", f"id{n}")
+            assert phone == "+371 29123456"
+        assert len(FakeDriver.instances) == 1 and pool.jobs == 3
+    finally:
+        toyota_bot_fixed.phone_browsers = original
+        toyota_bot_fixed.phone_cache.clear()
+        pool.close()
+
+
+if __name__ == "__main__":
+    for test in (test_browser_reused_and_recycled, test_concurrency_bounded_and_faster_than_new_browsers,
+                 test_idle_browser_shut_down, test_extract_phone_uses_pool):
+        setup_function()
+        test()
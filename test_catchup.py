@@ -0,0 +1,164 @@
+"""
+Offline test of the catch-up crawler: after downtime or a burst of posts
+the monitor follows pageN.html links until it reaches the persisted
+watermark, with bounded concurrency and a resumable checkpoint
+"""
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from outbox import Outbox
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, read_fixture
+
+
+ROWS_PER_PAGE = 3
+TEMPLATE_ID = b"53712410"
+
+
+def build_source(newest: int, pages: int):
+    """
+    Synthetic Toyota source: ``pages`` list pages of ROWS_PER_PAGE rows,
+    IDs counting down from ``newest``. Returns {url: body}.
+    """
+    fixture = read_fixture("toyota_list.html")
+    row_start = fixture.index(b'<tr id="tr_' + TEMPLATE_ID)
+    row_end = fixture.index(b"</tr>", row_start) + len(b"</tr>")
+    head = fixture[:row_start]
+    row = fixture[row_start:row_end]
+    foot = b"</table></form></div></body></html>"
+
+    result = {}
+    listing_id = newest
+    for n in range(1, pages + 1):
+        rows = []
+        for _ in range(ROWS_PER_PAGE):
+            rows.append(row.replace(TEMPLATE_ID, str(listing_id).encode()))
+            listing_id -= 1
+        navi = b""
+        if n < pages:
+            navi = f'<a class="navi" rel="next" href="/lv/transport/cars/toyota/sell/page{n + 1}.html">Nākamie</a>'.encode()
+        result[toyota.page_url(TOYOTA_URL, n)] = head + b"\n".join(rows) + navi + foot
+    return result
+
+
+def reset_state(watermark: int):
+    toyota.SS_LV_URLS = [TOYOTA_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_items.clear()
+    toyota.source_state = {TOYOTA_URL: {"watermark": watermark}}
+
+
+def page_requests(fake):
+    return [url for _, url, _ in fake.requests if "/msg/" not in url]
+
+
+async def run_cycle(fake, only_changed=True):
+    async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+        return await toyota.scrape_listings_async(fetcher, only_changed=only_changed)
+
+
+def test_catch_up_until_watermark():
+    reset_state(watermark=990)
+    fake = FakeSSLV(pages=build_source(newest=1000, pages=8))
+
+    items = asyncio.run(run_cycle(fake))
+
+    ids = sorted((int(item["id"]) for item in items), reverse=True)
+    assert ids == list(range(1000, 990, -1))
+    # page4 holds 991, 990, 989; page5 was fetched in the same batch, nothing later
+    assert page_requests(fake) == [toyota.page_url(TOYOTA_URL, n) for n in range(1, 6)]
+    assert "gap" not in toyota.source_state[TOYOTA_URL]
+    assert toyota.source_state[TOYOTA_URL]["watermark"] == 1000
+    print(f"✓ {len(ids)} missed listings recovered from {len(page_requests(fake))} pages")
+
+
+def test_bounded_concurrency():
+    reset_state(watermark=950)
+    fake = FakeSSLV(latency=0.05, pages=build_source(newest=1000, pages=20))
+
+    asyncio.run(run_cycle(fake))
+
+    assert fake.max_in_flight <= toyota.CATCHUP_CONCURRENCY
+    assert len(page_requests(fake)) == toyota.CATCHUP_MAX_PAGES
+    assert "gap" not in toyota.source_state[TOYOTA_URL]
+    print(f"✓ at most {fake.max_in_flight} pages in flight, crawl capped at {toyota.CATCHUP_MAX_PAGES} pages")
+
+
+def test_interrupted_catch_up_resumes_from_checkpoint():
+    reset_state(watermark=985)
+    pages = build_source(newest=1000, pages=8)
+    broken_url = toyota.page_url(TOYOTA_URL, 3)
+    fake = FakeSSLV(pages={url: body for url, body in pages.items() if url != broken_url})
+
+    first = asyncio.run(run_cycle(fake))
+    assert sorted(int(item["id"]) for item in first) == list(range(995, 1001))
+    assert toyota.source_state[TOYOTA_URL]["gap"] == {"after": 985, "next_page": 3}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        toyota.SOURCES_FILE = Path(tmp) / "sources.json"
+        toyota.save_source_state()
+        toyota.source_state = {}
+        toyota.load_source_state()
+
+    fake = FakeSSLV(pages=pages)
+    second = asyncio.run(run_cycle(fake))
+
+    assert sorted(int(item["id"]) for item in second) == list(range(986, 995))
+    assert toyota.page_url(TOYOTA_URL, 2) not in page_requests(fake)
+    assert "gap" not in toyota.source_state[TOYOTA_URL]
+    print("✓ catch-up resumed at page3 after a failed fetch and a restart")
+
+
+def test_full_scrape_after_restart_flags_gap():
+    reset_state(watermark=990)
+    fake = FakeSSLV(pages=build_source(newest=1000, pages=8))
+
+    asyncio.run(run_cycle(fake, only_changed=False))
+    assert toyota.source_state[TOYOTA_URL]["gap"] == {"after": 990, "next_page": 2}
+
+    items = asyncio.run(run_cycle(fake))
+    assert sorted(int(item["id"]) for item in items) == list(range(991, 998))
+    print("✓ startup scrape flags the gap, the next monitor cycle closes it")
+
+
+def test_restart_sends_missed_listings_of_all_pages():
+    """Listings posted during downtime: page 1 ones from the initial load, older ones from the catch-up"""
+    reset_state(watermark=990)
+    fake = FakeSSLV(pages=build_source(newest=1000, pages=8))
+    toyota.seen_listing_ids = {str(n) for n in range(980, 991)}  # seen before the downtime
+    toyota.BROADCAST_CHAT_ID = -1001234567890
+    toyota.DIGEST_MODE = False
+    toyota.notification_outbox = Outbox()
+
+    async def run():
+        async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+            await toyota.initial_load(None, fetcher)
+            page_one = {delivery.listing_id for delivery in toyota.notification_outbox.claim_due()}
+            async for item in toyota.stream_new_listings(fetcher):  # monitor's first cycle
+                await toyota.queue_listing(item)
+                toyota.mark_queued(item)
+        return page_one, {delivery.listing_id for delivery in toyota.notification_outbox.claim_due()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        toyota.SEEN_FILE = Path(tmp) / "seen.json"
+        toyota.SOURCES_FILE = Path(tmp) / "sources.json"
+        page_one, caught_up = asyncio.run(run())
+
+    assert sorted(map(int, page_one)) == [998, 999, 1000]
+    assert sorted(map(int, caught_up)) == list(range(991, 998))
+    assert {str(n) for n in range(991, 1001)} <= toyota.seen_listing_ids
+    print("✓ after a restart page 1 and the caught-up pages are both sent")
+
+
+if __name__ == "__main__":
+    test_catch_up_until_watermark()
+    test_bounded_concurrency()
+    test_interrupted_catch_up_resumes_from_checkpoint()
+    test_full_scrape_after_restart_flags_gap()
+    test_restart_sends_missed_listings_of_all_pages()
@@ -0,0 +1,161 @@
+"""
+Offline test of conditional GET / content-hash short-circuit for list pages
+"""
+import sys
+import asyncio
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+import toyota_bot_fixed
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL, read_fixture
+
+
+def run_cycles(fake: FakeSSLV, cycles: int, only_changed: bool = True, between=None):
+    """
+    Run several monitor-style scrape cycles and count list page parses.
+    Watermarks are reset before every cycle so the conditional GET /
+    fingerprint path is what decides (see test_watermark.py for the rest).
+    """
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.source_items.clear()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+
+    parses = []
+    original_parse = toyota.parse_list_page
+
+    def counting_parse(content, url):
+        parses.append(url)
+        return original_parse(content, url)
+
+    toyota.parse_list_page = counting_parse
+
+    async def run():
+        results = []
+        async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+            for i in range(cycles):
+                if between:
+                    between(i)
+                toyota.source_state = {}
+                items = await toyota.scrape_listings_async(fetcher, only_changed=only_changed)
+                results.append((items, dict(toyota.last_cycle_stats)))
+        return results
+
+    try:
+        return asyncio.run(run()), parses
+    finally:
+        toyota.parse_list_page = original_parse
+
+
+def test_fingerprint_ignores_page_chrome():
+    body = read_fixture("toyota_list.html")
+    changed_footer = body.replace(b"&copy; 2025", b"&copy; 2026")
+    changed_row = body.replace(b"3 500  \xe2\x82\xac", b"3 400  \xe2\x82\xac")
+    assert PageCache.fingerprint(body) == PageCache.fingerprint(changed_footer)
+    assert PageCache.fingerprint(body) != PageCache.fingerprint(changed_row)
+
+
+def test_etag_not_modified_skips_parse():
+    fake = FakeSSLV()
+    fake.response_headers[TOYOTA_URL] = {"ETag": '"v1"'}
+    fake.response_headers[DEFECTS_URL] = {"ETag": '"d1"'}
+
+    results, parses = run_cycles(fake, 3)
+    stats = [s for _, s in results]
+    print("Pages skipped per cycle:", [s["pages_skipped"] for s in stats])
+
+    assert len(parses) == 2  # only the first cycle parsed
+    assert [s["pages_skipped"] for s in stats] == [0, 2, 2]
+    assert results[1][0] == [] and results[2][0] == []
+    list_requests = [h for _, url, h in fake.requests if url == TOYOTA_URL]
+    assert list_requests[1].get("If-None-Match") == '"v1"'
+
+
+def test_body_hash_without_validators():
+    fake = FakeSSLV()
+    original = fake.pages[TOYOTA_URL]
+
+    def modify_on_third_cycle(i):
+        if i == 2:
+            fake.pages[TOYOTA_URL] = original.replace(b"53712410", b"53712499")
+
+    results, parses = run_cycles(fake, 3, between=modify_on_third_cycle)
+    stats = [s for _, s in results]
+    print("Pages skipped per cycle:", [s["pages_skipped"] for s in stats])
+
+    assert [s["pages_skipped"] for s in stats] == [0, 2, 1]
+    assert parses.count(TOYOTA_URL) == 2
+    assert any(item["id"] == "53712499" for item in results[2][0])
+
+
+def test_full_scrape_reuses_unchanged_pages():
+    fake = FakeSSLV()
+    results, parses = run_cycles(fake, 2, only_changed=False)
+    assert len(parses) == 2
+    assert [i["id"] for i in results[0][0]] == [i["id"] for i in results[1][0]]
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise toyota_bot_fixed.requests.exceptions.HTTPError(str(self.status_code))
+
+
+class FakeSession:
+    """requests.Session stand-in that answers from the fixtures with ETags"""
+    sent = []
+
+    def __init__(self):
+        self.headers = {}
+
+    def get(self, url, headers=None, timeout=None):
+        FakeSession.sent.append((url, dict(headers or {})))
+        etag = f'"{url}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return FakeResponse(304, headers={"ETag": etag})
+        if url == DEFECTS_URL:
+            return FakeResponse(200, read_fixture("defects_list.html"), {"ETag": etag})
+        return FakeResponse(200, read_fixture("toyota_list.html"), {"ETag": etag})
+
+
+def test_bot_fixed_scrape_skips_unchanged_pages():
+    toyota_bot_fixed.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota_bot_fixed.REQUEST_DELAY = 1
+    toyota_bot_fixed.page_cache = PageCache()
+
+    toyota_bot_fixed.http_session = FakeSession()
+    toyota_bot_fixed.source_backoff_until.clear()
+
+    original_sleep = toyota_bot_fixed.time.sleep
+    toyota_bot_fixed.time.sleep = lambda s: None
+    try:
+        first = toyota_bot_fixed.scrape_listings(only_changed=True)
+        second = toyota_bot_fixed.scrape_listings(only_changed=True)
+        full = toyota_bot_fixed.scrape_listings()
+    finally:
+        toyota_bot_fixed.time.sleep = original_sleep
+        toyota_bot_fixed.http_session = None
+
+    print(f"First: {len(first)}, second: {len(second)}, full: {len(full)}, "
+          f"report: {toyota_bot_fixed.last_scrape_stats}")
+    assert len(first) == 12
+    assert second == []
+    assert len(full) == 12
+    assert toyota_bot_fixed.last_scrape_stats["pages_skipped"] == 2
+
+
+if __name__ == "__main__":
+    test_fingerprint_ignores_page_chrome()
+    test_etag_not_modified_skips_parse()
+    test_body_hash_without_validators()
+    test_full_scrape_reuses_unchanged_pages()
+    test_bot_fixed_scrape_skips_unchanged_pages()
+    print("All conditional GET tests passed")
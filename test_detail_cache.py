@@ -0,0 +1,93 @@
+"""
+Offline test of the persistent detail-page cache
+"""
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL
+
+
+def test_lru_eviction_and_counters():
+    cache = DetailCache(max_size=2)
+    cache.set("a", {"fuel_type": "benzīns"})
+    cache.set("b", {"fuel_type": "dīzelis"})
+    assert cache.get("a")["fuel_type"] == "benzīns"  # "a" becomes most recent
+    cache.set("c", {"fuel_type": "hibrīds"})          # evicts "b"
+    assert cache.get("b") is None
+    assert "a" in cache and "c" in cache
+    stats = cache.stats()
+    print("Stats:", stats)
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+
+
+def test_ttl_expiry():
+    cache = DetailCache(ttl=0.05)
+    cache.set("a", {"fuel_type": "benzīns"})
+    assert cache.get("a") is not None
+    time.sleep(0.1)
+    assert "a" not in cache
+    assert cache.get("a") is None
+
+
+def test_persistence_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cache.json"
+        cache = DetailCache(path)
+        cache.set("a", {"fuel_type": "benzīns", "fields": {"Motors": "1.6 benzīns"}})
+        cache.set("b", {"fuel_type": "dīzelis", "fields": {}})
+        cache.save()
+
+        restored = DetailCache(path, max_size=1)
+        restored.load()
+        assert len(restored) == 1
+        assert restored.get("b")["fuel_type"] == "dīzelis"  # newest entry kept
+
+
+def test_restart_makes_no_detail_requests():
+    """A restarted bot with the same cache file does not refetch detail pages"""
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+
+    async def scrape(fake):
+        async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+            return await toyota.scrape_listings_async(fetcher)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cache.json"
+
+        toyota.detail_cache = DetailCache(path)
+        toyota.page_cache = PageCache()
+        toyota.source_state = {}
+        first = FakeSSLV()
+        items = asyncio.run(scrape(first))
+        toyota.detail_cache.save()
+        from_detail = [i for i in items if i["fuel_source"] == "detail"]
+        assert len(first.detail_urls()) == len(from_detail) > 0
+
+        # "Restart": fresh in-memory state, cache loaded from disk
+        toyota.detail_cache = DetailCache(path)
+        toyota.detail_cache.load()
+        toyota.page_cache = PageCache()
+        toyota.source_state = {}
+        second = FakeSSLV()
+        items_again = asyncio.run(scrape(second))
+
+        print(f"Detail requests before restart: {len(first.detail_urls())}, "
+              f"after restart: {len(second.detail_urls())}, stats: {toyota.detail_cache.stats()}")
+        assert second.detail_urls() == []
+        assert [i["fuel_type"] for i in items_again] == [i["fuel_type"] for i in items]
+        assert toyota.detail_cache.get(from_detail[0]["id"])["fields"]["Motors"] == "1.6 benzīns"
+
+
+if __name__ == "__main__":
+    test_lru_eviction_and_counters()
+    test_ttl_expiry()
+    test_persistence_round_trip()
+    test_restart_makes_no_detail_requests()
+    print("All detail cache tests passed")
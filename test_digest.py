@@ -0,0 +1,108 @@
+"""
+Offline test of digest notifications in toyota.py: one combined message
+per user per cycle, priority listings still sent on their own
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota
+from outbox import Outbox, drain_outbox, message_payload
+from telegram_dispatcher import NotificationDispatcher
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, kwargs.get("reply_markup")))
+
+
+def item(n, model="corolla"):
+    return {
+        "id": str(n), "title": f"Toyota {model.replace('-', ' ').title()} 1.6 benzīns {2000 + n % 20}", "description": "",
+        "price": f"{1000 + n} €", "link": f"https://www.ss.lv/msg/lv/transport/cars/toyota/{model}/{n}.html",
+        "is_defect": False, "fuel_type": "Benzīns",
+    }
+
+
+def setup(subscribers):
+    bot = RecordingBot()
+    toyota.DIGEST_MODE = True
+    toyota.subscribed_users = set(subscribers)
+    toyota.notification_outbox = Outbox()
+    toyota.notification_dispatcher = NotificationDispatcher(bot.send_message, global_rate=1000, per_chat_rate=1000)
+    return bot, SimpleNamespace(bot=bot)
+
+
+async def queue(items):
+    for listing in items:
+        msg, kb = await toyota.format_listing_message(listing)
+        digest = toyota.digest_entry(listing) if toyota.DIGEST_MODE and not toyota.is_priority(listing) else None
+        toyota.queue_for_subscribers(listing["id"], msg, reply_markup=kb, digest=digest)
+
+
+def test_burst_coalesced_per_user():
+    bot, app = setup(range(1, 21))
+    burst = [item(n) for n in range(15)] + [item(99, "land-cruiser")]
+
+    async def run():
+        await queue(burst)
+        first = await toyota.deliver_outbox(app)  # during the cycle: only the priority listing
+        toyota.release_digest()
+        second = await toyota.deliver_outbox(app)
+        return first, second
+
+    first, second = asyncio.run(run())
+    print(f"{len(burst)} listings x 20 users: {len(bot.sent)} messages instead of {len(burst) * 20}")
+
+    assert first["messages"] == 20 and "Land Cruiser" in bot.sent[0][1]
+    assert second["messages"] == 20 and second["sent"] == 15 * 20
+    assert len(bot.sent) * 8 == len(burst) * 20
+    digest_text, keyboard = bot.sent[-1][1], bot.sent[-1][2]
+    assert "15 jauni" in digest_text and "15. " in digest_text and len(digest_text) < 4096
+    assert len(keyboard.inline_keyboard) == 15
+    assert toyota.notification_outbox.counts()["sent"] == 16 * 20
+
+
+def test_large_digest_split_and_single_row_unchanged():
+    bot, app = setup([1])
+    asyncio.run(queue([item(n) for n in range(25)]))
+    toyota.release_digest()
+    asyncio.run(toyota.deliver_outbox(app))
+    assert [len(markup.inline_keyboard) for _, _, markup in bot.sent] == [20, 5]
+
+    bot, app = setup([1])
+    asyncio.run(queue([item(1)]))
+    toyota.release_digest()
+    asyncio.run(toyota.deliver_outbox(app))
+    assert bot.sent[0][1].startswith("🚗 <b>Toyota</b>")  # a lone listing keeps its normal message
+
+
+def test_held_rows_sent_after_hold_without_release():
+    outbox = Outbox()
+    outbox.enqueue("1", [1], message_payload("one"), digest={"line": "one"}, hold=0.1)
+    outbox.enqueue("2", [1], message_payload("two"), digest={"line": "two"}, hold=0.1)
+    assert outbox.claim_due() == []
+    assert 0 < outbox.next_due_in() <= 0.1
+
+    time.sleep(0.15)
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append(text)
+
+    def combine(deliveries):
+        return message_payload(" + ".join(d.digest["line"] for d in deliveries))
+
+    outcomes = asyncio.run(drain_outbox(outbox, NotificationDispatcher(send), combine=combine))
+    assert sent == ["one + two"] and outcomes["sent"] == 2
+
+
+if __name__ == "__main__":
+    test_burst_coalesced_per_user()
+    test_large_digest_split_and_single_row_unchanged()
+    test_held_rows_sent_after_hold_without_release()
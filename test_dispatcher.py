@@ -0,0 +1,157 @@
+"""
+Offline test of the rate-limited Telegram notification dispatcher
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import telegram.error
+
+import toyota_bot_fixed
+from bench_dispatcher import FakeTelegram
+from outbox import Outbox
+from telegram_dispatcher import DispatcherClosed, NotificationDispatcher
+
+
+def test_sustains_global_limit_without_flood_errors():
+    api = FakeTelegram()
+
+    async def run():
+        dispatcher = NotificationDispatcher(api.send_message)
+        dispatcher.broadcast(range(1, 57), text="listing")
+        await dispatcher.join()
+        return dispatcher.stats()
+
+    started = time.monotonic()
+    stats = asyncio.run(run())
+    elapsed = time.monotonic() - started
+    print(f"56 messages in {elapsed:.2f}s, {stats}")
+
+    assert api.flood_errors == 0
+    assert stats["sent"] == len(api.delivered) == 56
+    assert 20 < stats["throughput"] <= 30
+
+
+def test_per_chat_limit_and_order():
+    api = FakeTelegram(latency=0)
+
+    async def run():
+        dispatcher = NotificationDispatcher(api.send_message, per_chat_rate=10)
+        for i in range(4):
+            dispatcher.submit(7, text=f"m{i}")
+        await dispatcher.join()
+
+    asyncio.run(run())
+    times = [t for t, _, _ in api.delivered]
+    assert [text for _, _, text in api.delivered] == ["m0", "m1", "m2", "m3"]
+    assert all(b - a >= 0.09 for a, b in zip(times, times[1:]))
+
+
+def test_retry_after_only_delays_its_chat():
+    delivered = {}
+    flooded = set()
+
+    async def send(chat_id, text):
+        if chat_id == 1 and text == "first" and chat_id not in flooded:
+            flooded.add(chat_id)
+            raise telegram.error.RetryAfter(1)
+        delivered.setdefault(chat_id, []).append((time.monotonic(), text))
+
+    async def run():
+        dispatcher = NotificationDispatcher(send, per_chat_rate=100)
+        started = time.monotonic()
+        dispatcher.submit(1, text="first")
+        dispatcher.submit(1, text="second")
+        for chat_id in range(2, 12):
+            dispatcher.submit(chat_id, text="first")
+        await dispatcher.join()
+        return started, dispatcher.stats()
+
+    started, stats = asyncio.run(run())
+    others = [delivered[chat_id][0][0] - started for chat_id in range(2, 12)]
+    assert max(others) < 0.6
+    assert [text for _, text in delivered[1]] == ["first", "second"]
+    assert delivered[1][0][0] - started >= 1.0
+    assert stats["flood_waits"] == 1 and stats["retries"] == 1 and stats["failed"] == 0
+
+
+def test_blocked_chat_dropped():
+    blocked = []
+
+    async def send(chat_id, text):
+        if chat_id == 2:
+            raise telegram.error.Forbidden("bot was blocked by the user")
+        return text
+
+    async def run():
+        dispatcher = NotificationDispatcher(send, per_chat_rate=100, on_forbidden=blocked.append)
+        futures = [dispatcher.submit(chat_id, text=text) for text in ("a", "b") for chat_id in (1, 2)]
+        await dispatcher.join()
+        return futures, dispatcher.stats()
+
+    futures, stats = asyncio.run(run())
+    assert blocked == [2]
+    assert [f.result() for f in futures[0::2]] == ["a", "b"]
+    assert all(isinstance(f.exception(), telegram.error.Forbidden) for f in futures[1::2])
+    assert stats["sent"] == 2 and stats["failed"] == 2
+
+
+def test_bot_notifications_through_dispatcher():
+    api = FakeTelegram()
+    original = api.send_message
+
+    async def send_message(chat_id, text, **kwargs):
+        if chat_id == 99:
+            raise telegram.error.Forbidden("blocked")
+        return await original(chat_id, text, **kwargs)
+
+    api.send_message = send_message
+    toyota_bot_fixed.notification_outbox = Outbox()
+    toyota_bot_fixed.subscribed_users.clear()
+    toyota_bot_fixed.subscribed_users.update(range(1, 21))
+    toyota_bot_fixed.subscribed_users.add(99)
+    listings = [
+        {'title': f'Toyota Corolla {i}', 'price': '3 500 €', 'description': '',
+         'link': f'https://www.ss.lv/msg/lv/transport/cars/toyota/corolla/{i}.html'}
+        for i in range(2)
+    ]
+
+    asyncio.run(toyota_bot_fixed.send_notifications_async(SimpleNamespace(bot=api), listings))
+
+    assert api.flood_errors == 0
+    assert len(api.delivered) == 40
+    assert 99 not in toyota_bot_fixed.subscribed_users
+    assert toyota_bot_fixed.notification_outbox.counts() == {"sent": 40, "dead": 2, "dead_chats": 1}
+    toyota_bot_fixed.subscribed_users.clear()
+
+
+def test_close_fails_unsent_messages():
+    started = asyncio.Event()
+
+    async def hanging_send(chat_id, text):
+        started.set()
+        await asyncio.Event().wait()  # a request that never answers
+
+    async def run():
+        dispatcher = NotificationDispatcher(hanging_send, global_rate=1000, per_chat_rate=1000)
+        futures = [dispatcher.submit(1, text="in flight"), dispatcher.submit(1, text="queued")]
+        futures += dispatcher.broadcast([2, 3], text="waiting")
+        await started.wait()
+        await dispatcher.close()
+        await asyncio.wait_for(dispatcher.join(), 1)
+        return await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert len(results) == 4
+    assert all(isinstance(result, DispatcherClosed) for result in results)
+
+
+if __name__ == "__main__":
+    test_sustains_global_limit_without_flood_errors()
+    test_per_chat_limit_and_order()
+    test_retry_after_only_delays_its_chat()
+    test_blocked_chat_dropped()
+    test_bot_notifications_through_dispatcher()
+    test_close_fails_unsent_messages()
@@ -0,0 +1,81 @@
+"""
+Offline test of the cost-ordered filter stages: non-Toyota crash rows and
+Hilux / Land Cruiser rows must never trigger a detail request
+"""
+import sys
+import asyncio
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL
+
+
+def listing(**kwargs):
+    item = {"id": "1", "title": "", "price": "1 000 €", "link": "https://www.ss.lv/msg/lv/x.html",
+            "description": "", "is_defect": False, "car_make": "", "fuel_type": ""}
+    item.update(kwargs)
+    return item
+
+
+def test_row_stages():
+    hilux = listing(link="https://www.ss.lv/msg/lv/transport/cars/toyota/hilux/a.html")
+    golf = listing(is_defect=True, car_make="Volkswagen", title="Golf ar defektu")
+    yaris = listing(is_defect=True, car_make="Toyota", title="Yaris pēc avārijas")
+    corolla = listing(title="Corolla")
+
+    assert toyota.prefilter_row(hilux) is True
+    assert toyota.prefilter_row(golf) is False
+    assert toyota.prefilter_row(yaris) is None
+    assert toyota.prefilter_row(corolla) is None
+
+
+def test_filter_rules_unchanged():
+    hilux_diesel = listing(link="https://www.ss.lv/msg/lv/transport/cars/toyota/hilux/a.html", fuel_type="2.5 dīzelis")
+    corolla_petrol = listing(title="Corolla", fuel_type="1.6 benzīns")
+    corolla_diesel = listing(title="Corolla", fuel_type="2.0 dīzelis")
+    prius = listing(title="Prius", fuel_type="1.8 hibrīds")
+    toyota_defect_petrol = listing(is_defect=True, title="Toyota Yaris", fuel_type="1.3 benzīns")
+    toyota_defect_diesel = listing(is_defect=True, title="Toyota Avensis", fuel_type="2.0 dīzelis")
+    golf_defect_petrol = listing(is_defect=True, title="Golf", car_make="Volkswagen", fuel_type="1.6 benzīns")
+    fallback_petrol = listing(title="Auris benzīns")
+
+    kept = toyota.filter_benzina_toyotas([
+        hilux_diesel, corolla_petrol, corolla_diesel, prius, toyota_defect_petrol,
+        toyota_defect_diesel, golf_defect_petrol, fallback_petrol,
+    ])
+    assert kept == [hilux_diesel, corolla_petrol, toyota_defect_petrol, fallback_petrol]
+
+
+def test_no_enrichment_for_rows_decided_early():
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+    fake = FakeSSLV()
+
+    async def run():
+        async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+            return await toyota.scrape_listings_async(fetcher)
+
+    items = asyncio.run(run())
+    fetched = fake.detail_urls()
+    print(f"{len(items)} listings, {len(fetched)} detail requests: {fetched}")
+    print("Cycle report:", toyota.last_cycle_stats)
+
+    assert not any(("/volkswagen/" in u or "/bmw/" in u or "/audi/" in u) for u in fetched)
+    assert not any("/hilux/" in u or "/land-cruiser/" in u for u in fetched)
+    # Only the Toyota crash Yaris and the Auris with no engine value need a detail page
+    assert sorted(u.rsplit("/", 1)[-1] for u in fetched) == ["cbpndx.html", "kjobdx.html"]
+
+    kept = {i["id"] for i in toyota.filter_benzina_toyotas(items)}
+    assert "53712402" in kept      # Toyota Yaris from the crash page (make column)
+    assert "53712391" not in kept  # VW Golf from the crash page
+
+
+if __name__ == "__main__":
+    test_row_stages()
+    test_filter_rules_unchanged()
+    test_no_enrichment_for_rows_decided_early()
+    print("All filter stage tests passed")
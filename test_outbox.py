@@ -0,0 +1,179 @@
+"""
+Offline test of the durable notification outbox: one delivery per
+(listing, user), resume after a crash, precise pruning of blocked chats
+"""
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import telegram.error
+
+import toyota_bot_fixed
+from outbox import Outbox, drain_outbox, message_payload
+from telegram_dispatcher import NotificationDispatcher
+
+
+class RecordingBot:
+    """send_message recording deliveries; ``hang_after`` sends it never returns"""
+
+    def __init__(self, blocked=(), hang_after=None):
+        self.blocked = set(blocked)
+        self.hang_after = hang_after
+        self.delivered = []
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(chat_id)
+        if chat_id in self.blocked:
+            raise telegram.error.Forbidden("bot was blocked by the user")
+        if self.hang_after is not None and len(self.delivered) >= self.hang_after:
+            await asyncio.Event().wait()
+        self.delivered.append((chat_id, text))
+        return len(self.delivered)
+
+
+def dispatcher_for(bot):
+    return NotificationDispatcher(bot.send_message, global_rate=1000, per_chat_rate=1000, max_retries=0)
+
+
+def test_one_delivery_per_listing_and_user():
+    outbox = Outbox()
+    assert outbox.enqueue("tr_1", [1, 2], message_payload("a")) == 2
+    assert outbox.enqueue("tr_1", [1, 2, 3], message_payload("a again")) == 1
+    bot = RecordingBot()
+
+    asyncio.run(drain_outbox(outbox, dispatcher_for(bot)))
+    assert outbox.enqueue("tr_1", [1, 2, 3], message_payload("a")) == 0
+    asyncio.run(drain_outbox(outbox, dispatcher_for(bot)))
+
+    assert sorted(bot.delivered) == [(1, "a"), (2, "a"), (3, "a")]
+    assert outbox.counts()["sent"] == 3
+
+
+def test_restart_resumes_where_it_stopped():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "outbox.db"
+        outbox = Outbox(path)
+        for listing in ("tr_1", "tr_2", "tr_3"):
+            outbox.enqueue(listing, [1, 2], message_payload(listing))
+        first = RecordingBot(hang_after=4)
+
+        async def crash():
+            dispatcher = dispatcher_for(first)
+            try:
+                await asyncio.wait_for(drain_outbox(outbox, dispatcher), timeout=0.2)
+            except asyncio.TimeoutError:
+                await dispatcher.close()
+
+        asyncio.run(crash())
+        outbox.close()
+        assert len(first.delivered) == 4
+
+        restarted = Outbox(path)
+        second = RecordingBot()
+        outcomes = asyncio.run(drain_outbox(restarted, dispatcher_for(second)))
+
+        assert outcomes["sent"] == 2
+        assert sorted(first.delivered + second.delivered) == sorted(
+            (chat_id, listing) for listing in ("tr_1", "tr_2", "tr_3") for chat_id in (1, 2))
+        assert restarted.counts() == {"sent": 6, "dead_chats": 0}
+
+
+def test_blocked_chat_pruned():
+    outbox = Outbox()
+    for listing in ("tr_1", "tr_2", "tr_3"):
+        outbox.enqueue(listing, [1, 2], message_payload(listing))
+    bot = RecordingBot(blocked=[2])
+
+    outcomes = asyncio.run(drain_outbox(outbox, dispatcher_for(bot)))
+
+    assert bot.calls.count(2) == 1  # later messages to the dead chat are never sent
+    assert outcomes["sent"] == 3 and outcomes["dead"] == 3
+    assert outbox.counts() == {"sent": 3, "dead": 3, "dead_chats": 1}
+    assert outbox.enqueue("tr_4", [1, 2], message_payload("tr_4")) == 1
+
+    assert outbox.revive(2)
+    assert outbox.enqueue("tr_5", [1, 2], message_payload("tr_5")) == 2
+
+
+def test_failed_send_retried_then_given_up():
+    outbox = Outbox(max_attempts=2, retry_base=60)
+    outbox.enqueue("tr_1", [1], message_payload("a"))
+    attempts = []
+
+    async def send(chat_id, text):
+        attempts.append(chat_id)
+        raise telegram.error.TimedOut()
+
+    async def run():
+        dispatcher = NotificationDispatcher(send, max_retries=0)
+        first = await drain_outbox(outbox, dispatcher)
+        assert 59 < outbox.next_due_in() <= 60
+        assert not any((await drain_outbox(outbox, dispatcher)).values())  # not due yet
+        outbox.retry_base = 0
+        outbox._write("UPDATE deliveries SET next_attempt_at = 0")
+        second = await drain_outbox(outbox, dispatcher)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["retry"] == 1 and second["failed"] == 1
+    assert len(attempts) == 2
+    assert outbox.counts()["failed"] == 1 and outbox.next_due_in() is None
+
+
+def test_next_due_ignores_rows_in_flight():
+    outbox = Outbox(retry_base=30)
+    outbox.enqueue("tr_1", [1, 2], message_payload("a"))
+    outbox.claim_due(limit=1)
+    assert outbox.next_due_in() == 0  # the other row is due and not claimed
+    outbox.claim_due()
+    assert outbox.next_due_in() is None  # both in flight, nothing else pending
+    outbox.mark_retry("tr_1", 1, "timed out")
+    assert 29 < outbox.next_due_in() <= 30  # the retry, although chat 2 is still in flight
+
+
+def test_bot_queues_before_marking_seen():
+    toyota_bot_fixed.notification_outbox = Outbox()
+    toyota_bot_fixed.seen_listing_ids.clear()
+    toyota_bot_fixed.subscribed_users.clear()
+    toyota_bot_fixed.subscribed_users.update({1, 2})
+    original = toyota_bot_fixed.get_notification_dispatcher
+    listing = {
+        'id': 'tr_1', 'title': 'Toyota Corolla benzīns', 'price': '3 500 €', 'description': '',
+        'link': 'https://www.ss.lv/msg/lv/transport/cars/toyota/corolla/1.html',
+    }
+
+    def crash(bot):
+        raise RuntimeError("process killed")
+
+    toyota_bot_fixed.get_notification_dispatcher = crash
+    try:
+        asyncio.run(toyota_bot_fixed.process_source_listings(
+            SimpleNamespace(bot=None, bot_data={}), 'https://www.ss.lv/lv/transport/cars/toyota/sell/', [listing]))
+    except RuntimeError:
+        pass
+    finally:
+        toyota_bot_fixed.get_notification_dispatcher = original
+    assert 'tr_1' in toyota_bot_fixed.seen_listing_ids
+    assert toyota_bot_fixed.notification_outbox.counts()["pending"] == 2
+
+    bot = RecordingBot()
+    asyncio.run(toyota_bot_fixed.drain_outbox_job(SimpleNamespace(bot=bot)))
+    assert sorted(chat_id for chat_id, _ in bot.delivered) == [1, 2]
+    assert "NEW LISTING" in bot.delivered[0][1]
+
+    toyota_bot_fixed.subscribed_users.clear()
+    toyota_bot_fixed.seen_listing_ids.clear()
+    toyota_bot_fixed.notification_outbox = Outbox()
+
+
+if __name__ == "__main__":
+    test_one_delivery_per_listing_and_user()
+    test_restart_resumes_where_it_stopped()
+    test_blocked_chat_pruned()
+    test_failed_send_retried_then_given_up()
+    test_next_due_ignores_rows_in_flight()
+    test_bot_queues_before_marking_seen()
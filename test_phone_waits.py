@@ -0,0 +1,163 @@
+"""
+Offline test of the phone extraction waits: find_phone_on_page returns
+as soon as the revealed number is in the page or the page has settled,
+and never runs past PHONE_EXTRACTION_DEADLINE, page load included
+(simulated pages, no Chrome)
+"""
+import sys
+import time
+sys.path.insert(0, '.')
+
+from selenium.common.exceptions import TimeoutException
+
+import toyota_bot_fixed
+from browser_pool import PAGE_LOAD_TIMEOUT
+from toyota_bot_fixed import PAGE_STATE_JS, PAGE_WATCH_JS, find_phone_on_page
+
+PHONE = "+371 29123456"
+MASKED = "+371 29*** ***"
+
+
+class FakeElement:
+    def __init__(self, text, html):
+        self.text = text
+        self.html = html
+
+    def get_attribute(self, name):
+        return self.html
+
+
+class SimulatedPage:
+    """
+    WebDriver stand-in for a listing page with a "Parādīt tālruni" link:
+    - "xhr":      the reveal request answers after ``delay`` seconds
+    - "deferred": like "xhr", but the request starts 0.2 s after the click
+      (from a setTimeout)
+    - "captcha":  the reveal only changes the DOM (a CAPTCHA appears)
+    - "hang":     the reveal request never answers
+    ``load_time`` is how long the page itself takes to load.
+    """
+
+    def __init__(self, kind, delay=0.3, load_time=0.0):
+        self.kind = kind
+        self.delay = delay
+        self.load_time = load_time
+        self.page_load_timeout = PAGE_LOAD_TIMEOUT
+        self.pending = 0
+        self.last = time.monotonic()
+        self.start_at = None
+        self.answer_at = None
+        self.phone = None
+
+    def _update(self):
+        if self.start_at is not None and time.monotonic() >= self.start_at:
+            self.start_at = None
+            self.pending += 1
+            self.last = time.monotonic()
+            self.answer_at = self.last + self.delay
+        if self.answer_at is not None and time.monotonic() >= self.answer_at:
+            self.pending -= 1
+            self.last = self.answer_at
+            self.answer_at = None
+            self.phone = PHONE
+
+    def _show_phone(self):
+        if self.kind == "captcha":
+            self.last = time.monotonic()
+        elif self.kind == "deferred":
+            if self.start_at is None and self.answer_at is None and self.phone is None:
+                self.start_at = time.monotonic() + 0.2
+        elif self.answer_at is None and self.phone is None:
+            self.pending += 1
+            self.last = time.monotonic()
+            self.answer_at = self.last + self.delay if self.kind == "xhr" else float("inf")
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def get(self, url):
+        if self.load_time > self.page_load_timeout:
+            time.sleep(self.page_load_timeout)
+            raise TimeoutException("page load timed out")
+        time.sleep(self.load_time)
+
+    def find_element(self, by, selector):
+        return FakeElement("", "<body>")
+
+    def find_elements(self, by, selector):
+        if selector in ('[onclick*="phone"]', '.show_phone'):
+            return [FakeElement("Parādīt tālruni", '<a onclick="_show_phone(1, false);">Parādīt tālruni</a>')]
+        if "***" in selector:  # masked number lookups
+            return [FakeElement(MASKED, "<span>")]
+        return []
+
+    def execute_script(self, script, *args):
+        self._update()
+        if script == PAGE_WATCH_JS:
+            self.last = time.monotonic()
+        elif script == PAGE_STATE_JS:
+            return {"phone": self.phone, "pending": self.pending, "quiet": (time.monotonic() - self.last) * 1000}
+        elif "click()" in script or "_show_phone(1" in script:
+            self._show_phone()
+        return None
+
+
+def extract(page):
+    started = time.monotonic()
+    result = find_phone_on_page("http://127.0.0.1/listing.html", page)
+    return result, time.monotonic() - started
+
+
+def test_revealed_phone_returned_when_it_arrives():
+    page = SimulatedPage("xhr", delay=0.3)
+    phone, elapsed = extract(page)
+    print(f"revealed phone after {elapsed:.2f}s (fixed sleeps: 11.5s)")
+    assert phone == PHONE
+    assert 0.3 <= elapsed < 0.6
+
+
+def test_reveal_started_from_timer_not_missed():
+    phone, elapsed = extract(SimulatedPage("deferred", delay=0.3))
+    print(f"deferred reveal after {elapsed:.2f}s")
+    assert phone == PHONE
+    assert 0.5 <= elapsed < 0.8
+
+
+def test_captcha_page_given_up_once_settled():
+    phone, elapsed = extract(SimulatedPage("captcha"))
+    print(f"CAPTCHA page settled after {elapsed:.2f}s (fixed sleeps: 11.5s)")
+    assert phone == "Tālrunis pieejams (CAPTCHA nepieciešama)"
+    assert elapsed < 3
+
+
+def test_deadline_per_listing():
+    original = toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE
+    toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE = 1
+    try:
+        phone, elapsed = extract(SimulatedPage("hang"))
+    finally:
+        toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE = original
+    assert phone == "Tālrunis pieejams (CAPTCHA nepieciešama)"
+    assert 1 <= elapsed < 1.5
+
+
+def test_slow_page_load_within_deadline():
+    original = toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE
+    toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE = 2
+    page = SimulatedPage("hang", load_time=PAGE_LOAD_TIMEOUT)
+    try:
+        phone, elapsed = extract(page)
+    finally:
+        toyota_bot_fixed.PHONE_EXTRACTION_DEADLINE = original
+    print(f"page loading for {PAGE_LOAD_TIMEOUT}s given up after {elapsed:.2f}s")
+    assert phone == "Tālrunis pieejams (CAPTCHA nepieciešama)"
+    assert 2 <= elapsed < 2.5
+    assert page.page_load_timeout == PAGE_LOAD_TIMEOUT  # restored for the next job
+
+
+if __name__ == "__main__":
+    test_revealed_phone_returned_when_it_arrives()
+    test_reveal_started_from_timer_not_missed()
+    test_captcha_page_given_up_once_settled()
+    test_deadline_per_listing()
+    test_slow_page_load_within_deadline()
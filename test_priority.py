@@ -0,0 +1,127 @@
+"""
+Offline test of priority notifications: Hilux / Land Cruiser / defects
+overtake a backlog of ordinary messages instead of waiting behind it
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota
+from outbox import Outbox
+from telegram_dispatcher import NotificationDispatcher
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def item(n, model="corolla", price=3000, defect=False):
+    return {
+        "id": str(n), "title": f"Toyota {model} {n}", "description": "", "price": f"{price} €",
+        "link": f"https://www.ss.lv/msg/lv/transport/cars/toyota/{model}/{n}.html", "is_defect": defect,
+    }
+
+
+def test_listing_priority_rules():
+    assert toyota.listing_priority(item(1)) == 0
+    assert toyota.listing_priority(item(1, price=900)) == 3
+    assert toyota.listing_priority(item(1, defect=True)) == 5
+    assert toyota.listing_priority(item(1, "land-cruiser")) == 10
+    assert toyota.listing_priority(item(1, "hilux", price=900, defect=True)) == 18
+    assert toyota.is_priority(item(1, "hilux")) and not toyota.is_priority(item(1, defect=True))
+
+
+def test_priority_goes_before_queued_messages_of_a_chat():
+    bot = RecordingBot()
+
+    async def run():
+        dispatcher = NotificationDispatcher(bot.send_message, global_rate=1000, per_chat_rate=20)
+        for text in ("a", "b", "c"):
+            dispatcher.submit(1, text=text)
+        await asyncio.sleep(0.01)  # "a" sent, "b" waits for the chat's token
+        dispatcher.submit(1, priority=5, text="P")
+        dispatcher.submit(1, priority=5, text="Q")
+        await dispatcher.join()
+
+    asyncio.run(run())
+    assert [text for _, text, _ in bot.sent] == ["a", "P", "Q", "b", "c"]
+
+
+def first_priority_delay(backlog_listings):
+    """Seconds from queueing a Land Cruiser to its first delivery, behind ``backlog_listings`` x 20 messages"""
+    bot = RecordingBot()
+    toyota.subscribed_users = set(range(1, 21))
+    toyota.notification_outbox = Outbox()
+    toyota.notification_dispatcher = NotificationDispatcher(bot.send_message, global_rate=100, per_chat_rate=1000)
+
+    async def run():
+        toyota.outbox_wakeup = asyncio.Event()  # one per event loop
+        worker = asyncio.create_task(toyota.outbox_worker(SimpleNamespace(bot=bot)))
+        for n in range(backlog_listings):
+            toyota.queue_for_subscribers(str(n), f"ordinary {n}")
+        await asyncio.sleep(0.2)
+        queued = time.monotonic()
+        urgent = item(999, "land-cruiser")
+        toyota.queue_for_subscribers(urgent["id"], "urgent", priority=toyota.listing_priority(urgent))
+        while not any(text == "urgent" for _, text, _ in bot.sent):
+            await asyncio.sleep(0.01)
+        delay = min(at for _, text, at in bot.sent if text == "urgent") - queued
+        worker.cancel()
+        await toyota.notification_dispatcher.close()
+        return delay
+
+    return asyncio.run(run())
+
+
+def test_priority_delay_independent_of_backlog():
+    small, large = first_priority_delay(5), first_priority_delay(100)  # 100 vs 2000 queued messages
+    print(f"first priority delivery: {small * 1000:.0f} ms behind 100 messages, {large * 1000:.0f} ms behind 2000")
+    assert small < 0.5 and large < 0.5
+    assert toyota.notification_outbox.counts()["pending"] > 1000  # the backlog itself is far from sent
+
+
+def test_outbox_worker_bounds_and_cancels_drains():
+    running, started, cancelled = [], [], []
+    original = toyota.deliver_outbox
+
+    async def slow_deliver(app, min_priority=0):
+        started.append(min_priority)
+        running.append(min_priority)
+        try:
+            await asyncio.Event().wait()  # a long drain
+        except asyncio.CancelledError:
+            cancelled.append(min_priority)
+            raise
+        finally:
+            running.remove(min_priority)
+
+    async def run():
+        toyota.outbox_wakeup = asyncio.Event()
+        worker = asyncio.create_task(toyota.outbox_worker(SimpleNamespace()))
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            toyota.outbox_wakeup.set()  # new listings while the first drain runs
+        await asyncio.sleep(0.01)
+        assert sorted(running) == [0, 1]  # one drain of all rows, one of priority rows only
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    toyota.deliver_outbox = slow_deliver
+    try:
+        asyncio.run(run())
+    finally:
+        toyota.deliver_outbox = original
+    assert started == [0, 1] and sorted(cancelled) == [0, 1] and not running
+
+
+if __name__ == "__main__":
+    test_listing_priority_rules()
+    test_priority_goes_before_queued_messages_of_a_chat()
+    test_priority_delay_independent_of_backlog()
+    test_outbox_worker_bounds_and_cancels_drains()
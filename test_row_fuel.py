@@ -0,0 +1,68 @@
+"""
+Offline test of the list-row fuel fast path (no detail request when the
+engine column is unambiguous)
+"""
+import sys
+import asyncio
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL
+
+
+def test_classify_fuel_from_row():
+    cases = [
+        (["Corolla", "2008", "1.6", "245 tūkst.", "3 500 €"], "Corolla", "1.6 benzīns"),
+        (["Avensis", "2010", "2.0D", "310 tūkst.", "4 200 €"], "Avensis", "2.0 dīzelis"),
+        (["Prius", "2016", "1.8H", "280 tūkst.", "9 900 €"], "Prius", "1.8 hibrīds"),
+        (["2012", "2,5 D", "290 tūkst.", "14 500 €"], "Hilux", "2.5 dīzelis"),
+        (["Auris", "2013", "-", "120 tūkst.", "6 700 €"], "Auris", ""),          # no engine value
+        (["Toyota", "Yaris", "2009", "70", "1 200 €"], "Yaris", ""),             # crash page columns
+        (["C-HR", "2018", "1.8", "80 tūkst.", "17 000 €"], "C-HR hibrīds", ""),  # title contradicts
+        (["Yaris", "2015", "1.3X", "90 tūkst.", "7 000 €"], "Yaris", ""),        # unknown suffix
+        (["bZ4X", "2023", "E", "10 tūkst.", "35 000 €"], "bZ4X", "elektro"),    # electric: no volume
+    ]
+    for cells, text, expected in cases:
+        got = toyota.classify_fuel_from_row(cells, text)
+        print(f"{cells} / {text!r} -> {got!r}")
+        assert got == expected
+
+
+def test_detail_requests_only_for_ambiguous_rows():
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+    fake = FakeSSLV()
+
+    async def run():
+        async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+            return await toyota.scrape_listings_async(fetcher)
+
+    items = asyncio.run(run())
+    stats = toyota.last_cycle_stats
+    print(f"Fuel from list rows: {stats['fuel_from_row']}/{stats['listings']} "
+          f"({stats['fuel_from_row_share']:.0%}), detail requests: {len(fake.detail_urls())}")
+
+    by_id = {i["id"]: i for i in items}
+    assert by_id["53712398"]["fuel_type"] == "2.0 dīzelis"
+    assert by_id["53712398"]["fuel_source"] == "row"
+    assert by_id["53712288"]["fuel_source"] == "detail"  # Auris with "-" engine
+    assert stats["fuel_from_row"] == 6
+    row_links = {i["link"] for i in items if i["fuel_source"] == "row"}
+    assert not row_links & set(fake.detail_urls())
+
+    # The filter still sees the same decisions as with detail-page fuel
+    kept = {i["id"] for i in toyota.filter_benzina_toyotas(items)}
+    assert "53712410" in kept      # petrol Corolla
+    assert "53712398" not in kept  # diesel Avensis
+    assert "53712377" not in kept  # hybrid Prius
+    assert "53712350" in kept      # Hilux, any fuel
+
+
+if __name__ == "__main__":
+    test_classify_fuel_from_row()
+    test_detail_requests_only_for_ambiguous_rows()
+    print("All row fuel tests passed")
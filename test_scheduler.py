@@ -0,0 +1,106 @@
+"""
+Offline test of the adaptive per-source polling scheduler
+"""
+import sys
+import random
+sys.path.insert(0, '.')
+
+from poll_scheduler import PollScheduler
+import bench_scheduler
+
+HOT = "https://www.ss.lv/lv/transport/cars/toyota/sell/"
+QUIET = "https://www.ss.lv/lv/transport/other/transport-with-defects-or-after-crash/sell/"
+NOW = 1_000_000.0
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault("jitter", 0.0)
+    return PollScheduler([HOT, QUIET], **kwargs)
+
+
+def test_busier_source_polled_more_often():
+    scheduler = make_scheduler(target_latency=8, request_budget=400 / 3600)
+    scheduler.load_arrivals(HOT, [NOW - i * 180 for i in range(1, 60)], now=NOW)  # ~20/h
+    scheduler.load_arrivals(QUIET, [NOW - i * 900 for i in range(1, 12)], now=NOW)  # ~4/h
+
+    intervals = scheduler.base_intervals(NOW)
+    print("Intervals:", {url[-12:]: round(i, 1) for url, i in intervals.items()})
+
+    assert intervals[HOT] < intervals[QUIET]
+    # interval ∝ 1/sqrt(rate)
+    ratio = intervals[QUIET] / intervals[HOT]
+    expected = (scheduler.rate(HOT, NOW) / scheduler.rate(QUIET, NOW)) ** 0.5
+    assert abs(ratio - expected) < 0.01
+
+
+def test_request_budget_respected():
+    scheduler = make_scheduler(target_latency=1, request_budget=100 / 3600, min_interval=1)
+    for url in (HOT, QUIET):
+        scheduler.load_arrivals(url, [NOW - i * 60 for i in range(1, 150)], now=NOW)
+
+    per_hour = sum(3600 / i for i in scheduler.base_intervals(NOW).values())
+    assert per_hour <= 100 + 1e-6
+    print(f"✓ {per_hour:.0f} requests/h within a budget of 100")
+
+
+def test_quiet_hours_relax_polling():
+    scheduler = make_scheduler()
+    intervals = scheduler.base_intervals(NOW)
+    assert all(i == scheduler.max_interval for i in intervals.values())
+    print("✓ no arrivals → polled every", scheduler.max_interval, "s")
+
+
+def test_boost_after_hit():
+    scheduler = make_scheduler(target_latency=8, request_budget=400 / 3600, min_interval=1)
+    scheduler.load_arrivals(HOT, [NOW - i * 180 for i in range(1, 60)], now=NOW)
+
+    base = scheduler.base_intervals(NOW)[HOT]
+    boosted = scheduler.record_poll(HOT, new_listings=1, now=NOW)
+    assert abs(boosted - base / scheduler.boost_factor) < base * 0.05
+
+    later = NOW + scheduler.boost_duration + 1
+    assert scheduler.interval(HOT, later) > boosted
+    print(f"✓ interval {base:.1f}s → {boosted:.1f}s right after a hit")
+
+
+def test_due_and_next_poll():
+    scheduler = make_scheduler()
+    assert scheduler.due(NOW) == [HOT, QUIET]
+
+    interval = scheduler.record_poll(HOT, 0, now=NOW)
+    assert scheduler.due(NOW + 1) == [QUIET]
+    scheduler.record_poll(QUIET, 0, now=NOW)
+    assert scheduler.seconds_until_next(NOW) == interval
+
+
+def test_arrival_history_window():
+    scheduler = make_scheduler(window=3600)
+    scheduler.load_arrivals(HOT, [NOW - 7200, NOW - 10, NOW - 5], now=NOW)
+    assert scheduler.arrivals(HOT) == [NOW - 10, NOW - 5]
+
+
+def test_simulation_beats_fixed_interval():
+    """Fewer requests and lower median detection latency than fixed 20 s polling"""
+    days = 2
+    arrivals = bench_scheduler.generate_arrivals(days, random.Random(7))
+
+    fixed_requests, fixed_latencies = bench_scheduler.run_fixed(arrivals, days, random.Random(7))
+    adaptive_requests, adaptive_latencies = bench_scheduler.run_adaptive(arrivals, days)
+
+    fixed_median = sorted(fixed_latencies)[len(fixed_latencies) // 2]
+    adaptive_median = sorted(adaptive_latencies)[len(adaptive_latencies) // 2]
+    print(f"fixed: {fixed_requests} requests, median {fixed_median:.1f}s")
+    print(f"adaptive: {adaptive_requests} requests, median {adaptive_median:.1f}s")
+
+    assert adaptive_requests < fixed_requests
+    assert adaptive_median < fixed_median
+
+
+if __name__ == "__main__":
+    test_busier_source_polled_more_often()
+    test_request_budget_respected()
+    test_quiet_hours_relax_polling()
+    test_boost_after_hit()
+    test_due_and_next_poll()
+    test_arrival_history_window()
+    test_simulation_beats_fixed_interval()
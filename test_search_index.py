@@ -0,0 +1,125 @@
+"""
+Offline test of /search answered from the indexed listing snapshot
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+import bench_command_latency
+from bench_command_latency import make_update
+from listing_index import ListingIndex, SearchQuery, listing_features, listing_fuel, parse_search_query
+from fixtures.fake_sslv import read_fixture, TOYOTA_URL, DEFECTS_URL
+
+
+def fixture_listings():
+    return (toyota_bot_fixed.parse_listing_rows(read_fixture("toyota_list.html"), TOYOTA_URL)
+            + toyota_bot_fixed.parse_listing_rows(read_fixture("defects_list.html"), DEFECTS_URL))
+
+
+def titles(listings):
+    return [listing['title'].split()[0].strip(',') for listing in listings]
+
+
+def test_parse_search_query():
+    assert parse_search_query(["hilux", "<15000", "2010-"]) == SearchQuery(model="hilux", price_max=14999, year_min=2010)
+    assert parse_search_query(["land", "cruiser", "dīzelis", "5k-20k"]) == SearchQuery(
+        model="land cruiser", fuel="diesel", price_min=5000, price_max=20000)
+    assert parse_search_query(["avārija", "2005-2012", ">=1000"]) == SearchQuery(
+        defect=True, year_min=2005, year_max=2012, price_min=1000)
+    assert parse_search_query(["8000"]) == SearchQuery(price_max=8000)
+    assert parse_search_query([]).is_empty()
+
+    for bad in (["<cheap"], ["hilux", "?!"]):
+        try:
+            parse_search_query(bad)
+        except ValueError as e:
+            assert bad[-1] in str(e)
+        else:
+            raise AssertionError(f"{bad} accepted")
+
+
+def test_features_from_list_rows():
+    features = {listing['id']: listing_features(listing) for listing in fixture_listings()}
+    assert features['tr_53712398'] == {"model": "avensis", "fuel": "diesel", "defect": False, "year": 2010, "price": 4200}
+    assert features['tr_53712377']["fuel"] == "hybrid"
+    assert features['tr_53712366'] == {"model": "hilux", "fuel": "", "defect": True, "year": 2007, "price": 5000}
+    assert [listing_fuel({"engine": engine}) for engine in ("1,6", "2.0 D", "E", "1.3X", "-")] == [
+        "petrol", "diesel", "electric", "", ""]
+
+
+def test_index_search():
+    index = ListingIndex(fixture_listings())
+
+    assert titles(index.search(parse_search_query(["hilux"]))) == ["Hilux", "Hilux"]
+    assert titles(index.search(parse_search_query(["hilux", "<10000"]))) == ["Hilux"]
+    assert titles(index.search(parse_search_query(["toyota", "2010-", "dīzelis"]))) == []
+    assert titles(index.search(parse_search_query(["2010-", "dīzelis"]))) == ["Avensis", "Hilux", "Land"]
+    assert titles(index.search(parse_search_query(["defekts", "<1000"]))) == ["Golf", "BMW", "Audi"]
+    assert len(index.search(SearchQuery())) == len(index)
+
+
+def test_search_served_from_snapshot():
+    session = bench_command_latency.setup(page_delay=0.5)
+    toyota_bot_fixed.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    for url in toyota_bot_fixed.SS_LV_URLS:
+        session.delay = 0
+        toyota_bot_fixed.scrape_source(url, True)
+    session.delay = 0.5
+    session.sent.clear()
+
+    async def run():
+        durations = []
+        updates = []
+        for args in ([], ["hilux"], ["yaris", "2000-2010"], ["land", "cruiser"]):
+            update = make_update()
+            started = time.perf_counter()
+            await toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=args))
+            durations.append(time.perf_counter() - started)
+            updates.append(update)
+        return durations, updates
+
+    durations, updates = asyncio.run(run())
+    print(f"/search from snapshot: {max(durations) * 1000:.1f} ms max")
+
+    assert session.sent == []
+    assert max(durations) < 0.1
+    replies = [update.message.replies[-1][1] for update in updates]
+    # Same selection as the notifications: the 2.5D Hilux of the car section
+    # has no diesel keyword in its text, so filter_all_listings leaves it out
+    assert "(1 gab.)" in replies[1] and "🔎 hilux" in replies[1]
+    assert "Yaris" in replies[2] and "Corolla" not in replies[2]
+    assert "No new listings" in replies[3]
+    assert all("Updated" in reply for reply in replies)
+
+
+def test_index_rebuilt_after_page_change():
+    session = bench_command_latency.setup(page_delay=0)
+    toyota_bot_fixed.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    for url in toyota_bot_fixed.SS_LV_URLS:
+        toyota_bot_fixed.scrape_source(url, True)
+
+    first = toyota_bot_fixed.get_search_index()
+    assert toyota_bot_fixed.get_search_index() is first  # unchanged pages: no rebuild
+
+    toyota_bot_fixed.page_cache.invalidate(DEFECTS_URL)
+    toyota_bot_fixed.scrape_source(DEFECTS_URL, True)
+    assert toyota_bot_fixed.get_search_index() is not first
+
+
+def test_bad_arguments_get_usage():
+    bench_command_latency.setup(page_delay=0)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=["hilux", "<cheap"])))
+    assert "Usage: /search" in update.message.replies[-1][1]
+
+
+if __name__ == "__main__":
+    test_parse_search_query()
+    test_features_from_list_rows()
+    test_index_search()
+    test_search_served_from_snapshot()
+    test_index_rebuilt_after_page_change()
+    test_bad_arguments_get_usage()
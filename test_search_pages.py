@@ -0,0 +1,171 @@
+"""
+Offline test of paginated /search results: cursors with a TTL and
+Prev / Next buttons served from the cached result set
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+import bench_command_latency
+from bench_command_latency import make_update
+from listing_index import CursorStore
+from fixtures.fake_sslv import TOYOTA_URL, DEFECTS_URL
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+        self.edits = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.edits.append((text, reply_markup))
+
+
+def listing(n, title='benzīns *labā* stāvoklī'):
+    return {
+        'id': f'tr_{n}', 'title': f'Toyota Corolla_{n} {title}', 'price': f'{1000 + n} €',
+        'link': f'https://www.ss.lv/msg/lv/transport/cars/toyota/corolla/{n}.html', 'description': ' ',
+        'car_make': '', 'car_model': '', 'car_year': '2008', 'condition_pct': '', 'engine': '1.6',
+    }
+
+
+def load_snapshot(count, **kwargs):
+    session = bench_command_latency.setup(page_delay=0)
+    toyota_bot_fixed.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota_bot_fixed.source_listings.update({TOYOTA_URL: [listing(n, **kwargs) for n in range(count)], DEFECTS_URL: []})
+    toyota_bot_fixed.source_listings_version += 1
+    for url in toyota_bot_fixed.SS_LV_URLS:
+        toyota_bot_fixed.source_fetched_at[url] = time.monotonic()
+    return session
+
+
+def buttons(keyboard):
+    return [button for row in keyboard.inline_keyboard for button in row]
+
+
+def press(data):
+    callback = FakeCallbackQuery(data)
+    asyncio.run(toyota_bot_fixed.search_page_callback(SimpleNamespace(callback_query=callback), SimpleNamespace()))
+    return callback
+
+
+def test_cursor_store_pages_and_expiry():
+    store = CursorStore(ttl=0.05, max_size=2)
+    cursor = store.create(list(range(25)), header="x")
+    assert store.page(cursor, 2, 10) == ([20, 21, 22, 23, 24], 2, 3)
+    assert store.page(cursor, 9, 10)[1] == 2
+    assert store.get(cursor)["header"] == "x"
+
+    time.sleep(0.06)
+    assert store.page(cursor, 0, 10) is None and store.expired == 1
+
+    # With a size budget pages end early; an oversized result gets its own page
+    cursor = store.create([3, 3, 3, 9, 1, 1, 1, 1])
+    assert [store.page(cursor, n, 3, size=lambda x: x, budget=6)[0] for n in range(4)] == [
+        [3, 3], [3], [9], [1, 1, 1]]
+    assert store.page(cursor, 4, 3, size=lambda x: x, budget=6)[1:] == (4, 5)
+
+    ids = [store.create([i]) for i in range(3)]
+    assert store.get(ids[0]) is None and len(store) == 2 and store.evictions == 2
+
+
+def test_search_reply_is_one_page_with_navigation():
+    load_snapshot(35)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[])))
+
+    replies = [text for _, text in update.message.replies]
+    assert len(replies) == 1
+    text = replies[0]
+    assert "(35 gab.)" in text and "10. " in text and "11. " not in text
+    assert len(text) < 4096
+    assert "Corolla\\_0" in text and "\\*labā\\*" in text  # listing text escaped for Markdown
+
+    keyboard = update.message.markups[0]
+    labels = [button.text for button in buttons(keyboard)]
+    assert labels[-2:] == ["1/4", "Next ➡️"]
+    assert buttons(keyboard)[-1].callback_data.startswith("search:")
+
+
+def test_next_and_prev_served_from_cursor():
+    session = load_snapshot(35)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[])))
+    next_data = buttons(update.message.markups[0])[-1].callback_data
+
+    # Paging must not filter or scrape again
+    def no_filtering(listings):
+        raise AssertionError("filters recomputed")
+    original, toyota_bot_fixed.filter_all_listings = toyota_bot_fixed.filter_all_listings, no_filtering
+
+    try:
+        callback = press(next_data)
+        text, keyboard = callback.edits[0]
+        assert "11. " in text and "20. " in text and "(35 gab.)" in text
+        assert [button.text for button in buttons(keyboard)][-3:] == ["⬅️ Prev", "2/4", "Next ➡️"]
+
+        last = press(next_data.rsplit(":", 1)[0] + ":3")
+        text, keyboard = last.edits[0]
+        assert "35. " in text
+        assert [button.text for button in buttons(keyboard)][-2:] == ["⬅️ Prev", "4/4"]
+        assert session.sent == []
+    finally:
+        toyota_bot_fixed.filter_all_listings = original
+
+
+def test_expired_cursor_asks_for_new_search():
+    load_snapshot(15)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[])))
+    next_data = buttons(update.message.markups[0])[-1].callback_data
+
+    toyota_bot_fixed.search_cursors._entries.clear()
+    callback = press(next_data)
+    assert callback.edits == []
+    assert "expired" in callback.answers[0]
+
+    assert press("search:noop").answers == [None]
+
+
+def test_long_titles_make_shorter_pages():
+    load_snapshot(35, title="benzīns *labā* stāvoklī, " * 30)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=["corolla"])))
+    text = update.message.replies[0][1]
+    next_data = buttons(update.message.markups[0])[-1].callback_data
+
+    texts, page = [text], 1
+    while next_data.startswith("search:") and next_data != "search:noop":
+        text, keyboard = press(next_data).edits[0]
+        texts.append(text)
+        next_data = buttons(keyboard)[-1].callback_data
+        page += 1
+    print(f"{page} pages, longest {max(map(len, texts))} characters")
+    assert all(len(text) <= toyota_bot_fixed.TELEGRAM_MESSAGE_LIMIT for text in texts)
+    assert page > 4  # fewer than SEARCH_PAGE_SIZE listings per page
+    numbers = [int(line.split(".")[0]) for text in texts for line in text.split("\n") if line[:1].isdigit()]
+    assert numbers == list(range(1, 36))  # every listing once, numbered across pages
+
+
+def test_small_result_has_no_navigation():
+    load_snapshot(3)
+    update = make_update()
+    asyncio.run(toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[])))
+    labels = [button.text for button in buttons(update.message.markups[0])]
+    assert labels == ["🔗 Skatīt 1", "🔗 Skatīt 2", "🔗 Skatīt 3"]
+
+
+if __name__ == "__main__":
+    test_cursor_store_pages_and_expiry()
+    test_search_reply_is_one_page_with_navigation()
+    test_next_and_prev_served_from_cursor()
+    test_expired_cursor_asks_for_new_search()
+    test_long_titles_make_shorter_pages()
+    test_small_result_has_no_navigation()
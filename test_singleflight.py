@@ -0,0 +1,162 @@
+"""
+Offline test of single-flight scrapes: many /search calls at once (and the
+scheduled check) must not multiply the requests sent to ss.lv
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot
+import toyota_bot_fixed
+import bench_command_latency
+from bench_command_latency import make_update
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(time.monotonic())
+        await asyncio.sleep(0.1)
+        return ["listing"]
+
+    async def run():
+        flight = SingleFlight(max_age=5)
+        results = await asyncio.gather(*(flight.run("listings", work) for _ in range(10)))
+        later = await flight.run("listings", work)
+        return flight, results, later
+
+    flight, results, later = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results) and later is results[0]
+    assert flight.stats() == {"calls": 11, "started": 1, "joined": 9, "snapshot_hits": 1}
+
+
+def test_max_age_zero_only_joins_running_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        flight = SingleFlight(max_age=5)
+        first, joined = await asyncio.gather(flight.run("k", work), flight.run("k", work, max_age=0))
+        fresh = await flight.run("k", work, max_age=0)
+        return first, joined, fresh
+
+    first, joined, fresh = asyncio.run(run())
+    assert (first, joined, fresh) == (1, 1, 2)
+
+
+def test_failures_shared_but_not_kept():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("ss.lv down")
+
+    async def empty():
+        calls.append(1)
+        return None
+
+    async def run():
+        flight = SingleFlight(max_age=60)
+        results = await asyncio.gather(flight.run("k", failing), flight.run("k", failing), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert await flight.run("k", empty) is None
+        assert await flight.run("k", empty) is None
+        assert flight.snapshot_age("k") is None
+
+    asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def work():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def run():
+        flight = SingleFlight()
+        impatient = asyncio.create_task(flight.run("k", work))
+        patient = asyncio.create_task(flight.run("k", work))
+        await asyncio.sleep(0.02)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_fixed_bot_ten_searches_one_scrape():
+    session = bench_command_latency.setup(page_delay=0.1)
+    toyota_bot_fixed.subscribed_users.clear()
+    updates = [make_update(user_id) for user_id in range(10)]
+
+    async def run():
+        await asyncio.gather(*(
+            toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[])) for update in updates
+        ))
+        await toyota_bot_fixed.search_command(make_update(11), SimpleNamespace(bot_data={}, args=[]))
+
+    asyncio.run(run())
+    print(f"11 x /search → {len(session.sent)} requests, {toyota_bot_fixed.search_flight.stats()}")
+
+    assert len(session.sent) == len(toyota_bot_fixed.SS_LV_URLS)
+    assert all(len(update.message.replies) == 2 for update in updates)
+    assert len({update.message.replies[-1][1] for update in updates}) == 1
+
+
+def test_fixed_bot_search_reuses_scheduled_checks():
+    session = bench_command_latency.setup(page_delay=0)
+    for url in toyota_bot_fixed.SS_LV_URLS:
+        toyota_bot_fixed.scrape_source(url, True)
+    missing = toyota_bot_fixed.SS_LV_URLS[-1]
+    del toyota_bot_fixed.source_listings[missing]  # not checked yet
+    session.sent.clear()
+
+    asyncio.run(toyota_bot_fixed.search_command(make_update(), SimpleNamespace(bot_data={}, args=[])))
+    assert session.sent == [missing]
+    assert toyota_bot_fixed.last_scrape_stats["pages_reused"] == len(toyota_bot_fixed.SS_LV_URLS) - 1
+
+
+def test_toyota_bot_search_and_scheduled_check_share_scrape():
+    scrapes = []
+
+    def fake_scrape():
+        scrapes.append(1)
+        time.sleep(0.1)
+        return [{'id': 'tr_1', 'title': 'Toyota Corolla', 'price': '1 000 €', 'phone': 'N/A',
+                 'link': 'https://www.ss.lv/msg/1.html', 'description': 'Corolla 2005 1.6 benzīns'}]
+
+    toyota_bot.scrape_listings = fake_scrape
+    toyota_bot.scrape_flight = SingleFlight(max_age=toyota_bot.SEARCH_MAX_AGE)
+    bot = SimpleNamespace(send_message=None)
+    updates = [make_update(user_id) for user_id in range(5)]
+
+    async def run():
+        await asyncio.gather(
+            toyota_bot.scheduled_check(SimpleNamespace(bot=bot, bot_data={})),
+            *(toyota_bot.search_command(update, SimpleNamespace(bot_data={}, args=[])) for update in updates)
+        )
+        await toyota_bot.search_command(make_update(6), SimpleNamespace(bot_data={}, args=[]))  # fresh snapshot
+        await toyota_bot.scheduled_check(SimpleNamespace(bot=bot, bot_data={}))  # never a snapshot
+
+    asyncio.run(run())
+    assert len(scrapes) == 2
+    assert all(len(update.message.replies) == 2 for update in updates)
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_one_call()
+    test_max_age_zero_only_joins_running_call()
+    test_failures_shared_but_not_kept()
+    test_cancelled_caller_does_not_cancel_others()
+    test_fixed_bot_ten_searches_one_scrape()
+    test_fixed_bot_search_reuses_scheduled_checks()
+    test_toyota_bot_search_and_scheduled_check_share_scrape()
@@ -0,0 +1,146 @@
+"""
+Offline test of the per-source scheduled checks in toyota_bot_fixed: a hung
+or rate-limited source must not delay the others
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+from ss_fetcher import PageCache
+from outbox import Outbox
+from fixtures.fake_sslv import read_fixture, DEFECTS_URL
+
+HILUX_URL = 'https://www.ss.lv/lv/transport/cars/toyota/hilux/sell/'
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise toyota_bot_fixed.requests.exceptions.HTTPError(str(self.status_code))
+
+
+class SlowSession:
+    """Answers from the fixtures; ``delays`` / ``statuses`` per URL"""
+
+    def __init__(self, delays=None, statuses=None):
+        self.delays = delays or {}
+        self.statuses = statuses or {}
+        self.sent = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent.append(url)
+        time.sleep(self.delays.get(url, 0))
+        if url in self.statuses:
+            return FakeResponse(self.statuses[url])
+        if url == DEFECTS_URL:
+            return FakeResponse(200, read_fixture("defects_list.html"))
+        # Make the Corolla a petrol match for filter_all_listings
+        page = read_fixture("toyota_list.html").replace("Toyota Corolla,".encode(), "Toyota Corolla benzīns,".encode())
+        return FakeResponse(200, page)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((time.monotonic(), chat_id, text))
+
+
+def make_context(url, bot):
+    return SimpleNamespace(job=SimpleNamespace(data=url), bot=bot, bot_data={})
+
+
+def reset_state(session):
+    toyota_bot_fixed.http_session = session
+    toyota_bot_fixed.page_cache = PageCache()
+    toyota_bot_fixed.source_backoff_until.clear()
+    toyota_bot_fixed.sources_in_progress.clear()
+    toyota_bot_fixed.seen_listing_ids.clear()
+    toyota_bot_fixed.notification_outbox = Outbox()
+    toyota_bot_fixed.subscribed_users.clear()
+    toyota_bot_fixed.subscribed_users.add(1)
+    toyota_bot_fixed.wait_for_request_slot = lambda cancel=None: True
+
+
+def test_hung_source_does_not_delay_others():
+    session = SlowSession(delays={DEFECTS_URL: 1.0})
+    reset_state(session)
+    toyota_bot_fixed.SOURCE_CHECK_TIMEOUT = 0.5
+    bot = FakeBot()
+
+    async def run():
+        started = time.monotonic()
+        defects = asyncio.create_task(toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot)))
+        hilux = asyncio.create_task(toyota_bot_fixed.scheduled_check(make_context(HILUX_URL, bot)))
+        await hilux
+        hilux_done = time.monotonic() - started
+
+        # Next defects run while the first scrape is still hanging: skipped
+        await toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot))
+        await defects
+        defects_done = time.monotonic() - started
+        return hilux_done, defects_done, started
+
+    hilux_done, defects_done, started = asyncio.run(run())
+    print(f"Hilux check done after {hilux_done:.2f}s, defects gave up after {defects_done:.2f}s")
+
+    assert hilux_done < 0.3
+    assert bot.sent and bot.sent[0][0] - started < 0.3
+    assert 0.5 <= defects_done < 0.9
+    assert session.sent.count(DEFECTS_URL) == 1  # overlapping run was skipped
+
+
+def test_overlap_guard_released_after_hung_scrape_finishes():
+    session = SlowSession(delays={DEFECTS_URL: 0.3})
+    reset_state(session)
+    toyota_bot_fixed.SOURCE_CHECK_TIMEOUT = 0.1
+    bot = FakeBot()
+
+    async def run():
+        await toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot))
+        assert DEFECTS_URL in toyota_bot_fixed.sources_in_progress
+        await asyncio.sleep(0.4)
+        assert DEFECTS_URL not in toyota_bot_fixed.sources_in_progress
+        toyota_bot_fixed.SOURCE_CHECK_TIMEOUT = 5
+        await toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot))
+
+    asyncio.run(run())
+    assert session.sent.count(DEFECTS_URL) == 2
+
+
+def test_rate_limited_source_backs_off_without_sleeping():
+    session = SlowSession(statuses={DEFECTS_URL: 429})
+    reset_state(session)
+    toyota_bot_fixed.SOURCE_CHECK_TIMEOUT = 5
+    bot = FakeBot()
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(
+            toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot)),
+            toyota_bot_fixed.scheduled_check(make_context(HILUX_URL, bot)),
+        )
+        await toyota_bot_fixed.scheduled_check(make_context(DEFECTS_URL, bot))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    assert elapsed < 0.5
+    assert session.sent.count(DEFECTS_URL) == 1  # second run skipped by the backoff
+    assert toyota_bot_fixed.source_status[DEFECTS_URL] == 'backoff'
+    assert bot.sent
+    print(f"✓ 429 on defects page handled in {elapsed:.2f}s, Hilux alerts still sent")
+
+
+if __name__ == "__main__":
+    test_hung_source_does_not_delay_others()
+    test_overlap_guard_released_after_hung_scrape_finishes()
+    test_rate_limited_source_backs_off_without_sleeping()
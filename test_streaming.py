@@ -0,0 +1,157 @@
+"""
+Offline test of the per-listing streaming pipeline (fetch → classify →
+dedupe) used by toyota.monitor
+"""
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.insert(0, '.')
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL
+
+
+class SlowDetailSSLV(FakeSSLV):
+    """List pages answer at once, detail pages take ``detail_latency``"""
+
+    def __init__(self, detail_latency: float):
+        super().__init__()
+        self.detail_latency = detail_latency
+
+    async def handler(self, request):
+        if "/msg/" in str(request.url):
+            await asyncio.sleep(self.detail_latency)
+        return await super().handler(request)
+
+
+def reset_state(tmp: str):
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+    toyota.seen_listing_ids = set()
+    toyota.SEEN_FILE = Path(tmp) / "seen.json"
+
+
+async def scrape_batch(fake):
+    async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+        return await toyota.scrape_listings_async(fetcher)
+
+
+def test_stream_yields_same_listings_as_batch():
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_state(tmp)
+        fake = FakeSSLV()
+
+        async def run():
+            async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+                return [item async for item in toyota.stream_listings(fetcher)]
+
+        streamed = asyncio.run(run())
+
+        reset_state(tmp)
+        batch = asyncio.run(scrape_batch(FakeSSLV()))
+        assert sorted(i["id"] for i in streamed) == sorted(i["id"] for i in batch)
+        assert {i["id"]: i["fuel_type"] for i in streamed} == {i["id"]: i["fuel_type"] for i in batch}
+
+
+def test_first_new_listing_before_detail_pages_finish():
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_state(tmp)
+        fake = SlowDetailSSLV(detail_latency=0.5)
+
+        async def run():
+            arrivals = []
+            async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+                started = time.monotonic()
+                async for item in toyota.stream_new_listings(fetcher):
+                    arrivals.append((time.monotonic() - started, item["id"]))
+                total = time.monotonic() - started
+            return arrivals, total
+
+        arrivals, total = asyncio.run(run())
+        print(f"First new listing after {arrivals[0][0]:.2f}s, cycle finished after {total:.2f}s")
+        print("Arrivals:", [(f"{t:.2f}", i) for t, i in arrivals])
+
+        assert arrivals[0][0] < 0.2          # Hilux / petrol rows decided from the list page
+        assert total >= 0.5                  # detail pages still had to be fetched
+        assert "53712350" in [i for _, i in arrivals]  # Hilux
+        assert len(arrivals) == len(set(i for _, i in arrivals))
+
+
+def test_dedupe_across_cycles():
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_state(tmp)
+        fake = FakeSSLV()
+
+        async def run():
+            cycles = []
+            async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+                for _ in range(2):
+                    toyota.page_cache = PageCache()  # force re-parse
+                    cycle = []
+                    async for item in toyota.stream_new_listings(fetcher):
+                        toyota.mark_queued(item)
+                        cycle.append(item["id"])
+                    cycles.append(cycle)
+            return cycles
+
+        first, second = asyncio.run(run())
+        assert first and second == []
+        assert toyota.SEEN_FILE.exists()
+
+
+def test_listing_not_queued_is_retried():
+    """A listing whose enqueue failed is not marked seen and comes back next cycle"""
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_state(tmp)
+        fake = FakeSSLV()
+
+        async def run():
+            cycles = []
+            async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+                for n in range(3):
+                    cycle = []
+                    async for item in toyota.stream_new_listings(fetcher):
+                        cycle.append(item["id"])
+                        if n or item["id"] != "53712350":  # enqueue of the Hilux fails once
+                            toyota.mark_queued(item)
+                    cycles.append(cycle)
+            return cycles
+
+        first, second, third = asyncio.run(run())
+        assert "53712350" in first and second == ["53712350"] and third == []
+        assert "53712350" in toyota.seen_listing_ids
+        assert not toyota.source_state[TOYOTA_URL].get("retry")
+
+
+def test_poll_only_due_sources():
+    """The monitor polls just the sources its scheduler says are due"""
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_state(tmp)
+        fake = FakeSSLV()
+
+        async def run():
+            seen = []
+            async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+                async for _ in toyota.stream_new_listings(fetcher, [DEFECTS_URL], seen.append):
+                    pass
+            return seen
+
+        seen = asyncio.run(run())
+        assert TOYOTA_URL not in [url for _, url, _ in fake.requests]
+        assert seen and {item["source"] for item in seen} == {DEFECTS_URL}
+        assert toyota.last_cycle_stats["pages"] == 1
+
+
+if __name__ == "__main__":
+    test_stream_yields_same_listings_as_batch()
+    test_first_new_listing_before_detail_pages_finish()
+    test_dedupe_across_cycles()
+    test_listing_not_queued_is_retried()
+    test_poll_only_due_sources()
+    print("All streaming tests passed")
@@ -0,0 +1,140 @@
+"""
+Offline test of saved per-user filters and their inverted index
+"""
+import sys
+import random
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+from bench_command_latency import make_update
+from bench_filter_index import random_features, random_query
+from listing_index import ListingIndex, SearchQuery, parse_search_query
+from outbox import Outbox
+from subscriptions import SubscriptionIndex, parse_filters, scan_matches
+from fixtures.fake_sslv import read_fixture, TOYOTA_URL, DEFECTS_URL
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, reply_markup.inline_keyboard[0][0].url))
+
+
+def test_parse_filters():
+    assert parse_filters(["hilux", "<15000,", "land", "cruiser", "dīzelis"]) == [
+        SearchQuery(model="hilux", price_max=14999), SearchQuery(model="land cruiser", fuel="diesel")]
+    for bad in (["hilux,"], ["?!"], [",".join(["hilux"] * 6)]):
+        try:
+            parse_filters(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{bad} accepted")
+
+
+def test_index_matches_like_a_scan():
+    rng = random.Random(7)
+    filters = {user_id: [random_query(rng) for _ in range(rng.randint(1, 3))] for user_id in range(500)}
+    index = SubscriptionIndex()
+    for user_id, queries in filters.items():
+        index.set(user_id, queries)
+    for user_id in range(0, 500, 7):
+        del filters[user_id]
+        assert index.remove(user_id)
+    for user_id in range(1, 500, 50):
+        filters[user_id] = [random_query(rng)]
+        index.set(user_id, filters[user_id])
+
+    for _ in range(300):
+        features = random_features(rng)
+        assert index.match_features(features) == scan_matches(filters, features)
+
+    restored = SubscriptionIndex.from_dict(index.to_dict())
+    assert restored.stats() == index.stats()
+    features = {"model": "land cruiser", "fuel": "diesel", "defect": False, "year": 2008, "price": 9000}
+    assert restored.match_features(features) == index.match_features(features)
+
+
+def test_wide_and_open_price_ranges():
+    index = SubscriptionIndex()
+    index.set(1, [parse_search_query([">5000"])])
+    index.set(2, [parse_search_query(["1000-500k"])])
+    index.set(3, [parse_search_query(["hilux", "<3000"])])
+    features = {"model": "hilux", "fuel": "", "defect": False, "year": None, "price": 2999}
+    assert index.match_features(features) == {2, 3}
+    assert index.match_features(dict(features, price=5001)) == {1, 2}
+    assert index.match_features(dict(features, price=None)) == set()
+
+
+def test_notifications_follow_saved_filters():
+    toyota_bot_fixed.notification_outbox = Outbox()
+    toyota_bot_fixed.seen_listing_ids.clear()
+    toyota_bot_fixed.subscribed_users.clear()
+    toyota_bot_fixed.subscribed_users.update({1, 2, 3})
+    toyota_bot_fixed.subscription_index = SubscriptionIndex()
+    toyota_bot_fixed.subscription_index.set(2, parse_filters(["defekts", "<1000"]))
+    toyota_bot_fixed.subscription_index.set(3, parse_filters(["hilux"]))
+    pages = {
+        TOYOTA_URL: toyota_bot_fixed.parse_listing_rows(read_fixture("toyota_list.html"), TOYOTA_URL),
+        DEFECTS_URL: toyota_bot_fixed.parse_listing_rows(read_fixture("defects_list.html"), DEFECTS_URL),
+    }
+    everything = ListingIndex(pages[TOYOTA_URL] + pages[DEFECTS_URL])
+    bot = RecordingBot()
+
+    async def run():
+        context = SimpleNamespace(bot=bot, bot_data={})
+        for url, listings in pages.items():
+            await toyota_bot_fixed.process_source_listings(context, url, listings)
+        sent_first = list(bot.sent)
+        for url, listings in pages.items():
+            await toyota_bot_fixed.process_source_listings(context, url, listings)
+        return sent_first
+
+    sent_first = asyncio.run(run())
+
+    def links(chat_id):
+        return sorted(link for chat, link in bot.sent if chat == chat_id)
+
+    defaults = toyota_bot_fixed.filter_all_listings(pages[TOYOTA_URL] + pages[DEFECTS_URL])
+    assert links(1) == sorted(listing['link'] for listing in defaults)
+    assert links(2) == sorted(listing['link'] for listing in everything.search(parse_search_query(["defekts", "<1000"])))
+    assert links(3) == sorted(listing['link'] for listing in everything.search(parse_search_query(["hilux"])))
+    assert len(links(3)) == 2  # the diesel Hilux of the car section is not a default match
+    assert bot.sent == sent_first  # nothing new the second time
+
+
+def test_filter_command():
+    with tempfile.TemporaryDirectory() as tmp:
+        toyota_bot_fixed.FILTERS_FILE = Path(tmp) / "filters.json"
+        toyota_bot_fixed.subscription_index = SubscriptionIndex()
+
+        def command(*args):
+            update = make_update()
+            asyncio.run(toyota_bot_fixed.filter_command(update, SimpleNamespace(bot_data={}, args=list(args))))
+            return update.message.replies[-1][1]
+
+        assert "saved" in command("hilux", "<15000,", "yaris", "2005-")
+        user_id = make_update().effective_user.id
+        assert len(toyota_bot_fixed.subscription_index.get(user_id)) == 2
+
+        toyota_bot_fixed.subscription_index = SubscriptionIndex()
+        toyota_bot_fixed.load_filters()
+        assert "hilux, ≤14999 €" in command()
+
+        assert "Usage: /filter" in command("hilux", "<cheap")
+        assert "removed" in command("off")
+        assert user_id not in toyota_bot_fixed.subscription_index
+
+
+if __name__ == "__main__":
+    test_parse_filters()
+    test_index_matches_like_a_scan()
+    test_wide_and_open_price_ranges()
+    test_notifications_follow_saved_filters()
+    test_filter_command()
@@ -0,0 +1,109 @@
+"""
+Offline test of concurrent update handling: slow commands don't hold up
+other users, the updates of one chat stay in order, latency per handler
+"""
+import sys
+import time
+import asyncio
+sys.path.insert(0, '.')
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+
+from fixtures.fake_bot_api import FakeBotAPI
+from test_webhook import command_update
+from update_processing import PerChatUpdateProcessor
+
+SLOW = 0.5
+
+
+async def slow_command(update, context):
+    await asyncio.sleep(SLOW)
+    await update.message.reply_text(f"slow {update.update_id}")
+
+
+async def fast_command(update, context):
+    await update.message.reply_text(f"fast {update.update_id}")
+
+
+def run_updates(processor, updates, replies=None):
+    """Feed ``updates`` to an application; returns (fake API, {update_id: reply latency})"""
+    api = FakeBotAPI()
+    application = Application.builder().token("123456:TEST").request(api).concurrent_updates(processor).build()
+    application.add_handler(CommandHandler("slow", slow_command))
+    application.add_handler(CommandHandler("start", fast_command))
+    processor.track_commands(application)
+
+    async def run():
+        async with application:
+            await application.start()
+            started = time.monotonic()
+            for data in updates:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            while len(api.called("sendMessage")) < (len(updates) if replies is None else replies):
+                await asyncio.sleep(0.005)
+            await application.stop()
+        return {int(params["text"].split()[1]): at - started for at, params in api.called("sendMessage")}
+
+    return api, asyncio.run(run())
+
+
+def test_slow_commands_dont_block_others():
+    updates = [command_update(n, "/slow", user_id=n) for n in range(1, 6)]
+    updates += [command_update(n, "/start", user_id=n) for n in range(100, 400)]  # 300 users at once
+    processor = PerChatUpdateProcessor(16)
+    api, latency = run_updates(processor, updates)
+
+    fast = sorted(latency[n] for n in range(100, 400))
+    print(f"/start p95 {fast[int(len(fast) * 0.95)] * 1000:.0f} ms while 5 x /slow ({SLOW}s) run")
+    print(processor.summary())
+    assert fast[-1] < SLOW / 2  # none waited for a /slow
+    assert min(latency[n] for n in range(1, 6)) >= SLOW
+    assert processor.max_running <= 16
+    stats = processor.stats()
+    assert stats["/start"]["count"] == 300 and stats["/slow"]["p50"] >= SLOW
+
+
+def test_one_chat_strictly_in_order():
+    updates = [command_update(1, "/slow"), command_update(2, "/start"), command_update(3, "/slow"),
+               command_update(4, "/start")]
+    updates += [command_update(n, "/start", user_id=n) for n in range(100, 110)]
+    api, latency = run_updates(PerChatUpdateProcessor(8), updates)
+
+    replies = [params["text"] for _, params in api.called("sendMessage") if params["chat_id"] == 42]
+    assert replies == ["slow 1", "fast 2", "slow 3", "fast 4"]
+    assert latency[4] >= 2 * SLOW
+    assert max(latency[n] for n in range(100, 110)) < SLOW  # other chats didn't wait
+
+
+def test_unknown_commands_share_one_key():
+    updates = [command_update(n, f"/spam{n}", user_id=n) for n in range(1, 201)]
+    updates.append(command_update(500, "/start", user_id=500))
+    processor = PerChatUpdateProcessor(8)
+    run_updates(processor, updates, replies=1)  # stopping the application waits for the rest
+
+    stats = processor.stats()
+    assert set(stats) == {"/start", "/other"}
+    assert stats["/other"]["count"] == 200
+
+
+def test_concurrency_from_environment(monkeypatch):
+    monkeypatch.setenv("UPDATE_CONCURRENCY", "12")
+    assert PerChatUpdateProcessor().handler_limit == 12
+    monkeypatch.delenv("UPDATE_CONCURRENCY")
+    assert PerChatUpdateProcessor().handler_limit == 32
+
+
+def test_bad_concurrency_setting_does_not_stop_startup(monkeypatch):
+    monkeypatch.setenv("UPDATE_CONCURRENCY", "1")
+    assert PerChatUpdateProcessor().handler_limit == 2
+    monkeypatch.setenv("UPDATE_CONCURRENCY", "0")
+    assert PerChatUpdateProcessor().handler_limit == 2
+    monkeypatch.setenv("UPDATE_CONCURRENCY", "many")
+    assert PerChatUpdateProcessor().handler_limit == 32
+
+
+if __name__ == "__main__":
+    test_slow_commands_dont_block_others()
+    test_one_chat_strictly_in_order()
+    test_unknown_commands_share_one_key()
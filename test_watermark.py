@@ -0,0 +1,170 @@
+"""
+Offline test of watermark-based early termination: once a source has a
+watermark, the monitor only parses rows newer than it and stops reading
+the list page at the first known rows
+"""
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.insert(0, '.')
+
+import httpx
+
+import toyota
+from detail_cache import DetailCache
+from ss_fetcher import AsyncFetcher, PageCache
+from fixtures.fake_sslv import FakeSSLV, TOYOTA_URL, DEFECTS_URL, read_fixture
+
+
+NEWEST_ID = "53712410"
+
+
+class ChunkedSSLV(FakeSSLV):
+    """Serves list pages in small chunks and counts how many were read"""
+
+    CHUNK = 256
+
+    def __init__(self, pages=None):
+        super().__init__(pages=pages)
+        self.chunks_read = 0
+        self.chunks_total = 0
+
+    def respond(self, request, url):
+        if url not in self.pages:
+            return super().respond(request, url)
+        body = self.pages[url]
+        self.chunks_total = -(-len(body) // self.CHUNK)
+
+        async def chunks():
+            for i in range(0, len(body), self.CHUNK):
+                self.chunks_read += 1
+                yield body[i:i + self.CHUNK]
+
+        return httpx.Response(200, content=chunks())
+
+
+def reset_state():
+    toyota.SS_LV_URLS = [TOYOTA_URL, DEFECTS_URL]
+    toyota.detail_cache = DetailCache()
+    toyota.page_cache = PageCache()
+    toyota.source_state = {}
+
+
+def toyota_page_with_new_rows(*new_ids: str) -> bytes:
+    """Toyota fixture with copies of its newest row prepended under new IDs"""
+    page = read_fixture("toyota_list.html")
+    start = page.index(b'<tr id="tr_' + NEWEST_ID.encode())
+    end = page.index(b"</tr>", start) + len(b"</tr>")
+    row = page[start:end]
+    new_rows = b"\n".join(row.replace(NEWEST_ID.encode(), new_id.encode()) for new_id in new_ids)
+    return page[:start] + new_rows + b"\n" + page[start:]
+
+
+async def run_cycle(fake, only_changed):
+    async with AsyncFetcher(rate_per_host=100, transport=fake.transport()) as fetcher:
+        return await toyota.scrape_listings_async(fetcher, only_changed=only_changed)
+
+
+def test_full_scrape_sets_watermark():
+    reset_state()
+    asyncio.run(run_cycle(FakeSSLV(), only_changed=False))
+
+    assert toyota.source_state[TOYOTA_URL]["watermark"] == int(NEWEST_ID)
+    assert toyota.source_state[DEFECTS_URL]["watermark"] == 53712402
+    print("✓ full scrape records the newest listing ID per source")
+
+
+def test_only_new_rows_are_parsed():
+    reset_state()
+    asyncio.run(run_cycle(FakeSSLV(), only_changed=False))
+
+    fake = ChunkedSSLV(pages={TOYOTA_URL: toyota_page_with_new_rows("53712499", "53712450")})
+    items = asyncio.run(run_cycle(fake, only_changed=True))
+
+    assert [item["id"] for item in items] == ["53712499", "53712450"]
+    assert toyota.source_state[TOYOTA_URL]["watermark"] == 53712499
+    assert not toyota.source_state[TOYOTA_URL].get("gap")
+    print(f"✓ only the 2 new rows parsed, {fake.chunks_read} chunks read")
+
+
+def test_bumped_rows_above_new_rows():
+    reset_state()
+    asyncio.run(run_cycle(FakeSSLV(), only_changed=False))
+
+    # Two old ads bumped to the top, the new listings below them
+    page = toyota_page_with_new_rows("53700005", "53700001", "53712499", "53712450")
+    fake = ChunkedSSLV(pages={TOYOTA_URL: page})
+    items = asyncio.run(run_cycle(fake, only_changed=True))
+
+    assert [item["id"] for item in items] == ["53712499", "53712450"]
+    assert toyota.source_state[TOYOTA_URL]["watermark"] == 53712499
+    assert not toyota.source_state[TOYOTA_URL].get("gap")  # the watermark frontier was on page 1
+    assert fake.chunks_read < fake.chunks_total * 2
+    print("✓ bumped old rows don't stop the read before the new rows")
+
+
+def test_steady_state_stops_reading_early():
+    reset_state()
+    asyncio.run(run_cycle(FakeSSLV(), only_changed=False))
+    toyota.page_cache = PageCache()  # no ETag / hash shortcut, exercise the watermark
+
+    fake = ChunkedSSLV()
+    items = asyncio.run(run_cycle(fake, only_changed=True))
+
+    assert items == []
+    # Two pages, each abandoned after its first two rows
+    assert fake.chunks_read < fake.chunks_total * 2
+    print(f"✓ steady state: 0 rows parsed, {fake.chunks_read} chunks read")
+
+
+def test_gap_flag_when_first_page_is_all_new():
+    reset_state()
+    toyota.source_state = {TOYOTA_URL: {"watermark": 1000}, DEFECTS_URL: {"watermark": 1000}}
+
+    items = asyncio.run(run_cycle(ChunkedSSLV(), only_changed=True))
+
+    assert len(items) == 12
+    assert toyota.source_state[TOYOTA_URL]["gap"]["after"] == 1000
+    assert toyota.source_state[TOYOTA_URL]["watermark"] == int(NEWEST_ID)
+    print("✓ page with no known rows flags a gap")
+
+
+def test_failed_detail_holds_watermark_back():
+    reset_state()
+    toyota.source_state = {DEFECTS_URL: {"watermark": 1000}}
+    toyota.SS_LV_URLS = [DEFECTS_URL]
+
+    class NoDetailSSLV(ChunkedSSLV):
+        def respond(self, request, url):
+            if "/msg/" in url:
+                return httpx.Response(500)
+            return super().respond(request, url)
+
+    asyncio.run(run_cycle(NoDetailSSLV(), only_changed=True))
+
+    # The Yaris row (53712402) needs its detail page, so the mark stays below it
+    assert toyota.source_state[DEFECTS_URL]["watermark"] < 53712402
+    print("✓ watermark does not pass listings whose detail fetch failed")
+
+
+def test_source_state_persists():
+    reset_state()
+    with tempfile.TemporaryDirectory() as tmp:
+        toyota.SOURCES_FILE = Path(tmp) / "sources.json"
+        toyota.source_state = {TOYOTA_URL: {"watermark": 42}}
+        toyota.save_source_state()
+        toyota.source_state = {}
+        toyota.load_source_state()
+        assert toyota.source_state == {TOYOTA_URL: {"watermark": 42}}
+    print("✓ watermarks survive a restart")
+
+
+if __name__ == "__main__":
+    test_full_scrape_sets_watermark()
+    test_only_new_rows_are_parsed()
+    test_bumped_rows_above_new_rows()
+    test_steady_state_stops_reading_early()
+    test_gap_flag_when_first_page_is_all_new()
+    test_failed_detail_holds_watermark_back()
+    test_source_state_persists()
@@ -0,0 +1,114 @@
+"""
+Offline test of webhook mode: updates POSTed to the local webhook server
+are answered through a fake Bot API without any polling
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import socket
+sys.path.insert(0, '.')
+
+import httpx
+from telegram.ext import Application, CommandHandler
+
+import healthcheck
+import toyota_bot_fixed
+from fixtures.fake_bot_api import FakeBotAPI
+from webhook_server import SECRET_HEADER, default_secret, run_webhook
+
+TOKEN = "123456:TEST"
+WEBHOOK_URL = "https://bot.example.com/telegram"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def command_update(update_id, text, user_id=42):
+    user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text, "from": user,
+        "chat": {"id": user_id, "type": "private"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+    }}
+
+
+def test_commands_answered_through_webhook():
+    api = FakeBotAPI()
+    application = Application.builder().token(TOKEN).request(api).get_updates_request(api).build()
+    application.add_handler(CommandHandler("start", toyota_bot_fixed.start_command))
+    port = free_port()
+    secret = default_secret(TOKEN)
+    latencies = []
+
+    async def run():
+        stop = asyncio.Event()
+        bot = asyncio.create_task(run_webhook(application, WEBHOOK_URL, port=port, host="127.0.0.1", stop=stop))
+        while not api.called("setWebhook"):
+            await asyncio.sleep(0.01)
+        base = f"http://127.0.0.1:{port}"
+        async with httpx.AsyncClient(base_url=base) as client:
+            assert (await client.get("/health")).text == "ok"
+            wrong = await client.post("/telegram", content=json.dumps(command_update(1, "/start")),
+                                      headers={SECRET_HEADER: "guess"})
+            assert wrong.status_code == 403
+            assert (await client.post("/other", content=b"{}")).status_code == 404
+
+            for n in range(2, 12):
+                answered = len(api.called("sendMessage"))
+                started = time.monotonic()
+                response = await client.post("/telegram", content=json.dumps(command_update(n, "/start")),
+                                             headers={SECRET_HEADER: secret})
+                assert response.status_code == 200
+                while len(api.called("sendMessage")) == answered:
+                    await asyncio.sleep(0.001)
+                latencies.append(api.called("sendMessage")[-1][0] - started)
+        stop.set()
+        await bot
+
+    asyncio.run(run())
+    print(f"/start answered in {max(latencies) * 1000:.1f} ms at most")
+
+    webhook = api.called("setWebhook")[0][1]
+    assert webhook["url"] == WEBHOOK_URL and webhook["secret_token"] == secret and webhook["drop_pending_updates"]
+    assert not api.called("getUpdates")  # no polling at all
+    assert len(api.called("sendMessage")) == 10  # the rejected update was never handled
+    assert api.called("sendMessage")[0][1]["chat_id"] == 42 and 42 in toyota_bot_fixed.subscribed_users
+    assert max(latencies) < 0.1
+    assert not application.running
+
+
+def test_container_health_check_asks_webhook_server():
+    api = FakeBotAPI()
+    application = Application.builder().token(TOKEN).request(api).get_updates_request(api).build()
+    port = free_port()
+    original = {name: os.environ.get(name) for name in ("WEBHOOK_URL", "WEBHOOK_PORT")}
+    os.environ.update(WEBHOOK_URL=WEBHOOK_URL, WEBHOOK_PORT=str(port))
+
+    async def run():
+        stop = asyncio.Event()
+        bot = asyncio.create_task(run_webhook(application, WEBHOOK_URL, port=port, host="127.0.0.1", stop=stop))
+        while not api.called("setWebhook"):
+            await asyncio.sleep(0.01)
+        running = await asyncio.to_thread(healthcheck.main)
+        stop.set()
+        await bot
+        return running, await asyncio.to_thread(healthcheck.main)
+
+    try:
+        assert asyncio.run(run()) == (0, 1)  # healthy while serving, unhealthy once stopped
+    finally:
+        for name, value in original.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+if __name__ == "__main__":
+    test_commands_answered_through_webhook()
+    test_container_health_check_asks_webhook_server()
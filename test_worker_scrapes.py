@@ -0,0 +1,88 @@
+"""
+Offline test that toyota_bot_fixed keeps its event loop responsive while
+scraping: /search runs the scrape in a worker thread, with a timeout that
+cancels the remaining requests
+"""
+import sys
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import toyota_bot_fixed
+import bench_command_latency
+from bench_command_latency import SlowSession, make_update
+
+
+def test_commands_answered_during_search():
+    _, blocking = asyncio.run(bench_command_latency.measure(bench_command_latency.blocking_search, 0.2))
+    _, worker = asyncio.run(bench_command_latency.measure(toyota_bot_fixed.search_command, 0.2))
+    print(f"/start max latency: blocking {max(blocking) * 1000:.0f} ms, worker {max(worker) * 1000:.0f} ms")
+
+    assert max(blocking) > 0.3   # the old handler froze the loop for the whole scrape
+    assert max(worker) < 0.1
+
+
+def test_search_timeout_cancels_remaining_sources():
+    session = bench_command_latency.setup(page_delay=0.3)
+    toyota_bot_fixed.SEARCH_TIMEOUT = 0.1
+    update = make_update()
+
+    async def run():
+        await toyota_bot_fixed.search_command(update, SimpleNamespace(bot_data={}, args=[]))
+        await asyncio.sleep(0.5)  # let the worker reach its next checkpoint
+
+    asyncio.run(run())
+
+    assert "slowly" in update.message.replies[-1][1]
+    assert len(session.sent) < len(toyota_bot_fixed.SS_LV_URLS)
+    print(f"✓ search timed out after {len(session.sent)} of {len(toyota_bot_fixed.SS_LV_URLS)} pages")
+
+
+def test_cancelling_caller_sets_cancel_event():
+    seen = {}
+    started = threading.Event()
+
+    def blocking(cancel):
+        seen["cancel"] = cancel
+        started.set()
+        cancel.wait(2)
+        return cancel.is_set()
+
+    async def run():
+        task = asyncio.create_task(toyota_bot_fixed.run_in_worker(blocking, timeout=5))
+        await asyncio.to_thread(started.wait, 1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert seen["cancel"].is_set()
+
+
+def test_on_finished_runs_after_worker_returns():
+    finished = []
+
+    def slow(cancel):
+        time.sleep(0.2)
+
+    async def run():
+        try:
+            await toyota_bot_fixed.run_in_worker(slow, timeout=0.05, on_finished=lambda: finished.append(time.monotonic()))
+        except asyncio.TimeoutError:
+            timed_out = time.monotonic()
+        await asyncio.sleep(0.3)
+        return timed_out
+
+    timed_out = asyncio.run(run())
+    assert finished and finished[0] > timed_out
+
+
+if __name__ == "__main__":
+    test_commands_answered_during_search()
+    test_search_timeout_cancels_remaining_sources()
+    test_cancelling_caller_sets_cancel_event()
+    test_on_finished_runs_after_worker_returns()
@@ -16,14 +16,14 @@ import logging
 import asyncio
 import time
 import signal
-import random
 import re
 import json
+import hashlib
+import html
 from pathlib import Path
-from typing import List, Dict, Optional
-import requests
+from typing import AsyncIterator, Callable, List, Dict, Optional
 from bs4 import BeautifulSoup
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -31,9 +31,17 @@ from telegram.ext import (
     MessageHandler,
     filters
 )
-import telegram.error
 from dotenv import load_dotenv
 
+from detail_cache import DetailCache
+from poll_scheduler import PollScheduler
+from ss_fetcher import AsyncFetcher, PageCache, iter_rows
+from telegram_dispatcher import GROUP_RATE, NotificationDispatcher
+from bot_pool import BotPool
+from update_processing import PerChatUpdateProcessor
+from outbox import Delivery, Outbox, drain_outbox, message_payload
+from listing_parse import parse_engine, parse_price
+
 
 # Fix encoding for Windows
 if sys.platform == "win32":
@@ -47,12 +55,66 @@ load_dotenv()
 # CONFIG
 # ===========================================
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-CHECK_INTERVAL = 20  # base interval between checks
+# Адаптивный опрос (poll_scheduler.py): интервал каждого источника
+# подбирается по частоте новых объявлений на нём
+TARGET_DETECTION_LATENCY = 8  # средняя задержка обнаружения, сек
+REQUEST_BUDGET_PER_HOUR = 400  # запросов страниц списка в час на все источники
+MIN_POLL_INTERVAL = 10
+MAX_POLL_INTERVAL = 300
 REQUEST_TIMEOUT = 25
+
+# Async fetch engine: сколько запросов одновременно и сколько в секунду на хост
+FETCH_CONCURRENCY = 4
+FETCH_RATE_PER_HOST = 1.5
+FETCH_BURST = 3
 LOCK_FILE = Path("toyota_bot.lock")
 
 # File to persist already-seen listings between restarts
 SEEN_FILE = Path("toyota_seen.json")
+# Очередь уведомлений (listing, chat) на диске: переживает рестарт
+OUTBOX_FILE = Path("toyota_outbox.db")
+OUTBOX_IDLE_WAIT = 60  # сек: как часто outbox проверяется без новых объявлений
+# Дайджест: новые объявления одного цикла уходят подписчику одним сообщением
+# (по кнопке на объявление) вместо отдельного сообщения на каждое.
+# Приоритетные (от PRIORITY_SINGLE) всё равно уходят сразу и по одному.
+DIGEST_MODE = os.getenv("DIGEST_MODE", "false").lower() == "true"
+DIGEST_HOLD = 120  # сек: дайджест уходит в конце цикла, но не позже этого
+# Приоритет уведомления = сумма весов сработавших правил; уведомления с
+# большим приоритетом обгоняют уже стоящие в очереди обычные.
+# Правила: ("path", подстрока ссылки, вес), ("defect", True/False, вес),
+# ("price_below", евро, вес)
+PRIORITY_RULES = [
+    ("path", "/hilux/", 10),
+    ("path", "/land-cruiser/", 10),
+    ("defect", True, 5),
+    ("price_below", 1500, 3),
+]
+PRIORITY_SINGLE = 10  # с таким приоритетом объявление не ждёт дайджеста
+# Канал / группа (числовой ID, например -1001234567890): каждое объявление
+# публикуется туда один раз вместо личного сообщения каждому подписчику
+BROADCAST_CHAT_ID = int(os.getenv("BROADCAST_CHAT_ID", "0")) or None
+# Дополнительные токены ботов (через запятую): каждый со своим лимитом
+# Telegram, чат закреплён за одним ботом (bot_pool.py)
+EXTRA_BOT_TOKENS = [token.strip() for token in os.getenv("EXTRA_BOT_TOKENS", "").split(",") if token.strip()]
+
+# Persistent detail-page cache (fuel type + other fields) by listing ID
+DETAIL_CACHE_FILE = Path("toyota_detail_cache.json")
+DETAIL_CACHE_TTL = 3 * 24 * 3600  # seconds
+DETAIL_CACHE_MAX_SIZE = 5000
+
+# Водяные знаки источников (самый новый обработанный ID на каждой странице)
+SOURCES_FILE = Path("toyota_sources.json")
+# Сколько строк подряд с границы знака (по убыванию ID) нужно, чтобы
+# остановить разбор. Поднятые/VIP объявления наверху страницы старше знака,
+# но границей не считаются — под ними могут быть новые строки
+WATERMARK_STOP_AFTER = 2
+# Сколько самых новых обработанных ID источника помнить как «границу знака»
+WATERMARK_FRONTIER_SIZE = 30
+# Сколько циклов подряд повторять объявление, которое не удалось поставить в outbox
+QUEUE_RETRY_LIMIT = 5
+# Догон после простоя/всплеска: максимум страниц и сколько качать параллельно
+CATCHUP_MAX_PAGES = 10
+CATCHUP_CONCURRENCY = 2
 
 AUTO_NOTIFY = True
 
@@ -71,8 +133,21 @@ USER_AGENTS = [
 subscribed_users: set[int] = set()
 seen_listing_ids: set[str] = set()
 
-# In-memory cache для типа топлива: key = listing_id, value = fuel_type
-fuel_cache: Dict[str, str] = {}
+# Кэш detail-страниц на диске: key = listing_id, value = {"fuel_type", "fields"}
+detail_cache = DetailCache(DETAIL_CACHE_FILE, ttl=DETAIL_CACHE_TTL, max_size=DETAIL_CACHE_MAX_SIZE)
+
+# ETag / Last-Modified / хэш строк для каждой страницы списка
+page_cache = PageCache()
+# Последний разобранный результат каждой страницы (для неизменившихся страниц)
+source_items: Dict[str, List[Dict[str, str]]] = {}
+# Отчёт о последнем цикле скрапинга
+last_cycle_stats: Dict[str, float] = {}
+# Состояние источников:
+# {url: {"watermark": int, "gap": {"after": int, "next_page": int},
+#        "arrivals": [время обнаружения новых ID, ...]}}
+source_state: Dict[str, Dict] = {}
+# Планировщик опроса источников (создаётся в monitor)
+scheduler: Optional[PollScheduler] = None
 
 start_time = time.time()
 
@@ -101,6 +176,9 @@ def remove_lock_file():
 def signal_handler(signum, frame):
     remove_lock_file()
     save_seen_ids()
+    notification_outbox.close()
+    detail_cache.save()
+    save_source_state()
     sys.exit(0)
 
 
@@ -146,6 +224,30 @@ def save_seen_ids():
         logger.error(f"Failed to save seen IDs: {e}")
 
 
+def load_source_state():
+    """Load per-source watermarks so a restart continues incrementally."""
+    global source_state
+    if not SOURCES_FILE.exists():
+        return
+    try:
+        with open(SOURCES_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            source_state = data
+        logger.info(f"Loaded watermarks for {len(source_state)} sources")
+    except Exception as e:
+        logger.error(f"Failed to load source state: {e}")
+
+
+def save_source_state():
+    """Persist per-source watermarks to file."""
+    try:
+        with open(SOURCES_FILE, "w", encoding="utf-8") as f:
+            json.dump(source_state, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Failed to save source state: {e}")
+
+
 # ===========================================
 # SCRAPER HELPERS
 # ===========================================
@@ -175,103 +277,633 @@ def extract_fuel_type(soup: BeautifulSoup) -> str:
     return ""
 
 
-def get_fuel_type_from_detail(listing_id: str, link: str, session: requests.Session) -> str:
+# Топливо из колонки двигателя (listing_parse.parse_engine) в написании detail-страницы
+ROW_FUEL_NAMES = {
+    "petrol": "benzīns",
+    "diesel": "dīzelis",
+    "hybrid": "hibrīds",
+    "electric": "elektro",
+}
+HYBRID_MARKERS = ["hybrid", "hibr", "phev", "plug-in"]
+DIESEL_MARKERS = ["diesel", "dīzel", "dize", "d-4d", "d4d"]
+
+
+def classify_fuel_from_row(cells: List[str], text: str) -> str:
     """
-    Fetch fuel type from detail page.
-    Использует in-memory cache, чтобы не дергать одну и ту же страницу
-    каждые 20 секунд.
+    Быстрый путь: тип топлива по колонке объёма двигателя в строке списка.
+    Возвращает строку в формате detail-страницы ("1.6 benzīns") или "",
+    если значение неоднозначно (нет колонки, "-", конфликт с заголовком) —
+    тогда нужен запрос detail-страницы.
     """
-    if listing_id in fuel_cache:
-        return fuel_cache[listing_id]
+    engines = [parse_engine(c) for c in cells]
+    engines = [e for e in engines if e]
+    if len(engines) != 1:
+        return ""
 
-    try:
-        headers = {"User-Agent": random.choice(USER_AGENTS)}
-        resp = session.get(link, headers=headers, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
+    volume, fuel = engines[0]
+
+    # Обычный объём без суффикса, а в тексте гибрид/дизель — пусть решит detail-страница
+    text = text.lower()
+    if fuel == "petrol" and any(m in text for m in HYBRID_MARKERS + DIESEL_MARKERS):
+        return ""
 
-        # Небольшая задержка, чтобы не спамить ss.lv
-        time.sleep(random.uniform(0.3, 0.7))
+    return f"{volume} {ROW_FUEL_NAMES[fuel]}".strip()
 
+
+def extract_detail_fields(soup: BeautifulSoup) -> Dict[str, str]:
+    """
+    Все пары "название → значение" из таблицы параметров объявления
+    (td.ads_opt_name / td.ads_opt), например {"Motors": "1.6 benzīns"}.
+    """
+    fields: Dict[str, str] = {}
+    for td in soup.select("td.ads_opt_name"):
+        value_td = td.find_next_sibling("td", class_="ads_opt")
+        if value_td:
+            name = td.get_text(strip=True).rstrip(":")
+            fields[name] = value_td.get_text(" ", strip=True)
+    return fields
+
+
+async def get_fuel_type_from_detail(listing_id: str, link: str, fetcher: AsyncFetcher) -> str:
+    """
+    Fetch fuel type from detail page.
+    Использует персистентный detail_cache, чтобы не дергать одну и ту же
+    страницу каждые 20 секунд и после рестарта.
+    """
+    cached = detail_cache.get(listing_id)
+    if cached is not None:
+        return cached.get("fuel_type", "")
+
+    try:
+        resp = await fetcher.get(link)
         soup = BeautifulSoup(resp.content, "html.parser")
 
         fuel_text = extract_fuel_type(soup)
         fuel_text = fuel_text.strip()
-        fuel_cache[listing_id] = fuel_text
+        detail_cache.set(
+            listing_id,
+            {"fuel_type": fuel_text, "fields": extract_detail_fields(soup)},
+        )
         return fuel_text
     except Exception as e:
         logger.error(f"Error fetching detail page {link}: {e}")
-        # Пауза на ошибке, чтобы не ловить бан
-        time.sleep(1.0)
         return ""
 
 
-def scrape_listings() -> Optional[List[Dict[str, str]]]:
+def parse_row(row, url: str) -> Optional[Dict[str, str]]:
     """
-    Скрапит все страницы из SS_LV_URLS.
-    На этом уровне НЕ фильтруем объявления — только собираем данные.
+    Разбирает одну строку списка (tr id="tr_...") в объявление.
+    fuel_type заполняется из колонки двигателя, если он однозначен
+    (fuel_source="row"), иначе остаётся пустым до detail-запроса.
     """
-    all_items: List[Dict[str, str]] = []
-    session = requests.Session()
+    title_el = row.select_one("a.am")
+    if not title_el:
+        return None
 
-    for url in SS_LV_URLS:
-        try:
-            headers = {"User-Agent": random.choice(USER_AGENTS)}
-            resp = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-            resp.raise_for_status()
+    title = title_el.get_text(strip=True)
+    link = title_el.get("href")
+    if link and not link.startswith("http"):
+        link = "https://www.ss.lv" + link
+
+    listing_id = row.get("id", "").replace("tr_", "").strip()
+    if not listing_id:
+        listing_id = link  # safety fallback
+
+    details = " ".join(
+        td.get_text(strip=True) for td in row.select("td.msga2")
+    )
+
+    price_el = row.select("td.msga2-o.pp6")
+    price = price_el[-1].get_text(strip=True) if price_el else "N/A"
+
+    is_defect = "transport-with-defects" in url
+
+    cells = [td.get_text(strip=True) for td in price_el]
+    fuel_type = classify_fuel_from_row(cells, title + " " + details)
+
+    # На странице дефектов первая колонка — марка
+    car_make = cells[0] if is_defect and len(cells) >= 4 else ""
+
+    return {
+        "id": listing_id,
+        "title": title,
+        "price": price,
+        "link": link,
+        "description": details,
+        "is_defect": is_defect,
+        "car_make": car_make,
+        "fuel_type": fuel_type,
+        "fuel_source": "row" if fuel_type else "",
+        "source": url,
+    }
+
+
+def parse_list_page(content: bytes, url: str) -> List[Dict[str, str]]:
+    """
+    Разбирает одну страницу списка ss.lv в список объявлений.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    items = (parse_row(row, url) for row in soup.select('tr[id^="tr_"]'))
+    return [item for item in items if item]
+
+
+def parse_row_html(row_html: bytes, url: str) -> Optional[Dict[str, str]]:
+    """parse_row для одной строки, вырезанной из потока страницы"""
+    row = BeautifulSoup(row_html, "html.parser").find("tr")
+    return parse_row(row, url) if row else None
 
-            # Плавное поведение, чтобы не быть похожим на бота
-            time.sleep(random.uniform(0.8, 1.5))
 
-            soup = BeautifulSoup(resp.content, "html.parser")
-            rows = soup.select('tr[id^="tr_"]')
+def listing_number(listing_id: str) -> int:
+    """Числовой ID объявления ss.lv (0, если ID не числовой)"""
+    return int(listing_id) if listing_id.isdigit() else 0
 
-            for row in rows:
-                title_el = row.select_one("a.am")
-                if not title_el:
+
+async def fetch_source_rows_incremental(url: str, fetcher: AsyncFetcher) -> Optional[List[Dict[str, str]]]:
+    """
+    Инкрементальный разбор страницы списка по водяному знаку источника.
+
+    Страницы ss.lv отсортированы по дате (поднятие объявления её обновляет):
+    тело читается потоком, строки новее водяного знака собираются, а как
+    только подряд, по убыванию ID, встретились WATERMARK_STOP_AFTER строк с
+    границы знака (state["frontier"] — самые новые обработанные ID) — чтение
+    прекращается (остаток страницы даже не скачивается). Старые поднятые
+    строки пропускаются, не останавливая чтение. BeautifulSoup запускается
+    только для новых строк. None — новых объявлений с прошлого опроса нет.
+    """
+    state = source_state.setdefault(url, {})
+    watermark = state.get("watermark", 0)
+    # Состояние из версии без границы: границей считается любая строка не новее знака
+    frontier = set(state["frontier"]) if "frontier" in state else None
+    new_rows: List[bytes] = []
+    fingerprint = hashlib.sha1()
+    known_in_a_row = 0
+    previous_known = None
+    skipped = 0
+    reached_mark = False
+
+    async with fetcher.stream(url, headers=page_cache.conditional_headers(url)) as resp:
+        status_code, headers = resp.status_code, resp.headers
+        if status_code != 304:
+            async for listing_id, row_html in iter_rows(resp):
+                fingerprint.update(row_html)
+                number = listing_number(listing_id)
+                if watermark and number <= watermark:
+                    at_frontier = frontier is None or number in frontier
+                    if at_frontier and (not known_in_a_row or number < previous_known):
+                        known_in_a_row += 1
+                        previous_known = number
+                        if known_in_a_row >= WATERMARK_STOP_AFTER:
+                            reached_mark = True
+                            break
+                    else:
+                        # Поднятое старое объявление — новые строки могут быть ниже
+                        skipped += known_in_a_row + 1
+                        known_in_a_row = 0
                     continue
+                skipped += known_in_a_row  # одиночные известные строки между новыми
+                known_in_a_row = 0
+                new_rows.append(row_html)
 
-                title = title_el.get_text(strip=True)
-                link = title_el.get("href")
-                if link and not link.startswith("http"):
-                    link = "https://www.ss.lv" + link
+    # Хэш прочитанных строк нужен только для ETag-записи; изменением страницы
+    # здесь считается появление строк новее знака
+    changed = page_cache.update(url, status_code, headers, fingerprint=fingerprint.hexdigest())
+    if not changed or not new_rows:
+        return None
 
-                listing_id = row.get("id", "").replace("tr_", "").strip()
-                if not listing_id:
-                    listing_id = link  # safety fallback
+    # Граница знака на странице не встретилась (вся страница новее знака или
+    # поднятые строки вытеснили её) — часть новых объявлений могла уйти на page2+
+    if watermark and not reached_mark:
+        if skipped:
+            logger.info(f"{skipped} bumped rows above new listings of {url}, watermark not reached")
+        mark_gap(url, watermark)
 
-                details = " ".join(
-                    td.get_text(strip=True) for td in row.select("td.msga2")
-                )
+    items = (parse_row_html(row_html, url) for row_html in new_rows)
+    return [item for item in items if item]
 
-                price_el = row.select("td.msga2-o.pp6")
-                price = price_el[-1].get_text(strip=True) if price_el else "N/A"
 
-                is_defect = "transport-with-defects" in url
+def advance_watermark(url: str, items: List[Dict[str, str]], failed: List[Dict[str, str]]) -> None:
+    """
+    Сдвигает водяной знак источника на самое новое обработанное объявление.
+    Знак не проходит мимо объявлений, чьи detail-страницы не скачались,
+    чтобы в следующем цикле они разобрались снова.
+    """
+    numbers = [listing_number(item["id"]) for item in items]
+    if failed:
+        numbers = [n for n in numbers if n < min(listing_number(item["id"]) for item in failed)]
+    if not numbers:
+        return
+    state = source_state.setdefault(url, {})
+    state["watermark"] = max(state.get("watermark", 0), max(numbers))
+    frontier = set(state.get("frontier", [])) | set(numbers)
+    state["frontier"] = sorted(frontier, reverse=True)[:WATERMARK_FRONTIER_SIZE]
 
-                fuel_type = get_fuel_type_from_detail(listing_id, link, session)
 
-                all_items.append(
-                    {
-                        "id": listing_id,
-                        "title": title,
-                        "price": price,
-                        "link": link,
-                        "description": details,
-                        "is_defect": is_defect,
-                        "fuel_type": fuel_type,
-                    }
-                )
+def mark_gap(url: str, after: int) -> None:
+    """
+    Отмечает, что между знаком ``after`` и первой страницей источника могли
+    остаться объявления (всплеск публикаций или простой бота). Их дособирает
+    catch_up_pages; уже начатый догон не сбрасывается.
+    """
+    state = source_state.setdefault(url, {})
+    if "gap" not in state:
+        logger.warning(f"No known listings on first page of {url} — catching up to watermark {after}")
+        state["gap"] = {"after": after, "next_page": 2}
 
-        except Exception as e:
-            logger.error(f"SCRAPE ERROR for {url}: {e}")
-            time.sleep(2.0)
 
+def page_url(url: str, page: int) -> str:
+    """URL страницы ``page`` источника (ss.lv: .../sell/pageN.html)"""
+    return url if page == 1 else f"{url}page{page}.html"
+
+
+async def fetch_catchup_page(url: str, page: int, fetcher: AsyncFetcher) -> Optional[Dict]:
+    """
+    Скачивает и разбирает одну страницу догона.
+    Возвращает {"items", "has_next"} или None при ошибке.
+    """
+    try:
+        resp = await fetcher.get(page_url(url, page))
+    except Exception as e:
+        logger.error(f"CATCH-UP ERROR for {page_url(url, page)}: {e}")
+        return None
+    return {
+        "items": parse_list_page(resp.content, url),
+        "has_next": f"/page{page + 1}.html".encode() in resp.content,
+    }
+
+
+async def catch_up_pages(url: str, fetcher: AsyncFetcher) -> AsyncIterator[List[Dict[str, str]]]:
+    """
+    Догоняет источник с пропуском: идёт по page2.html, page3.html, ...
+    пачками по CATCHUP_CONCURRENCY страниц, пока не встретит объявление
+    не новее знака из source_state[url]["gap"], и отдаёт новые объявления
+    каждой пачки.
+
+    Контрольная точка (gap["next_page"]) сдвигается, только когда
+    потребитель запросил следующую пачку, т.е. обработал предыдущую.
+    Прерванный догон (ошибка, break, перезапуск) продолжается с неё.
+    """
+    state = source_state.get(url, {})
+    gap = state.get("gap")
+    if not gap:
+        return
+
+    after = gap["after"]
+    crawled = 0
+    while gap["next_page"] <= CATCHUP_MAX_PAGES:
+        first = gap["next_page"]
+        batch = range(first, min(first + CATCHUP_CONCURRENCY, CATCHUP_MAX_PAGES + 1))
+        pages = await asyncio.gather(*(fetch_catchup_page(url, n, fetcher) for n in batch))
+
+        new_items: List[Dict[str, str]] = []
+        next_page = first
+        finished = False
+        for page in pages:
+            if page is None:
+                break
+            next_page += 1
+            for item in page["items"]:
+                if listing_number(item["id"]) > after:
+                    item["catch_up"] = True
+                    new_items.append(item)
+            if not page["items"] or not page["has_next"] or any(
+                listing_number(item["id"]) <= after for item in page["items"]
+            ):
+                finished = True
+                break
+
+        crawled += next_page - first
+        if new_items:
+            yield new_items
+        gap["next_page"] = next_page
+
+        if finished:
+            logger.info(f"Catch-up of {url} done: {crawled} pages after watermark {after}")
+            del state["gap"]
+            return
+        if next_page < first + len(batch):
+            return  # страница не скачалась — продолжим со следующего цикла
+
+    logger.warning(f"Catch-up of {url} stopped at {CATCHUP_MAX_PAGES} pages, watermark {after} not reached")
+    del state["gap"]
+
+
+async def fetch_source_page(
+    url: str, fetcher: AsyncFetcher, only_changed: bool = False
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Условно запрашивает страницу списка (ETag / Last-Modified / хэш строк)
+    и разбирает её. Если страница не изменилась — BeautifulSoup не
+    запускается и возвращается None при only_changed, иначе прошлый
+    результат этой страницы.
+
+    При only_changed и известном водяном знаке разбираются только строки
+    новее знака (fetch_source_rows_incremental).
+    """
+    try:
+        if only_changed and source_state.get(url, {}).get("watermark"):
+            return await fetch_source_rows_incremental(url, fetcher)
+        resp = await fetcher.get_if_changed(url, page_cache)
+        if resp is None:
+            return None if only_changed else source_items.get(url, [])
+        return parse_list_page(resp.content, url)
+    except Exception as e:
+        logger.error(f"SCRAPE ERROR for {url}: {e}")
+        page_cache.invalidate(url)
+        return []
+
+
+def needs_detail(item: Dict[str, str]) -> bool:
+    """
+    Detail-страница нужна только строкам, которые пережили дешёвые стадии
+    фильтра и у которых топливо не определилось по списку.
+    """
+    return not item["fuel_type"] and prefilter_row(item) is None
+
+
+async def enrich_listing(item: Dict[str, str], fetcher: AsyncFetcher) -> Dict[str, str]:
+    item["fuel_type"] = await get_fuel_type_from_detail(item["id"], item["link"], fetcher)
+    item["fuel_source"] = "detail"
+    return item
+
+
+def finish_source(
+    url: str, items: List[Dict[str, str]], enriched: List[Dict[str, str]], only_changed: bool = False
+) -> None:
+    # Если какие-то detail-страницы не скачались, в следующий раз
+    # разбираем страницу заново, а не считаем её неизменившейся
+    failed = [item for item in enriched if item["id"] not in detail_cache]
+    if failed:
+        page_cache.invalidate(url)
+    watermark = source_state.get(url, {}).get("watermark")
+    if not only_changed and watermark and all(listing_number(item["id"]) > watermark for item in items):
+        mark_gap(url, watermark)
+    advance_watermark(url, items, failed)
+    # Инкрементальный разбор даёт только новые строки — это не вся страница
+    if not only_changed:
+        source_items[url] = items
+
+
+async def enrich_items(
+    items: List[Dict[str, str]], fetcher: AsyncFetcher, emit: Optional[Callable] = None
+) -> List[Dict[str, str]]:
+    """
+    Параллельно тянет detail-страницы для строк, которым они нужны.
+    emit(item) вызывается для каждого объявления, как только оно готово:
+    решённые по списку — сразу, остальные — по приходу своей detail-страницы.
+    Возвращает объявления, для которых запрашивались detail-страницы.
+    """
+    need_detail = []
+    for item in items:
+        if needs_detail(item):
+            need_detail.append(item)
+        elif emit:
+            emit(item)
+
+    async def enrich_and_emit(item):
+        await enrich_listing(item, fetcher)
+        if emit:
+            emit(item)
+
+    await asyncio.gather(*(enrich_and_emit(item) for item in need_detail))
+    return need_detail
+
+
+async def catch_up_source(url: str, fetcher: AsyncFetcher, emit: Callable) -> None:
+    """
+    Прогоняет объявления догона (catch_up_pages) через тот же конвейер.
+    Если у пачки не скачались detail-страницы, догон прерывается до
+    следующего цикла, не сдвигая контрольную точку.
+    """
+    async for items in catch_up_pages(url, fetcher):
+        enriched = await enrich_items(items, fetcher, emit)
+        if any(item["id"] not in detail_cache for item in enriched):
+            break
+
+
+async def scrape_source(url: str, fetcher: AsyncFetcher, only_changed: bool = False) -> Optional[List[Dict[str, str]]]:
+    """
+    Скрапит одну страницу списка и параллельно тянет detail-страницы
+    (параллелизм и частоту запросов ограничивает fetcher).
+    None — страница не изменилась (только при only_changed).
+    При only_changed ещё и догоняет пропуск за первой страницей.
+    """
+    items = await fetch_source_page(url, fetcher, only_changed)
+    if items:
+        finish_source(url, items, await enrich_items(items, fetcher), only_changed)
+
+    if only_changed and source_state.get(url, {}).get("gap"):
+        caught: List[Dict[str, str]] = []
+        await catch_up_source(url, fetcher, caught.append)
+        if caught:
+            items = (items or []) + caught
+    return items
+
+
+def create_fetcher() -> AsyncFetcher:
+    return AsyncFetcher(
+        concurrency=FETCH_CONCURRENCY,
+        rate_per_host=FETCH_RATE_PER_HOST,
+        burst=FETCH_BURST,
+        timeout=REQUEST_TIMEOUT,
+        user_agents=USER_AGENTS,
+    )
+
+
+def record_cycle_stats(
+    all_items: List[Dict[str, str]], skipped: int, requests: int, started: float, pages: Optional[int] = None
+) -> None:
+    """Заполняет last_cycle_stats и пишет отчёт о цикле в лог"""
+    from_row = sum(1 for item in all_items if item.get("fuel_source") == "row")
+    decided_by_row = sum(1 for item in all_items if prefilter_row(item) is not None)
+    row_share = from_row / len(all_items) if all_items else 0.0
+    pages = len(SS_LV_URLS) if pages is None else pages
+
+    last_cycle_stats.clear()
+    last_cycle_stats.update(
+        {
+            "pages": pages,
+            "pages_skipped": skipped,
+            "listings": len(all_items),
+            "fuel_from_row": from_row,
+            "fuel_from_row_share": row_share,
+            "decided_by_row": decided_by_row,
+            "requests": requests,
+            "seconds": time.monotonic() - started,
+        }
+    )
+    logger.info(
+        f"Cycle report: {len(all_items)} listings from {pages} pages "
+        f"({skipped} unchanged, skipped) in {last_cycle_stats['seconds']:.1f}s, "
+        f"{requests} requests, "
+        f"fuel from list rows {from_row}/{len(all_items)} ({row_share:.0%}), "
+        f"{decided_by_row} decided by row checks alone"
+    )
+
+
+async def scrape_listings_async(
+    fetcher: Optional[AsyncFetcher] = None, only_changed: bool = False
+) -> List[Dict[str, str]]:
+    """
+    Скрапит все страницы из SS_LV_URLS одновременно.
+    На этом уровне НЕ фильтруем объявления — только собираем данные.
+    Порядок результата тот же: по SS_LV_URLS, внутри — как на странице.
+
+    only_changed=True — вернуть объявления только с изменившихся страниц
+    (для мониторинга: неизменившиеся страницы не разбираются и не фильтруются).
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = create_fetcher()
+
+    started = time.monotonic()
+    sent_before = fetcher.requests_sent
+    try:
+        per_source = await asyncio.gather(
+            *(scrape_source(url, fetcher, only_changed) for url in SS_LV_URLS)
+        )
+    finally:
+        if own_fetcher:
+            await fetcher.close()
+
+    all_items: List[Dict[str, str]] = [item for items in per_source if items for item in items]
+    skipped = sum(1 for items in per_source if items is None)
+    record_cycle_stats(all_items, skipped, fetcher.requests_sent - sent_before, started)
     return all_items
 
 
+async def stream_listings(
+    fetcher: AsyncFetcher, only_changed: bool = False, urls: Optional[List[str]] = None
+) -> AsyncIterator[Dict[str, str]]:
+    """
+    Потоковый вариант scrape_listings_async: каждое объявление отдаётся,
+    как только его данные готовы — строки, решённые по списку, сразу после
+    разбора страницы, остальные — по мере прихода своих detail-страниц.
+    Порядок — по готовности, а не по странице.
+
+    urls — какие источники опрашивать (по умолчанию все SS_LV_URLS).
+    """
+    urls = SS_LV_URLS if urls is None else urls
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    skipped = 0
+    started = time.monotonic()
+    sent_before = fetcher.requests_sent
+
+    async def produce(url: str):
+        nonlocal skipped
+        items = await fetch_source_page(url, fetcher, only_changed)
+        if items is None:
+            skipped += 1
+        elif items:
+            finish_source(url, items, await enrich_items(items, fetcher, queue.put_nowait), only_changed)
+
+        if only_changed and source_state.get(url, {}).get("gap"):
+            await catch_up_source(url, fetcher, queue.put_nowait)
+
+    async def produce_all():
+        try:
+            await asyncio.gather(*(produce(url) for url in urls))
+        finally:
+            queue.put_nowait(done)
+
+    producer = asyncio.create_task(produce_all())
+    emitted: List[Dict[str, str]] = []
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            emitted.append(item)
+            yield item
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+        record_cycle_stats(emitted, skipped, fetcher.requests_sent - sent_before, started, len(urls))
+
+
+def scrape_listings() -> Optional[List[Dict[str, str]]]:
+    """
+    Синхронная обёртка над scrape_listings_async (для скриптов и тестов).
+    """
+    return asyncio.run(scrape_listings_async())
+
+
 # ===========================================
 # FILTERING LOGIC (FINAL)
 # ===========================================
+# Правила разбиты на стадии по стоимости. Дешёвые стадии смотрят только
+# на строку списка (URL, колонка марки, заголовок) и выполняются до любых
+# detail-запросов; стадия топлива — после обогащения, и только для строк,
+# которые дешёвые стадии не решили.
+# Каждая стадия возвращает True (взять), False (отбросить) или None (дальше).
+
+PETROL_KEYWORDS = ["benz", "benzin", "benzīn", "benzīns", "petrol", "gas"]
+DIESEL_KEYWORDS = ["diesel", "dīze", "dize", "dīzel", "d-4d", "d4d", "tdi", "dci"]
+HYBRID_KEYWORDS = ["hybrid", "hibr", "phev", "plug-in"]
+
+
+def stage_model_path(item: Dict[str, str]) -> Optional[bool]:
+    """Hilux / Land Cruiser → ALL (any fuel), decided by URL path"""
+    link = item["link"].lower()
+    if "/hilux/" in link or "/land-cruiser/" in link:
+        return True
+    return None
+
+
+def stage_defect_make(item: Dict[str, str]) -> Optional[bool]:
+    """Defects page lists every make → drop non-Toyota rows before enrichment"""
+    if not item["is_defect"]:
+        return None
+    text = (item["title"] + " " + item["description"]).lower()
+    make = (item.get("car_make") or "").lower()
+    if "toyota" in make or "toyota" in text or "/toyota/" in item["link"].lower():
+        return None
+    return False
+
+
+def stage_fuel(item: Dict[str, str]) -> Optional[bool]:
+    """
+    Petrol only; hybrids and diesels excluded (Hilux/LC уже решены выше).
+    Нужен fuel_type — это единственная дорогая стадия.
+    """
+    text = (item["title"] + " " + item["description"]).lower()
+    fuel_type = (item.get("fuel_type") or "").lower()
+
+    # Fallback если fuel_type пустой
+    if not fuel_type:
+        if "benz" in text:
+            fuel_type = "petrol"
+        elif "diesel" in text or "dīze" in text:
+            fuel_type = "diesel"
+        elif "hybrid" in text or "hibr" in text:
+            fuel_type = "hybrid"
+
+    if any(h in fuel_type for h in HYBRID_KEYWORDS):
+        return False
+
+    is_petrol = any(p in fuel_type for p in PETROL_KEYWORDS)
+    is_diesel = any(d in fuel_type for d in DIESEL_KEYWORDS)
+    return is_petrol and not is_diesel
+
+
+# Порядок = порядок стоимости
+ROW_STAGES = [stage_model_path, stage_defect_make]
+ENRICHED_STAGES = [stage_fuel]
+
+
+def prefilter_row(item: Dict[str, str]) -> Optional[bool]:
+    """
+    Дешёвые проверки по строке списка.
+    True/False — решение принято без обогащения, None — нужен fuel_type.
+    """
+    for stage in ROW_STAGES:
+        verdict = stage(item)
+        if verdict is not None:
+            return verdict
+    return None
+
+
 def filter_benzina_toyotas(listings: List[Dict[str, str]]):
     """
     Final Rules:
@@ -285,64 +917,15 @@ def filter_benzina_toyotas(listings: List[Dict[str, str]]):
 
     filtered: List[Dict[str, str]] = []
 
-    petrol_keywords = ["benz", "benzin", "benzīn", "benzīns", "petrol", "gas"]
-    diesel_keywords = ["diesel", "dīze", "dize", "dīzel", "d-4d", "d4d", "tdi", "dci"]
-    hybrid_keywords = ["hybrid", "hibr", "phev", "plug-in"]
-
-    def detect_fallback(text: str):
-        text = text.lower()
-        if "benz" in text:
-            return "petrol"
-        if "diesel" in text or "dīze" in text:
-            return "diesel"
-        if "hybrid" in text or "hibr" in text:
-            return "hybrid"
-        return ""
-
     for item in listings:
-        link = item["link"].lower()
-        text = (item["title"] + " " + item["description"]).lower()
-        fuel_type = (item.get("fuel_type") or "").lower()
-
-        # Fallback если fuel_type пустой
-        if not fuel_type:
-            fallback = detect_fallback(text)
-            if fallback:
-                fuel_type = fallback
-
-        # 1) Hilux/LC → always include (any fuel)
-        if "/hilux/" in link or "/land-cruiser/" in link:
+        verdict = prefilter_row(item)
+        if verdict is None:
+            for stage in ENRICHED_STAGES:
+                verdict = stage(item)
+                if verdict is not None:
+                    break
+        if verdict:
             filtered.append(item)
-            continue
-
-        # 2) Exclude hybrids everywhere
-        if any(h in fuel_type for h in hybrid_keywords):
-            continue
-
-        # 3) Defects → only Petrol Toyota
-        if item["is_defect"]:
-            if "toyota" not in text:
-                continue
-
-            is_petrol = any(p in fuel_type for p in petrol_keywords)
-            is_diesel = any(d in fuel_type for d in diesel_keywords)
-
-            if is_petrol and not is_diesel:
-                filtered.append(item)
-
-            continue
-
-        # 4) Regular Toyota → only petrol (diesel only allowed for Hilux/LC, уже обработаны)
-        is_petrol = any(p in fuel_type for p in petrol_keywords)
-        is_diesel = any(d in fuel_type for d in diesel_keywords)
-
-        if not is_petrol:
-            continue
-
-        if is_diesel:
-            continue
-
-        filtered.append(item)
 
     return filtered
 
@@ -350,7 +933,8 @@ def filter_benzina_toyotas(listings: List[Dict[str, str]]):
 # ===========================================
 # MESSAGE FORMATTER
 # ===========================================
-async def format_listing_message(item: Dict[str, str]):
+def detect_year_fuel(item: Dict[str, str]) -> tuple:
+    """Год из заголовка и тип топлива (Petrol / Diesel / Hybrid / N/A)"""
     text = (item["title"] + " " + item["description"]).lower()
     fuel_type_raw = (item.get("fuel_type") or "").strip()
 
@@ -377,6 +961,12 @@ async def format_listing_message(item: Dict[str, str]):
         elif "hybrid" in text or "hibr" in text:
             fuel = "Hybrid"
 
+    return year, fuel
+
+
+async def format_listing_message(item: Dict[str, str]):
+    year, fuel = detect_year_fuel(item)
+
     if item["is_defect"]:
         msg = "⚠️ <b>Defekts / Crash Toyota</b>\n"
     else:
@@ -402,40 +992,143 @@ async def format_listing_message(item: Dict[str, str]):
     return msg, kb
 
 
+def listing_priority(item: Dict[str, str]) -> int:
+    """Сумма весов правил PRIORITY_RULES, которым объявление подходит"""
+    score = 0
+    for kind, value, weight in PRIORITY_RULES:
+        if kind == "path":
+            hit = value in item["link"]
+        elif kind == "defect":
+            hit = bool(item.get("is_defect")) == value
+        elif kind == "price_below":
+            price = parse_price(item.get("price", ""))
+            hit = price is not None and price < value
+        else:
+            raise ValueError(f"Unknown priority rule: {kind}")
+        if hit:
+            score += weight
+    return score
+
+
+def is_priority(item: Dict[str, str]) -> bool:
+    """Редкие модели: в дайджест не попадают, уходят сразу"""
+    return listing_priority(item) >= PRIORITY_SINGLE
+
+
+def digest_entry(item: Dict[str, str]) -> Dict[str, str]:
+    """Строка объявления в дайджесте и ссылка для его кнопки"""
+    year, fuel = detect_year_fuel(item)
+    title = item["title"] if len(item["title"]) <= 60 else item["title"][:57] + "..."
+    mark = "⚠️ " if item["is_defect"] else ""
+    return {
+        "line": f"{mark}<b>{html.escape(title)}</b> · {year} · {fuel} · {html.escape(item['price'])}",
+        "title": title,
+        "link": item["link"],
+    }
+
+
+def build_digest(deliveries: List[Delivery]) -> Dict:
+    """Одно сообщение из нескольких объявлений: список + по кнопке на каждое"""
+    lines = [f"{i}. {d.digest['line']}" for i, d in enumerate(deliveries, 1)]
+    buttons = [
+        [InlineKeyboardButton(f"🔗 {i}. {d.digest['title'][:40]}", url=d.digest["link"])]
+        for i, d in enumerate(deliveries, 1)
+    ]
+    return message_payload(
+        f"🆕 <b>{len(deliveries)} jauni Toyota sludinājumi</b>\n\n" + "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup(buttons),
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+    )
+
+
 # ===========================================
 # TELEGRAM HELPERS
 # ===========================================
-async def safe_send_message(app: Application, chat_id: int, text: str, reply_markup=None):
-    """
-    Отправка сообщения с обработкой FloodWait, Forbidden и пр.
-    """
-    try:
-        await app.bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            parse_mode="HTML",
-            reply_markup=reply_markup,
-            disable_web_page_preview=False,
+# Рассылка идёт через диспетчер: лимиты Telegram (общий и на чат) через
+# token bucket, RetryAfter тормозит только свой чат
+notification_dispatcher: Optional[NotificationDispatcher] = None
+# Каждое уведомление сначала пишется в outbox (до сохранения seen ID) и
+# отмечается доставленным по факту отправки; в памяти, пока main() не
+# откроет OUTBOX_FILE
+notification_outbox = Outbox()
+outbox_wakeup = asyncio.Event()
+
+
+def forget_subscriber(chat_id: int) -> None:
+    logger.info(f"User {chat_id} blocked the bot. Removing from subscribers.")
+    subscribed_users.discard(chat_id)
+
+
+def get_dispatcher(app: Application) -> NotificationDispatcher:
+    global notification_dispatcher
+    if notification_dispatcher is None:
+        options = dict(
+            on_forbidden=forget_subscriber,
+            chat_rates={BROADCAST_CHAT_ID: GROUP_RATE} if BROADCAST_CHAT_ID else None,
         )
-    except telegram.error.RetryAfter as e:
-        wait_for = int(e.retry_after) + 1
-        logger.warning(f"FloodWait for {wait_for}s when sending to {chat_id}")
-        await asyncio.sleep(wait_for)
-        try:
-            await app.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode="HTML",
-                reply_markup=reply_markup,
-                disable_web_page_preview=False,
+        if EXTRA_BOT_TOKENS:
+            notification_dispatcher = BotPool(
+                [app.bot] + [Bot(token) for token in EXTRA_BOT_TOKENS],
+                primary_only=notification_outbox.primary_only_chats(),
+                on_primary_only=notification_outbox.mark_primary_only,
+                **options,
             )
-        except Exception as e2:
-            logger.error(f"Failed to resend message to {chat_id}: {e2}")
-    except telegram.error.Forbidden:
-        logger.info(f"User {chat_id} blocked the bot. Removing from subscribers.")
-        subscribed_users.discard(chat_id)
-    except Exception as e:
-        logger.error(f"Error sending message to {chat_id}: {e}")
+        else:
+            notification_dispatcher = NotificationDispatcher(app.bot.send_message, **options)
+    return notification_dispatcher
+
+
+async def close_dispatcher(app: Application) -> None:
+    """Останавливает диспетчер и закрывает дополнительных ботов BotPool (post_shutdown)"""
+    global notification_dispatcher
+    if notification_dispatcher is not None:
+        await notification_dispatcher.close()
+        notification_dispatcher = None
+
+
+def notification_targets() -> List[int]:
+    """Куда уходят уведомления: канал (BROADCAST_CHAT_ID) или все подписчики"""
+    return [BROADCAST_CHAT_ID] if BROADCAST_CHAT_ID else list(subscribed_users)
+
+
+def queue_for_subscribers(
+    listing_id: str, text: str, reply_markup=None, digest: Optional[Dict] = None, priority: int = 0
+) -> int:
+    """
+    Пишет сообщение в outbox для notification_targets() и будит outbox_worker.
+    Пара (объявление, чат) ставится только один раз.
+    С digest (digest_entry) сообщение ждёт конца цикла (release_digest)
+    и уходит вместе с остальными объявлениями цикла.
+    priority (listing_priority) — очередь в outbox и в диспетчере.
+    """
+    queued = notification_outbox.enqueue(
+        listing_id,
+        notification_targets(),
+        message_payload(text, reply_markup=reply_markup, parse_mode="HTML", disable_web_page_preview=False),
+        digest=digest,
+        hold=DIGEST_HOLD if digest else 0,
+        priority=priority,
+    )
+    if not digest:
+        outbox_wakeup.set()
+    return queued
+
+
+def release_digest() -> None:
+    """Конец цикла: отложенные для дайджеста строки можно отправлять"""
+    if notification_outbox.release_held():
+        outbox_wakeup.set()
+
+
+async def deliver_outbox(app: Application, min_priority: int = 0) -> Dict[str, int]:
+    """Отправляет все готовые строки outbox (приоритета от min_priority) через диспетчер и ждёт их"""
+    outcomes = await drain_outbox(
+        notification_outbox, get_dispatcher(app), combine=build_digest, min_priority=min_priority
+    )
+    if any(outcomes.values()):
+        logger.info(f"Outbox: {outcomes}")
+    return outcomes
 
 
 # ===========================================
@@ -443,103 +1136,307 @@ async def safe_send_message(app: Application, chat_id: int, text: str, reply_mar
 # ===========================================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     subscribed_users.add(update.effective_user.id)
+    notification_outbox.revive(update.effective_user.id)
     await update.message.reply_text("✅ Abonēts Toyota paziņojumiem!")
 
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     subscribed_users.discard(update.effective_user.id)
+    notification_outbox.cancel_chat(update.effective_user.id)
     await update.message.reply_text("🔕 Abonēšana aptурēta.")
 
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
-        f"👥 Subscribers: {len(subscribed_users)}\n"
-        f"🔎 Seen listings: {len(seen_listing_ids)}"
+        f"👥 Subscribers: {len(subscribed_users)}"
+        + (f" (broadcast to {BROADCAST_CHAT_ID})" if BROADCAST_CHAT_ID else "")
+        + "\n"
+        f"🔎 Seen listings: {len(seen_listing_ids)}\n"
+        f"📄 Last cycle: {last_cycle_stats.get('pages_skipped', 0)}/"
+        f"{last_cycle_stats.get('pages', 0)} pages unchanged\n"
+        f"🗂 Detail cache: {len(detail_cache)} "
+        f"(hits {detail_cache.hits}, misses {detail_cache.misses})"
+        + (
+            f"\n📨 Sent: {notification_dispatcher.sent} ({notification_dispatcher.stats()['throughput']:.1f} msg/s), "
+            f"failed {notification_dispatcher.failed}, flood waits {notification_dispatcher.flood_waits}"
+            if notification_dispatcher else ""
+        )
+        + f"\n📬 Outbox: {notification_outbox.counts()}"
+        + "".join(
+            f"\n⏱ {url.split('/')[-3]}: every {s['interval']:.0f}s ({s['rate_per_hour']:.1f} new/h)"
+            for url, s in (scheduler.stats().items() if scheduler else [])
+        )
+        + (
+            f"\n🕹 Handlers:\n{context.application.update_processor.summary()}"
+            if isinstance(context.application.update_processor, PerChatUpdateProcessor) else ""
+        )
     )
 
 
 async def user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if AUTO_NOTIFY:
         subscribed_users.add(update.effective_user.id)
+        notification_outbox.revive(update.effective_user.id)
         await update.message.reply_text("👋 Pievienots paziņojumiem!")
 
 
 # ===========================================
 # MONITOR LOOP
 # ===========================================
-def scrape_and_process():
-    raw = scrape_listings()
-    filtered = filter_benzina_toyotas(raw)
+def create_scheduler() -> PollScheduler:
+    """Планировщик опроса с историей появления объявлений из source_state"""
+    new_scheduler = PollScheduler(
+        SS_LV_URLS,
+        target_latency=TARGET_DETECTION_LATENCY,
+        request_budget=REQUEST_BUDGET_PER_HOUR / 3600,
+        min_interval=MIN_POLL_INTERVAL,
+        max_interval=MAX_POLL_INTERVAL,
+    )
+    for url in SS_LV_URLS:
+        new_scheduler.load_arrivals(url, source_state.get(url, {}).get("arrivals", []))
+    return new_scheduler
+
 
-    new = []
-    for item in filtered:
-        if item["id"] not in seen_listing_ids:
-            seen_listing_ids.add(item["id"])
-            new.append(item)
+def store_arrivals(active_scheduler: PollScheduler) -> None:
+    for url in SS_LV_URLS:
+        source_state.setdefault(url, {})["arrivals"] = active_scheduler.arrivals(url)
 
-    return new
 
+def matches_rules(item: Dict[str, str]) -> bool:
+    return bool(filter_benzina_toyotas([item]))
 
-async def monitor(app: Application):
-    # Initial load
+
+async def stream_new_listings(
+    fetcher: AsyncFetcher, urls: Optional[List[str]] = None, on_listing: Optional[Callable] = None
+) -> AsyncIterator[Dict[str, str]]:
+    """
+    Пайплайн fetch → classify → dedupe для одного цикла: каждое новое
+    подходящее объявление отдаётся сразу, не дожидаясь остальных страниц.
+    on_listing(item) видит каждое новое объявление ещё до фильтра.
+
+    Объявление считается увиденным (и сохраняется на диск) только после
+    того, как потребитель поставил его в outbox и вызвал mark_queued(item).
+    Иначе оно попадает в source_state[url]["retry"] и отдаётся снова в
+    начале следующего опроса источника (до QUEUE_RETRY_LIMIT раз): водяной
+    знак его уже прошёл, и со страницы оно больше не прочитается.
+    """
+    urls = SS_LV_URLS if urls is None else urls
+    pending = [item for url in urls for item in source_state.get(url, {}).pop("retry", [])]
+    offered = set()
+
+    async def fresh():
+        async for item in stream_listings(fetcher, only_changed=True, urls=urls):
+            if on_listing:
+                on_listing(item)
+            if matches_rules(item):
+                yield item
+
+    stream = fresh()
     try:
-        logger.info("🔍 Initial check - loading all listings...")
-        all_listings = await asyncio.to_thread(scrape_listings)
-        all_filtered = await asyncio.to_thread(filter_benzina_toyotas, all_listings)
+        while True:
+            if pending:
+                item = pending.pop(0)
+            else:
+                try:
+                    item = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+            if item["id"] in seen_listing_ids or item["id"] in offered:
+                continue
+            offered.add(item["id"])
+            item.pop("queued", None)
+            try:
+                yield item
+            finally:
+                if item.get("queued"):
+                    seen_listing_ids.add(item["id"])
+                    save_seen_ids()
+                else:
+                    retry_listing(item)
+    finally:
+        # Потребитель остановился раньше — неотданные повторы ждут следующего опроса
+        for item in pending:
+            source_state.setdefault(item["source"], {}).setdefault("retry", []).append(item)
+        await stream.aclose()
 
-        for item in all_filtered:
-            seen_listing_ids.add(item["id"])
 
-        save_seen_ids()
+def mark_queued(item: Dict[str, str]) -> None:
+    """Потребитель stream_new_listings поставил объявление в outbox"""
+    item["queued"] = True
 
-        if subscribed_users and all_filtered:
-            MAX_INITIAL_SEND = 50
-            to_send = all_filtered[:MAX_INITIAL_SEND]
 
-            logger.info(
-                f"📤 Sending {len(to_send)} existing listings to {len(subscribed_users)} subscribers..."
-            )
+def retry_listing(item: Dict[str, str]) -> None:
+    """Откладывает объявление, не попавшее в outbox, до следующего опроса его источника"""
+    item["retries"] = item.get("retries", 0) + 1
+    if item["retries"] > QUEUE_RETRY_LIMIT:
+        logger.error(f"Listing {item['id']} could not be queued {QUEUE_RETRY_LIMIT} times — dropped")
+        return
+    source_state.setdefault(item["source"], {}).setdefault("retry", []).append(item)
+
+
+async def outbox_worker(app: Application):
+    """
+    Стадия notify: доставляет строки outbox по мере поступления (будит
+    queue_for_subscribers), повторы по расписанию и строки, оставшиеся
+    с прошлого запуска. Каждая строка отмечается в outbox сразу после
+    своей отправки.
+    Рассылок одновременно не больше двух: обычная (все готовые строки) и,
+    пока она ждёт свои отправки, ещё одна только для приоритетных строк —
+    они сразу уходят в диспетчер и обгоняют накопившуюся очередь обычных.
+    Закончилась рассылка — сразу следующая: строки, которые были в полёте
+    или стали готовы за это время, не ждут OUTBOX_IDLE_WAIT.
+    """
+    regular: Optional[asyncio.Task] = None
+    urgent: Optional[asyncio.Task] = None
+
+    async def drain(min_priority: int = 0):
+        try:
+            await deliver_outbox(app, min_priority)
+        except Exception as e:
+            logger.error(f"Outbox error: {e}")
 
-            for item in to_send:
-                msg, kb = await format_listing_message(item)
-                msg = f"📋 <b>Existing listing</b>\n\n{msg}"
+    try:
+        while True:
+            outbox_wakeup.clear()
+            if regular is None or regular.done():
+                regular = asyncio.create_task(drain())
+            elif urgent is None or urgent.done():
+                urgent = asyncio.create_task(drain(min_priority=1))
+            await asyncio.sleep(0)  # drain забирает готовые строки
+            wait = notification_outbox.next_due_in()
+            wait = OUTBOX_IDLE_WAIT if wait is None else min(max(wait, 1.0), OUTBOX_IDLE_WAIT)
+            woken = asyncio.create_task(outbox_wakeup.wait())
+            running = [task for task in (regular, urgent) if task is not None and not task.done()]
+            try:
+                await asyncio.wait([woken] + running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                woken.cancel()
+    finally:
+        drains = [task for task in (regular, urgent) if task is not None]
+        for task in drains:
+            task.cancel()
+        await asyncio.gather(*drains, return_exceptions=True)
 
-                for uid in list(subscribed_users):
-                    await safe_send_message(app, uid, msg, reply_markup=kb)
-                    await asyncio.sleep(0.4)
 
-                await asyncio.sleep(0.8)
+async def queue_listing(item: Dict[str, str]) -> None:
+    """Ставит новое объявление в outbox для подписчиков (или канала)"""
+    msg, kb = await format_listing_message(item)
+    priority = listing_priority(item)
+    digest = digest_entry(item) if DIGEST_MODE and priority < PRIORITY_SINGLE else None
+    queue_for_subscribers(item["id"], msg, reply_markup=kb, digest=digest, priority=priority)
 
-            logger.info("✅ Initial listings sent.")
-        else:
-            logger.info(
-                f"✅ Cache populated with {len(all_filtered)} listings (no initial send)."
-            )
 
+async def initial_load(app: Application, fetcher: AsyncFetcher) -> None:
+    """
+    Первая загрузка после старта: всё, что уже на страницах, считается
+    увиденным. Исключение — объявления новее сохранённого водяного знака
+    своего источника, которых ещё нет в seen: они появились, пока бот не
+    работал, и рассылаются как новые — так же, как более старые
+    пропущенные объявления, которые потом найдёт догон (catch_up_pages).
+    """
+    watermarks = {url: source_state.get(url, {}).get("watermark") for url in SS_LV_URLS}
+    logger.info("🔍 Initial check - loading all listings...")
+    all_listings = await scrape_listings_async(fetcher)
+    all_filtered = await asyncio.to_thread(filter_benzina_toyotas, all_listings)
+
+    missed = [
+        item for item in all_filtered
+        if watermarks.get(item["source"])
+        and listing_number(item["id"]) > watermarks[item["source"]]
+        and item["id"] not in seen_listing_ids
+    ]
+    missed_ids = {item["id"] for item in missed}
+    if missed:
+        logger.info(f"📥 {len(missed)} listings posted while the bot was down — sending as new")
+        for item in missed:
+            await queue_listing(item)
+        release_digest()
+
+    # В канал старые объявления не повторяем: только новые
+    existing = [item for item in all_filtered if item["id"] not in missed_ids]
+    initial_send = bool(subscribed_users and existing and not BROADCAST_CHAT_ID)
+    if initial_send:
+        MAX_INITIAL_SEND = 50
+        to_send = existing[:MAX_INITIAL_SEND]
+
+        logger.info(
+            f"📤 Sending {len(to_send)} existing listings to {len(subscribed_users)} subscribers..."
+        )
+
+        for item in to_send:
+            msg, kb = await format_listing_message(item)
+            msg = f"📋 <b>Existing listing</b>\n\n{msg}"
+            queue_for_subscribers(item["id"], msg, reply_markup=kb, priority=listing_priority(item))
+
+    for item in all_filtered:
+        seen_listing_ids.add(item["id"])
+
+        save_seen_ids()
+    detail_cache.save()
+    save_source_state()
+    logger.info(f"Detail cache: {detail_cache.stats()}")
+
+    if initial_send:
+        await deliver_outbox(app)
+        logger.info(f"✅ Initial listings sent: {get_dispatcher(app).stats()}")
+    else:
+        logger.info(
+            f"✅ Cache populated with {len(all_filtered)} listings (no initial send)."
+        )
+
+
+async def monitor(app: Application):
+    # Один fetcher (и пул соединений) на всё время работы бота
+    fetcher = create_fetcher()
+
+    try:
+        await initial_load(app, fetcher)
     except Exception as e:
         logger.error(f"Error in initial send: {e}")
 
-    # Основной мониторинг
-    while True:
-        try:
-            new_items = await asyncio.to_thread(scrape_and_process)
+    # Основной мониторинг: каждое новое объявление уходит в рассылку сразу
+    sender = asyncio.create_task(outbox_worker(app))
 
-            if new_items:
-                logger.info(f"NEW LISTINGS: {len(new_items)}")
-                save_seen_ids()
+    # Каждый источник опрашивается по своему расписанию (poll_scheduler.py)
+    global scheduler
+    scheduler = create_scheduler()
 
-                for item in new_items:
-                    msg, kb = await format_listing_message(item)
+    while True:
+        urls = scheduler.due()
+        # Новые ID по источникам — по ним оценивается частота публикаций
+        # (догон после простоя не считается: это не темп публикаций)
+        arrivals: Dict[str, int] = {url: 0 for url in urls}
 
-                    for uid in list(subscribed_users):
-                        await safe_send_message(app, uid, msg, reply_markup=kb)
-                        await asyncio.sleep(0.3)
+        def count_arrival(item):
+            if not item.get("catch_up"):
+                arrivals[item["source"]] += 1
+
+        try:
+            new_count = 0
+            async for item in stream_new_listings(fetcher, urls, count_arrival):
+                new_count += 1
+                logger.info(f"NEW LISTING: {item['id']} {item['title']}")
+                try:
+                    await queue_listing(item)
+                    mark_queued(item)
+                except Exception as e:
+                    logger.error(f"Notification error for {item.get('id')} (retried next poll): {e}")
+
+            if new_count:
+                logger.info(f"NEW LISTINGS: {new_count}")
+                release_digest()
+            detail_cache.save()
 
         except Exception as e:
             logger.error(f"Monitor error: {e}")
             await asyncio.sleep(5)
 
-        await asyncio.sleep(CHECK_INTERVAL + random.random() * 5)
+        for url in urls:
+            scheduler.record_poll(url, arrivals[url])
+        store_arrivals(scheduler)
+        save_source_state()
+
+        await asyncio.sleep(scheduler.seconds_until_next())
 
 
 # ===========================================
@@ -551,15 +1448,25 @@ def main():
         sys.exit(1)
 
     load_seen_ids()
+    detail_cache.load()
+    load_source_state()
     create_lock_file()
 
+    global notification_outbox
+    notification_outbox = Outbox(OUTBOX_FILE)
+    if BROADCAST_CHAT_ID and notification_outbox.revive(BROADCAST_CHAT_ID):
+        logger.info(f"Broadcast chat {BROADCAST_CHAT_ID} was marked dead - trying it again")
+    logger.info(f"Outbox: {notification_outbox.counts()}")
+
     async def on_start(app: Application):
         asyncio.create_task(monitor(app))
 
     app = (
         Application.builder()
         .token(TELEGRAM_TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor())
         .post_init(on_start)
+        .post_shutdown(close_dispatcher)
         .build()
     )
 
@@ -569,12 +1476,15 @@ def main():
     app.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, user_message)
     )
+    app.update_processor.track_commands(app)
 
     print("🚀 BOT STARTED")
     try:
         app.run_polling(drop_pending_updates=True)
     finally:
         save_seen_ids()
+        detail_cache.save()
+        save_source_state()
         remove_lock_file()
 
 
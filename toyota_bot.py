@@ -22,6 +22,9 @@ from dotenv import load_dotenv
 import asyncio
 import time
 
+from singleflight import SingleFlight
+from update_processing import PerChatUpdateProcessor
+
 # Fix encoding issues on Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -55,6 +58,7 @@ SS_LV_URLS = [
 REQUEST_TIMEOUT = 10  # seconds
 CHECK_INTERVAL = 30  # Check every 30 seconds for instant notifications
 MAX_RETRIES = 3  # Maximum retries for failed requests
+SEARCH_MAX_AGE = 30  # /search reuses a scrape (its own or the scheduled one) up to this many seconds old
 
 # Models to filter
 TARGET_MODELS = ['land cruiser', 'hilux', 'toyota']
@@ -63,6 +67,10 @@ TARGET_MODELS = ['land cruiser', 'hilux', 'toyota']
 subscribed_users = set()
 seen_listing_ids = set()
 
+# One scrape at a time for /search and the scheduled check: callers arriving
+# while a scrape runs wait for it instead of starting their own
+scrape_flight = SingleFlight(max_age=SEARCH_MAX_AGE)
+
 
 def scrape_listings() -> Optional[List[Dict[str, str]]]:
     """
@@ -166,6 +174,20 @@ def scrape_listings() -> Optional[List[Dict[str, str]]]:
     return all_listings
 
 
+async def shared_scrape(max_age: float = SEARCH_MAX_AGE) -> Optional[List[Dict[str, str]]]:
+    """
+    Run scrape_listings() in a worker thread, shared with concurrent callers
+    
+    Args:
+        max_age: Accept the result of a scrape that finished at most this
+            many seconds ago (0 = only join a scrape that is still running)
+    
+    Returns:
+        Same as scrape_listings()
+    """
+    return await scrape_flight.run('listings', lambda: asyncio.to_thread(scrape_listings), max_age=max_age)
+
+
 def filter_defective_cars(listings: List[Dict[str, str]]) -> List[Dict[str, str]]:
     """
     Filter listings for Land Cruiser and Hilux with "defekti" keyword
@@ -341,7 +363,7 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text("🔍 Searching for matching listings...")
     
     try:
-        listings = scrape_listings()
+        listings = await shared_scrape()
         
         if listings is None:
             error_message = (
@@ -376,7 +398,8 @@ async def scheduled_check(context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info("Running scheduled check for new Toyota listings")
     
     try:
-        listings = scrape_listings()
+        # Never an older result, but join a /search scrape that is running
+        listings = await shared_scrape(max_age=0)
         
         if listings is None:
             logger.warning("Scheduled check: Failed to fetch listings")
@@ -453,14 +476,18 @@ def main() -> None:
         print("Please set TELEGRAM_BOT_TOKEN in your .env file")
         return
     
-    # Create application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Create application: updates of different chats are handled concurrently,
+    # so a slow /search doesn't hold up other users
+    application = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(
+        PerChatUpdateProcessor()
+    ).build()
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("subscribe", subscribe_command))
     application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(CommandHandler("search", search_command))
+    application.update_processor.track_commands(application)
     
     # Add scheduled job for instant notifications (runs every 30 seconds)
     job_queue = application.job_queue
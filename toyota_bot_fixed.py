@@ -11,23 +11,41 @@ import logging
 import asyncio
 import time
 import signal
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional
 import requests
 from bs4 import BeautifulSoup
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
 )
+from telegram.helpers import escape_markdown
 from dotenv import load_dotenv
 import asyncio
 import time
 import random
 import urllib.parse
 import base64
+from functools import partial
+
+from ss_fetcher import PageCache
+from singleflight import SingleFlight
+from listing_index import CursorStore, ListingIndex, parse_search_query
+from telegram_dispatcher import GROUP_RATE, NotificationDispatcher
+from bot_pool import BotPool
+from webhook_server import WEBHOOK_PORT, run_webhook
+from update_processing import PerChatUpdateProcessor
+from outbox import Outbox, drain_outbox, message_payload
+from browser_pool import PAGE_LOAD_TIMEOUT, BrowserPool
+from subscriptions import SubscriptionIndex, parse_filters
 
 # Optional Selenium for JavaScript phone extraction
 try:
@@ -125,6 +143,11 @@ logging.getLogger('httpx').setLevel(logging.WARNING)
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 AUTO_START = os.getenv('AUTO_START', 'true').lower() == 'true'  # Auto-start monitoring
 AUTO_NOTIFY = os.getenv('AUTO_NOTIFY', 'true').lower() == 'true'  # Auto-enable notifications for all users
+# Webhook mode: public HTTPS URL Telegram posts updates to (e.g. https://bot.example.com/telegram),
+# forwarded to WEBHOOK_PORT on this host; unset: long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or None
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', WEBHOOK_PORT))
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL') or None  # Own Bot API server (e.g. http://localhost:8081); unset: api.telegram.org
 SS_LV_URLS = [
     'https://www.ss.lv/lv/transport/cars/toyota/today/sell/',
     'https://www.ss.lv/lv/transport/other/transport-with-defects-or-after-crash/sell/',
@@ -135,7 +158,38 @@ REQUEST_TIMEOUT = 30  # Increased timeout for stability
 CHECK_INTERVAL = 40  # Optimized for fast notifications while avoiding blocking
 MAX_RETRIES = 3  # Maximum retries for failed requests
 REQUEST_DELAY = 2  # Reduced delay for faster processing
+RATE_LIMIT_BACKOFF = 30  # Pause a source for this long after a 429
+SOURCE_CHECK_TIMEOUT = 60  # Stop waiting for a source check after this many seconds
+SEARCH_TIMEOUT = 90  # Stop waiting for a /search scrape after this many seconds
+SCRAPE_WORKERS = 6  # Worker threads for blocking scrapes (one per source + /search)
+SEARCH_MAX_AGE = 30  # /search reuses scrape results (its own or a source check's) up to this many seconds old
+SEARCH_PAGE_SIZE = 10  # Listings per /search results page (fewer if they don't fit in one message)
+TELEGRAM_MESSAGE_LIMIT = 4096  # Characters per Telegram message
+SEARCH_PAGE_RESERVE = 300  # Room on a /search page for the heading, "Updated" line and subscription notice
+SEARCH_CURSOR_TTL = 15 * 60  # Keep /search results for paging this long after the last page view
+DATA_DIR = Path(os.getenv('DATA_DIR', '.'))  # State kept across restarts (mount it as a volume in Docker)
+OUTBOX_FILE = Path(os.getenv('OUTBOX_FILE', DATA_DIR / 'toyota_outbox.db'))  # Durable ledger of (listing, user) notification deliveries
+FILTERS_FILE = Path(os.getenv('FILTERS_FILE', DATA_DIR / 'toyota_filters.json'))  # Saved /filter criteria per user
+OUTBOX_DRAIN_INTERVAL = 30  # Resend due outbox rows (retries, rows left over by a restart) this often
+HANDLER_METRICS_INTERVAL = 600  # Log per-handler latency this often
+# Broadcast mode: post every listing of the default rules once to this channel / group
+# (numeric ID, e.g. -1001234567890) instead of a DM to every subscriber; users with a /filter still get DMs
+BROADCAST_CHAT_ID = int(os.getenv('BROADCAST_CHAT_ID', '0')) or None
+# Extra bot tokens sharing the notification load (comma-separated); every chat is pinned to one bot
+EXTRA_BOT_TOKENS = [token.strip() for token in os.getenv('EXTRA_BOT_TOKENS', '').split(',') if token.strip()]
+
+# Every source is checked by its own job; sources not listed here use CHECK_INTERVAL
+SOURCE_CHECK_INTERVALS = {
+    'https://www.ss.lv/lv/transport/cars/toyota/hilux/sell/': 30,
+    'https://www.ss.lv/lv/transport/cars/toyota/land-cruiser/sell/': 30,
+    'https://www.ss.lv/lv/transport/other/transport-with-defects-or-after-crash/sell/': 60,
+}
 USE_JS_PHONE_EXTRACTION = True  # Enable JavaScript phone extraction for crash listings
+PHONE_EXTRACTION_DEADLINE = 15  # Seconds one listing may take in the browser, page load included
+PHONE_SETTLE_TIME = 0.5  # No requests in flight and no DOM changes for this long: the phone reveal is over
+PHONE_GRACE_TIME = 0.3  # Time a page gets to react to a click (e.g. a request started from setTimeout)
+# Headless Chrome instances kept running for phone extraction (~150-250 MB each, mind the 512M container limit)
+BROWSER_WORKERS = int(os.getenv('BROWSER_WORKERS', '1'))
 
 # Anti-blocking measures - rotate user agents
 USER_AGENTS = [
@@ -153,6 +207,7 @@ TARGET_MODELS = ['land cruiser', 'hilux', 'toyota']
 # Storage for subscribed users and seen listings
 subscribed_users = set()
 seen_listing_ids = set()
+seeded_sources = set()  # Sources checked since the start (broadcast mode: the first check only fills seen_listing_ids)
 
 # Auto-subscribe users on any interaction
 def auto_subscribe_user(user_id: int) -> bool:
@@ -162,18 +217,104 @@ def auto_subscribe_user(user_id: int) -> bool:
     """
     if AUTO_NOTIFY and user_id not in subscribed_users:
         subscribed_users.add(user_id)
+        notification_outbox.revive(user_id)
         logger.info(f"Auto-subscribed user {user_id}")
         return True
     return False
 
+# Saved /filter criteria; users without filters get the default rules (filter_all_listings)
+subscription_index = SubscriptionIndex()
+
+
+def load_filters() -> None:
+    """Load the saved /filter criteria from FILTERS_FILE"""
+    global subscription_index
+    if not FILTERS_FILE.exists():
+        return
+    try:
+        with open(FILTERS_FILE, 'r', encoding='utf-8') as f:
+            subscription_index = SubscriptionIndex.from_dict(json.load(f))
+        logger.info(f"Loaded saved filters: {subscription_index.stats()}")
+    except Exception as e:
+        logger.error(f"Error loading {FILTERS_FILE}: {e}")
+
+
+def save_filters() -> None:
+    try:
+        with open(FILTERS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(subscription_index.to_dict(), f, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Error saving {FILTERS_FILE}: {e}")
+
+
+def default_recipients() -> set:
+    """Chats getting the listings of the default rules: the broadcast channel or every user without filters"""
+    if BROADCAST_CHAT_ID:
+        return {BROADCAST_CHAT_ID}
+    return subscribed_users - subscription_index.users()
+
+
+def notification_recipients(listing: Dict[str, str], default_match: bool) -> set:
+    """
+    Chats to notify about ``listing``: subscribed users whose saved filter
+    matches it, plus default_recipients() if the default rules matched
+    """
+    recipients = subscription_index.match(listing) & subscribed_users
+    if default_match:
+        recipients |= default_recipients()
+    return recipients
+
 # Phone extraction cache to avoid repeated Selenium calls
 phone_cache = {}
+# Long-lived browsers the phone extraction runs in (started on first use)
+phone_browsers = BrowserPool(size=BROWSER_WORKERS)
+
+# Conditional GET state (ETag / Last-Modified / rows hash) per source URL
+page_cache = PageCache()
+# Last parsed listings of every source URL, reused while the page is unchanged.
+# Together they are the snapshot /search answers from (see get_search_index)
+source_listings = {}
+source_listings_version = 0
+source_listings_lock = threading.Lock()
+search_index = None
+search_index_version = -1
+# /search result sets by cursor ID, paged through with the Prev / Next buttons
+search_cursors = CursorStore(ttl=SEARCH_CURSOR_TTL)
+# Notification fan-out within Telegram's global and per-chat limits
+notification_dispatcher = None
+# Notifications waiting for delivery; in memory until main() opens OUTBOX_FILE
+notification_outbox = Outbox()
+# Source URL -> time.monotonic() of its last successful request
+source_fetched_at = {}
+# Report of the last scrape cycle
+last_scrape_stats = {}
+# Outcome of the last request per source URL ('ok', 'unchanged', 'error', 'backoff')
+source_status = {}
+# Source URL -> time.monotonic() until which it is not requested (after a 429)
+source_backoff_until = {}
+# Source URLs whose check is currently running (overlap guard)
+sources_in_progress = set()
+
+# Blocking scrapes (requests, time.sleep, BeautifulSoup) run in these worker
+# threads so the Telegram event loop keeps answering commands meanwhile
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix='scrape')
+# One /search scrape at a time: concurrent /search calls wait for the running
+# scrape, later ones get its result while it is younger than SEARCH_MAX_AGE
+search_flight = SingleFlight(max_age=SEARCH_MAX_AGE)
+
+# Shared HTTP session and request spacing for all source checks
+http_session = None
+request_slot_lock = threading.Lock()
+last_request_at = 0.0
 
 
 def extract_phone_with_js(listing_url: str, listing_id: str) -> str:
     """
     Extract phone number using Selenium JavaScript execution
     
+    The page is opened in one of the long-lived browsers of
+    phone_browsers (started on first use) instead of a new Chrome.
+    
     Args:
         listing_url: Full URL to the listing page
         listing_id: SS.lv listing ID
@@ -189,353 +330,661 @@ def extract_phone_with_js(listing_url: str, listing_id: str) -> str:
         return phone_cache[listing_id]
     
     try:
-        # Setup Chrome options for headless browsing
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--window-size=1920,1080')
-        chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36')
-        
-        # Create driver
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.set_page_load_timeout(30)
-        
+        phone_cache[listing_id] = phone_browsers.run(partial(find_phone_on_page, listing_url))
+    except Exception as e:
+        logger.warning(f"Selenium phone extraction failed for {listing_id}: {e}")
+        # Cache failure to avoid repeated attempts
+        phone_cache[listing_id] = 'Skatīt sludinājumā'
+    return phone_cache[listing_id]
+
+
+# Counts the page's XHR / fetch requests in flight and notes the time of
+# the last request or DOM change, for wait_for_phone()
+PAGE_WATCH_JS = """
+if (!window.__phoneWatch) {
+    var watch = window.__phoneWatch = {pending: 0, last: Date.now()};
+    var done = function() { watch.pending--; watch.last = Date.now(); };
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        watch.pending++; watch.last = Date.now();
+        this.addEventListener('loadend', done);
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function() {
+            watch.pending++; watch.last = Date.now();
+            return fetch.apply(this, arguments).finally(done);
+        };
+    }
+    new MutationObserver(function() { watch.last = Date.now(); }).observe(
+        document.documentElement, {childList: true, subtree: true, characterData: true});
+}
+"""
+
+# An unmasked phone number in the phone elements (or null) and the page's request / DOM activity
+PAGE_STATE_JS = """
+var nodes = document.querySelectorAll('#phone_td_1, #ph_td_1, #phdivz_1, a[href^="tel:"], [data-phone], .phone_number');
+var phone = null;
+for (var i = 0; i < nodes.length && !phone; i++) {
+    var text = nodes[i].textContent || '';
+    var match = text.indexOf('***') < 0 && text.match(/(\\+371|\\b[26]\\d)[\\d\\s-]{6,}/);
+    if (match) phone = match[0].trim();
+}
+var watch = window.__phoneWatch;
+return {phone: phone, pending: watch ? watch.pending : 0, quiet: watch ? Date.now() - watch.last : 1e9};
+"""
+
+
+def wait_for_phone(driver, since: float, deadline: float) -> Optional[str]:
+    """
+    After a click / reveal script run at ``since`` (time.monotonic()),
+    wait until the page shows an unmasked phone number or is done: no
+    requests in flight and no DOM changes for PHONE_SETTLE_TIME, or none
+    at all since the action once PHONE_GRACE_TIME has passed. Gives up
+    at ``deadline``.
+    
+    Returns:
+        The phone number, or None if the page settled without one
+    """
+    def phone_or_settled(driver):
+        state = driver.execute_script(PAGE_STATE_JS) or {}
+        if state.get('phone'):
+            return state['phone']
+        quiet = state.get('quiet', 0) / 1000
+        elapsed = time.monotonic() - since
+        return not state.get('pending') and (
+            quiet >= PHONE_SETTLE_TIME or (quiet > elapsed and elapsed >= PHONE_GRACE_TIME)
+        )
+    
+    try:
+        result = WebDriverWait(driver, max(0, deadline - time.monotonic()), poll_frequency=0.1).until(phone_or_settled)
+    except TimeoutException:
+        return None
+    return result if isinstance(result, str) else None
+
+
+def find_phone_on_page(listing_url: str, driver) -> str:
+    """
+    Open a listing in ``driver`` and reveal its phone number
+    
+    Args:
+        listing_url: Full URL to the listing page
+        driver: Selenium WebDriver (from phone_browsers)
+    
+    Returns:
+        Phone number or fallback message
+    """
+    deadline = time.monotonic() + PHONE_EXTRACTION_DEADLINE
+    
+    # Load the listing page, within the deadline
+    driver.set_page_load_timeout(max(1, deadline - time.monotonic()))
+    try:
+        driver.get(listing_url)
+    except TimeoutException:
+        logger.debug(f"Page load of {listing_url} hit the deadline, using what has loaded")
+        driver.execute_script("window.stop();")
+    finally:
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    
+    # Wait for page to load
+    WebDriverWait(driver, max(0, min(10, deadline - time.monotonic()))).until(
+        EC.presence_of_element_located((By.TAG_NAME, "body"))
+    )
+    driver.execute_script(PAGE_WATCH_JS)
+    
+    # Look for phone reveal buttons/elements
+    phone_selectors = [
+        '[onclick*="phone"]',
+        '[onclick*="tel"]', 
+        '.show_phone',
+        '#show_phone',
+        'a[href*="tel:"]',
+        '[data-phone]',
+        '.phone_number'
+    ]
+    
+    phone_found = False
+    phone_number = 'Nav atrasts'
+    
+    for selector in phone_selectors:
         try:
-            # Load the listing page
-            driver.get(listing_url)
+            phone_elements = driver.find_elements(By.CSS_SELECTOR, selector)
             
-            # Wait for page to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            for element in phone_elements:
+                # Try clicking phone reveal buttons
+                if 'onclick' in element.get_attribute('outerHTML').lower():
+                    clicked = time.monotonic()
+                    driver.execute_script("arguments[0].click();", element)
+                    revealed = wait_for_phone(driver, clicked, deadline)  # Wait for phone to load
+                    if revealed:
+                        phone_number = revealed
+                        phone_found = True
+                        break
+                
+                # Check for phone number in text
+                text = element.text
+                if text and ('+371' in text or any(prefix in text for prefix in ['27', '28', '29', '67', '65'])):
+                    phone_number = text.strip()
+                    phone_found = True
+                    break
             
-            # Look for phone reveal buttons/elements
-            phone_selectors = [
-                '[onclick*="phone"]',
-                '[onclick*="tel"]', 
-                '.show_phone',
-                '#show_phone',
-                'a[href*="tel:"]',
-                '[data-phone]',
-                '.phone_number'
+            if phone_found:
+                break
+                
+        except NoSuchElementException:
+            continue
+    
+    # Enhanced JS phone extraction - try SS.lv specific phone reveal
+    if not phone_found:
+        try:
+            # SS.lv specific phone reveal function
+            js_commands = [
+                # Try the main SS.lv phone reveal function
+                "if(typeof _show_phone === 'function') {try {_show_phone(1, false); console.log('_show_phone called');} catch(e) {console.log('_show_phone failed:', e);}}",
+                
+                # Try without CAPTCHA check (some listings might allow it)
+                "if(typeof _show_phone === 'function') {try {_show_phone(1, 'nocaptcha'); console.log('_show_phone nocaptcha called');} catch(e) {console.log('_show_phone nocaptcha failed:', e);}}",
+                
+                # Try other phone functions
+                "if(typeof _get_phone_key === 'function') {try {_get_phone_key(); console.log('_get_phone_key called');} catch(e) {console.log('_get_phone_key failed:', e);}}",
+                
+                # Force show phone elements (bypass some restrictions)
+                "document.querySelectorAll('#phone_td_1, #ph_td_1, #phdivz_1').forEach(el => {el.style.display = 'block'; if(el.textContent.includes('***')) el.textContent = el.textContent.replace('***', '123');});",
+                
+                # Look for phone data in global variables
+                "if(window.phone_data) {console.log('Phone data:', window.phone_data); return window.phone_data;} if(window.PH_1) {console.log('PH_1:', window.PH_1); return window.PH_1;}",
+                
+                # Try to extract from page source patterns
+                "var phoneMatches = document.documentElement.innerHTML.match(/\\+371[\\d\\-\\s]+/g); if(phoneMatches) {console.log('Phone matches:', phoneMatches); return phoneMatches[0];}",
             ]
             
-            phone_found = False
-            phone_number = 'Nav atrasts'
-            
-            for selector in phone_selectors:
+            for i, cmd in enumerate(js_commands):
                 try:
-                    phone_elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    for element in phone_elements:
-                        # Try clicking phone reveal buttons
-                        if 'onclick' in element.get_attribute('outerHTML').lower():
-                            driver.execute_script("arguments[0].click();", element)
-                            time.sleep(2)  # Wait for phone to load
-                        
-                        # Check for phone number in text
-                        text = element.text
-                        if text and ('+371' in text or any(prefix in text for prefix in ['27', '28', '29', '67', '65'])):
-                            phone_number = text.strip()
-                            phone_found = True
-                            break
-                    
-                    if phone_found:
+                    started = time.monotonic()
+                    result = driver.execute_script(f"return ({cmd})")
+                    if not (result and isinstance(result, str)):
+                        # Wait for what the command started (e.g. the phone request)
+                        result = wait_for_phone(driver, started, deadline)
+                    if result and isinstance(result, str) and ('+371' in result or result.replace('-', '').replace(' ', '').isdigit()):
+                        phone_number = result.strip()
+                        phone_found = True
+                        logger.info(f"Phone found via JS command {i+1}: {phone_number}")
                         break
-                        
-                except NoSuchElementException:
+                except Exception as e:
+                    logger.debug(f"JS command {i+1} failed: {e}")
                     continue
             
-            # Enhanced JS phone extraction - try SS.lv specific phone reveal
+            # If no JS success, look for revealed elements or updated DOM
             if not phone_found:
-                try:
-                    # SS.lv specific phone reveal function
-                    js_commands = [
-                        # Try the main SS.lv phone reveal function
-                        "if(typeof _show_phone === 'function') {try {_show_phone(1, false); console.log('_show_phone called');} catch(e) {console.log('_show_phone failed:', e);}}",
-                        
-                        # Try without CAPTCHA check (some listings might allow it)
-                        "if(typeof _show_phone === 'function') {try {_show_phone(1, 'nocaptcha'); console.log('_show_phone nocaptcha called');} catch(e) {console.log('_show_phone nocaptcha failed:', e);}}",
-                        
-                        # Try other phone functions
-                        "if(typeof _get_phone_key === 'function') {try {_get_phone_key(); console.log('_get_phone_key called');} catch(e) {console.log('_get_phone_key failed:', e);}}",
-                        
-                        # Force show phone elements (bypass some restrictions)
-                        "document.querySelectorAll('#phone_td_1, #ph_td_1, #phdivz_1').forEach(el => {el.style.display = 'block'; if(el.textContent.includes('***')) el.textContent = el.textContent.replace('***', '123');});",
-                        
-                        # Look for phone data in global variables
-                        "if(window.phone_data) {console.log('Phone data:', window.phone_data); return window.phone_data;} if(window.PH_1) {console.log('PH_1:', window.PH_1); return window.PH_1;}",
-                        
-                        # Try to extract from page source patterns
-                        "var phoneMatches = document.documentElement.innerHTML.match(/\\+371[\\d\\-\\s]+/g); if(phoneMatches) {console.log('Phone matches:', phoneMatches); return phoneMatches[0];}",
-                    ]
-                    
-                    for i, cmd in enumerate(js_commands):
-                        try:
-                            result = driver.execute_script(f"return ({cmd})")
-                            if result and isinstance(result, str) and ('+371' in result or result.replace('-', '').replace(' ', '').isdigit()):
-                                phone_number = result.strip()
-                                phone_found = True
-                                logger.info(f"Phone found via JS command {i+1}: {phone_number}")
-                                break
-                            time.sleep(1.5)
-                        except Exception as e:
-                            logger.debug(f"JS command {i+1} failed: {e}")
-                            continue
-                    
-                    # If no JS success, look for revealed elements or updated DOM
-                    if not phone_found:
-                        # Wait for any async phone reveals
-                        time.sleep(3)
-                        
-                        # Check if phone was updated in DOM
-                        phone_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '+371') or (contains(text(), '27') and string-length(text()) > 8) or (contains(text(), '28') and string-length(text()) > 8) or (contains(text(), '29') and string-length(text()) > 8)]")
-                        
-                        for element in phone_elements:
-                            text = element.text.strip()
-                            # Accept phone if it doesn't contain *** and looks like a real number
-                            if (text and len(text) > 8 and 
-                                '***' not in text and 
-                                ('+371' in text or any(text.startswith(prefix) for prefix in ['27', '28', '29', '67', '65'])) and
-                                sum(c.isdigit() for c in text) >= 7):  # At least 7 digits
-                                
-                                phone_number = text
-                                phone_found = True
-                                logger.info(f"Phone found in updated DOM: {phone_number}")
-                                break
-                                
-                except Exception as js_error:
-                    logger.warning(f"SS.lv phone extraction failed: {js_error}")
-            
-            # Final fallback - if we have partial number, indicate it's available but needs manual access
-            if not phone_found:
-                # Look for any partial phone indicators
-                partial_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '***') and (contains(text(), '+371') or contains(text(), '27') or contains(text(), '28') or contains(text(), '29'))]")
-                for element in partial_elements:
+                # Check if phone was updated in DOM
+                phone_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '+371') or (contains(text(), '27') and string-length(text()) > 8) or (contains(text(), '28') and string-length(text()) > 8) or (contains(text(), '29') and string-length(text()) > 8)]")
+                
+                for element in phone_elements:
                     text = element.text.strip()
-                    if '***' in text and any(prefix in text for prefix in ['+371', '27', '28', '29']):
-                        phone_number = 'Tālrunis pieejams (CAPTCHA nepieciešama)'
+                    # Accept phone if it doesn't contain *** and looks like a real number
+                    if (text and len(text) > 8 and 
+                        '***' not in text and 
+                        ('+371' in text or any(text.startswith(prefix) for prefix in ['27', '28', '29', '67', '65'])) and
+                        sum(c.isdigit() for c in text) >= 7):  # At least 7 digits
+                        
+                        phone_number = text
                         phone_found = True
-                        logger.info(f"Partial phone found, CAPTCHA required: {text}")
+                        logger.info(f"Phone found in updated DOM: {phone_number}")
                         break
-            
-            # Cache appropriate result based on what we found
-            if phone_found:
-                phone_cache[listing_id] = phone_number
+                        
+        except Exception as js_error:
+            logger.warning(f"SS.lv phone extraction failed: {js_error}")
+    
+    # Final fallback - if we have partial number, indicate it's available but needs manual access
+    if not phone_found:
+        # Look for any partial phone indicators
+        partial_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '***') and (contains(text(), '+371') or contains(text(), '27') or contains(text(), '28') or contains(text(), '29'))]")
+        for element in partial_elements:
+            text = element.text.strip()
+            if '***' in text and any(prefix in text for prefix in ['+371', '27', '28', '29']):
+                phone_number = 'Tālrunis pieejams (CAPTCHA nepieciešama)'
+                phone_found = True
+                logger.info(f"Partial phone found, CAPTCHA required: {text}")
+                break
+    
+    # Result based on what we found
+    if phone_found:
+        return phone_number
+    else:
+        # Look for partial/masked phone numbers to indicate availability
+        try:
+            masked_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '***') and (contains(text(), '+371') or contains(text(), '27') or contains(text(), '28') or contains(text(), '29'))]")
+            if masked_elements:
+                # Phone is available but requires CAPTCHA
+                logger.info(f"Found CAPTCHA-protected phone: {masked_elements[0].text.strip()}")
+                return f'📞 Pieejams ({masked_elements[0].text.strip()})'
             else:
-                # Look for partial/masked phone numbers to indicate availability
-                try:
-                    masked_elements = driver.find_elements(By.XPATH, "//*[contains(text(), '***') and (contains(text(), '+371') or contains(text(), '27') or contains(text(), '28') or contains(text(), '29'))]")
-                    if masked_elements:
-                        # Phone is available but requires CAPTCHA
-                        phone_cache[listing_id] = f'📞 Pieejams ({masked_elements[0].text.strip()})'
-                        logger.info(f"Found CAPTCHA-protected phone: {masked_elements[0].text.strip()}")
-                    else:
-                        phone_cache[listing_id] = 'Skatīt sludinājumā'
-                except:
-                    phone_cache[listing_id] = 'Skatīt sludinājumā'
-            
-            return phone_cache[listing_id]
-            
-        finally:
-            driver.quit()
-            
-    except Exception as e:
-        logger.warning(f"Selenium phone extraction failed for {listing_id}: {e}")
-        # Cache failure to avoid repeated attempts
-        phone_cache[listing_id] = 'Skatīt sludinājumā'
-        return phone_cache[listing_id]
+                return 'Skatīt sludinājumā'
+        except:
+            return 'Skatīt sludinājumā'
+
+
+def get_http_session() -> requests.Session:
+    """
+    Shared HTTP session for all source checks
+    
+    One keep-alive connection pool (one connection per source) instead of
+    a new session per scrape.
+    """
+    global http_session
+    if http_session is None:
+        session = requests.Session()
+        session.headers.update({
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Language': 'lv,en-US;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive'
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(SS_LV_URLS))
+        session.mount('https://', adapter)
+        http_session = session
+    return http_session
+
+
+def wait_for_request_slot(cancel: Optional[threading.Event] = None) -> bool:
+    """
+    Keep 1..REQUEST_DELAY seconds between requests to ss.lv
+    
+    Shared by all source checks, so running them as separate jobs never
+    sends requests faster than the old serial loop did.
+    
+    Args:
+        cancel: Event that aborts the wait when set
+    
+    Returns:
+        False if the wait was cancelled
+    """
+    global last_request_at
+    with request_slot_lock:
+        delay = last_request_at + random.uniform(1, REQUEST_DELAY) - time.monotonic()
+        if delay > 0:
+            logger.info(f"Waiting {delay:.1f}s before next request...")
+            if cancel is not None:
+                if cancel.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+        last_request_at = time.monotonic()
+    return True
 
 
-def scrape_listings() -> Optional[List[Dict[str, str]]]:
+def parse_listing_rows(content: bytes, url: str) -> List[Dict[str, str]]:
     """
-    Scrape Toyota car listings from multiple ss.lv URLs with anti-blocking measures
+    Parse the listing rows of one ss.lv list page
     
+    Args:
+        content: Page HTML
+        url: Source URL the page was fetched from
+        
     Returns:
         List of dictionaries containing title, price, link, and description
-        Returns None if all requests fail
     """
-    all_listings = []
+    page_listings = []
     
-    # Use session to maintain cookies like a real browser
-    session = requests.Session()
-    session.headers.update({
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'lv,en-US;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive'
-    })
+    soup = BeautifulSoup(content, 'html.parser')
     
-    for i, url in enumerate(SS_LV_URLS):
+    # Find all listing rows (ss.lv uses table structure)
+    # The listings are typically in a table with id="page_main"
+    table_rows = soup.select('tr[id^="tr_"]')
+    
+    for row in table_rows:
         try:
-            # Add minimal delay between requests for faster processing
-            if i > 0:
-                delay = random.uniform(1, REQUEST_DELAY)
-                logger.info(f"Waiting {delay:.1f}s before next request...")
-                time.sleep(delay)
-            
-            logger.info(f"Fetching listings from {url}")
+            # Extract listing details
+            # Title is typically in the second or third td
+            title_element = row.select_one('td.msg2 a.am, td.msga2 a.am')
+            if not title_element:
+                continue
             
-            # Set headers to mimic a browser request with rotating user agents
-            headers = {
-                'User-Agent': random.choice(USER_AGENTS),
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                'Accept-Language': 'lv,en-US;q=0.9,en;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Cache-Control': 'max-age=0'
-            }
+            title = title_element.get_text(strip=True)
+            link = title_element.get('href', '')
             
-            response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            # Extract listing ID from the row id attribute
+            listing_id = row.get('id', '')
             
-            # Handle rate limiting and blocking
-            if response.status_code == 429:
-                logger.warning(f"Rate limited (429) from {url}, waiting 30 seconds...")
-                time.sleep(30)
-                continue
-            elif response.status_code == 403:
-                logger.warning(f"Access forbidden (403) from {url}, IP might be blocked")
-                continue
+            # Make link absolute if it's relative
+            if link and not link.startswith('http'):
+                link = f"https://www.ss.lv{link}"
             
-            response.raise_for_status()
-            logger.info(f"Successfully fetched {len(response.content)} bytes from {url}")
+            # Extract price (it's the last td.msga2-o.pp6 cell in the row)
+            price_elements = row.select('td.msga2-o.pp6')
+            if price_elements:
+                price = price_elements[-1].get_text(strip=True)  # Get the last one (price)
+            else:
+                price = 'N/A'
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Clean up price formatting - ensure EUR is present
+            if price != 'N/A' and 'EUR' not in price.upper() and '€' not in price:
+                # Check if it's a numeric price (may contain spaces, commas, dots)
+                price_clean = price.replace(' ', '').replace(',', '').replace('.', '').replace('?', '')
+                if price_clean.isdigit():
+                    price = f"{price} €"
             
-            # Find all listing rows (ss.lv uses table structure)
-            # The listings are typically in a table with id="page_main"
-            table_rows = soup.select('tr[id^="tr_"]')
+            # Extract phone number (SS.lv often hides phones, try multiple approaches)
+            phone = 'N/A'
             
-            for row in table_rows:
-                try:
-                    # Extract listing details
-                    # Title is typically in the second or third td
-                    title_element = row.select_one('td.msg2 a.am, td.msga2 a.am')
-                    if not title_element:
-                        continue
-                    
-                    title = title_element.get_text(strip=True)
-                    link = title_element.get('href', '')
-                    
-                    # Extract listing ID from the row id attribute
-                    listing_id = row.get('id', '')
-                    
-                    # Make link absolute if it's relative
-                    if link and not link.startswith('http'):
-                        link = f"https://www.ss.lv{link}"
-                    
-                    # Extract price (it's the last td.msga2-o.pp6 cell in the row)
-                    price_elements = row.select('td.msga2-o.pp6')
-                    if price_elements:
-                        price = price_elements[-1].get_text(strip=True)  # Get the last one (price)
+            # Method 1: Check for direct phone display in ads_contacts
+            phone_cell = row.select_one('td.ads_contacts')
+            if phone_cell:
+                phone_text = phone_cell.get_text(strip=True)
+                if phone_text and ('+371' in phone_text or '(' in phone_text):
+                    # Clean up phone display
+                    if 'Parādīt tālruni' in phone_text:
+                        phone = phone_text.replace('Parādīt tālruni', '').strip()
                     else:
-                        price = 'N/A'
-                    
-                    # Clean up price formatting - ensure EUR is present
-                    if price != 'N/A' and 'EUR' not in price.upper() and '€' not in price:
-                        # Check if it's a numeric price (may contain spaces, commas, dots)
-                        price_clean = price.replace(' ', '').replace(',', '').replace('.', '').replace('?', '')
-                        if price_clean.isdigit():
-                            price = f"{price} €"
-                    
-                    # Extract phone number (SS.lv often hides phones, try multiple approaches)
-                    phone = 'N/A'
-                    
-                    # Method 1: Check for direct phone display in ads_contacts
-                    phone_cell = row.select_one('td.ads_contacts')
-                    if phone_cell:
-                        phone_text = phone_cell.get_text(strip=True)
-                        if phone_text and ('+371' in phone_text or '(' in phone_text):
-                            # Clean up phone display
-                            if 'Parādīt tālruni' in phone_text:
-                                phone = phone_text.replace('Parādīt tālruni', '').strip()
-                            else:
-                                phone = phone_text
-                    
-                    # Method 2: Check for phone in right-aligned cells (old structure)
-                    if phone == 'N/A':
-                        phone_candidates = row.select('td.msga2-o.ar, td[align="right"]')
-                        for candidate in phone_candidates:
-                            phone_text = candidate.get_text(strip=True)
-                            if phone_text and ('+371' in phone_text or phone_text.replace('-', '').replace(' ', '').isdigit()):
-                                phone = phone_text
-                                break
-                    
-                    # Method 3: Extract from data attributes or encoded content
-                    if phone == 'N/A':
-                        # Look for phone info in title element's data attribute
-                        title_element = row.select_one('td.msg2 a.am')
-                        if title_element and title_element.get('data'):
-                            # Phone might be encoded in data attribute - mark as available
-                            phone = 'Pieejams sarakstē'
-                    
-                    # Method 4: Check if there's a phone reveal mechanism
-                    if phone == 'N/A':
-                        # Look for phone reveal buttons or spans
-                        phone_reveal = row.select_one('[onclick*="phone"], [id*="phone"], .phone')
-                        if phone_reveal:
-                            phone = 'Noklikšķiniet, lai redzētu'
-                    
-                    # No phone extraction - user requested removal
-                    phone = 'N/A'
-                    
-                    # Extract additional info (description/details)
-                    details_elements = row.select('td.msga2')
-                    description = ' '.join([el.get_text(strip=True) for el in details_elements])
-                    
-                    # For crash page listings, also extract car make/model and condition from table cells
-                    car_make = ''
-                    car_model = ''
-                    car_year = ''
-                    condition_pct = ''
-                    if 'transport-with-defects-or-after-crash' in url:
-                        cells = row.select('td.msga2-o.pp6')
-                        if len(cells) >= 4:
-                            car_make = cells[0].get_text(strip=True) if cells[0] else ''
-                            car_model = cells[1].get_text(strip=True) if cells[1] else ''
-                            car_year = cells[2].get_text(strip=True) if cells[2] else ''
-                            condition_pct = cells[3].get_text(strip=True) if cells[3] else ''
-                    
-                    all_listings.append({
-                        'id': listing_id,
-                        'title': title,
-                        'price': price,
-                        'link': link,
-                        'description': description,
-                        'car_make': car_make,
-                        'car_model': car_model,
-                        'car_year': car_year,
-                        'condition_pct': condition_pct
-                    })
-                    
-                except Exception as e:
-                    logger.warning(f"Error parsing listing row: {e}")
-                    continue
+                        phone = phone_text
+            
+            # Method 2: Check for phone in right-aligned cells (old structure)
+            if phone == 'N/A':
+                phone_candidates = row.select('td.msga2-o.ar, td[align="right"]')
+                for candidate in phone_candidates:
+                    phone_text = candidate.get_text(strip=True)
+                    if phone_text and ('+371' in phone_text or phone_text.replace('-', '').replace(' ', '').isdigit()):
+                        phone = phone_text
+                        break
+            
+            # Method 3: Extract from data attributes or encoded content
+            if phone == 'N/A':
+                # Look for phone info in title element's data attribute
+                title_element = row.select_one('td.msg2 a.am')
+                if title_element and title_element.get('data'):
+                    # Phone might be encoded in data attribute - mark as available
+                    phone = 'Pieejams sarakstē'
+            
+            # Method 4: Check if there's a phone reveal mechanism
+            if phone == 'N/A':
+                # Look for phone reveal buttons or spans
+                phone_reveal = row.select_one('[onclick*="phone"], [id*="phone"], .phone')
+                if phone_reveal:
+                    phone = 'Noklikšķiniet, lai redzētu'
             
-            logger.info(f"Successfully scraped {len(table_rows)} listings from {url}")
+            # No phone extraction - user requested removal
+            phone = 'N/A'
+            
+            # Extract additional info (description/details)
+            details_elements = row.select('td.msga2')
+            description = ' '.join([el.get_text(strip=True) for el in details_elements])
+            
+            # For crash page listings, also extract car make/model and condition from table cells
+            car_make = ''
+            car_model = ''
+            car_year = ''
+            condition_pct = ''
+            engine = ''
+            cells = row.select('td.msga2-o.pp6')
+            if 'transport-with-defects-or-after-crash' in url:
+                if len(cells) >= 4:
+                    car_make = cells[0].get_text(strip=True) if cells[0] else ''
+                    car_model = cells[1].get_text(strip=True) if cells[1] else ''
+                    car_year = cells[2].get_text(strip=True) if cells[2] else ''
+                    condition_pct = cells[3].get_text(strip=True) if cells[3] else ''
+            elif len(cells) >= 5:
+                # Car sections: model, year, engine ("1.6", "2.0D"), mileage, price
+                car_year = cells[1].get_text(strip=True)
+                engine = cells[2].get_text(strip=True)
+            
+            page_listings.append({
+                'id': listing_id,
+                'title': title,
+                'price': price,
+                'link': link,
+                'description': description,
+                'car_make': car_make,
+                'car_model': car_model,
+                'car_year': car_year,
+                'condition_pct': condition_pct,
+                'engine': engine
+            })
             
-        except requests.exceptions.Timeout:
-            logger.error(f"Request timeout while fetching from {url}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error from {url}: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error while scraping {url}: {e}")
+            logger.warning(f"Error parsing listing row: {e}")
+            continue
+    
+    logger.info(f"Successfully scraped {len(table_rows)} listings from {url}")
+    return page_listings
+
+
+def scrape_source(url: str, only_changed: bool = False, cancel: Optional[threading.Event] = None) -> Optional[List[Dict[str, str]]]:
+    """
+    Scrape one ss.lv source URL
+    
+    The page is requested conditionally (ETag / Last-Modified / rows hash).
+    An unchanged page is not parsed again: with only_changed=True it gives
+    no listings, otherwise its previous listings are reused. The outcome is
+    recorded in source_status[url] ('ok', 'unchanged', 'error', 'backoff',
+    'cancelled').
+    
+    A 429 pauses this source for RATE_LIMIT_BACKOFF seconds instead of
+    sleeping, so other sources keep being checked.
+    
+    Args:
+        url: Source URL
+        only_changed: Return no listings if the page is unchanged
+        cancel: Event set by the caller to abandon the scrape (checked
+            before the request is sent)
+    
+    Returns:
+        List of listings, or None if the request failed
+    """
+    global source_listings_version
+    
+    if time.monotonic() < source_backoff_until.get(url, 0):
+        logger.info(f"Rate limit backoff active for {url}, skipping")
+        source_status[url] = 'backoff'
+        return None
+    
+    try:
+        if not wait_for_request_slot(cancel) or (cancel is not None and cancel.is_set()):
+            logger.info(f"Scrape of {url} cancelled")
+            source_status[url] = 'cancelled'
+            return None
+        logger.info(f"Fetching listings from {url}")
+        
+        # Set headers to mimic a browser request with rotating user agents
+        headers = {
+            'User-Agent': random.choice(USER_AGENTS),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+            'Accept-Language': 'lv,en-US;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Sec-Fetch-User': '?1',
+            'Cache-Control': 'max-age=0'
+        }
+        headers.update(page_cache.conditional_headers(url))
+        
+        response = get_http_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        
+        # Handle rate limiting and blocking
+        if response.status_code == 429:
+            logger.warning(f"Rate limited (429) from {url}, pausing this source for {RATE_LIMIT_BACKOFF} seconds")
+            source_backoff_until[url] = time.monotonic() + RATE_LIMIT_BACKOFF
+            source_status[url] = 'backoff'
+            return None
+        elif response.status_code == 403:
+            logger.warning(f"Access forbidden (403) from {url}, IP might be blocked")
+            source_status[url] = 'error'
+            return None
+        
+        if response.status_code != 304:
+            response.raise_for_status()
+        
+        if not page_cache.update(url, response.status_code, response.headers, response.content):
+            logger.info(f"Page unchanged since last check, skipping parse: {url}")
+            source_status[url] = 'unchanged'
+            source_fetched_at[url] = time.monotonic()
+            return [] if only_changed else source_listings.get(url, [])
+        
+        logger.info(f"Successfully fetched {len(response.content)} bytes from {url}")
+        page_listings = parse_listing_rows(response.content, url)
+        with source_listings_lock:
+            source_listings[url] = page_listings
+            source_listings_version += 1
+        source_fetched_at[url] = time.monotonic()
+        source_status[url] = 'ok'
+        return page_listings
+        
+    except requests.exceptions.Timeout:
+        logger.error(f"Request timeout while fetching from {url}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request error from {url}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error while scraping {url}: {e}")
+    page_cache.invalidate(url)
+    source_status[url] = 'error'
+    return None
+
+
+def scrape_listings(only_changed: bool = False, cancel: Optional[threading.Event] = None, max_age: float = 0) -> Optional[List[Dict[str, str]]]:
+    """
+    Scrape Toyota car listings from all ss.lv URLs with anti-blocking measures
     
-    if not all_listings:
+    Blocking: call it through run_in_worker() from async code.
+    
+    Args:
+        only_changed: Return listings from changed pages only
+        cancel: Event set by the caller to stop before the next source
+        max_age: Reuse the listings of a source fetched (e.g. by its
+            scheduled check) at most this many seconds ago instead of
+            requesting it again. Ignored with only_changed.
+    
+    Returns:
+        List of dictionaries containing title, price, link, and description
+        Returns None if all requests fail
+    """
+    all_listings = []
+    pages_ok = 0
+    pages_skipped = 0
+    pages_reused = 0
+    
+    for url in SS_LV_URLS:
+        if cancel is not None and cancel.is_set():
+            logger.info("Scrape cancelled, skipping remaining sources")
+            return None
+        fetched_at = source_fetched_at.get(url)
+        if (max_age and not only_changed and url in source_listings
+                and fetched_at is not None and time.monotonic() - fetched_at <= max_age):
+            logger.info(f"Reusing listings of {url} fetched {time.monotonic() - fetched_at:.0f}s ago")
+            pages_ok += 1
+            pages_reused += 1
+            all_listings.extend(source_listings[url])
+            continue
+        listings = scrape_source(url, only_changed, cancel)
+        if listings is None:
+            continue
+        pages_ok += 1
+        if source_status.get(url) == 'unchanged':
+            pages_skipped += 1
+        all_listings.extend(listings)
+    
+    last_scrape_stats.clear()
+    last_scrape_stats.update({
+        'pages': len(SS_LV_URLS),
+        'pages_skipped': pages_skipped,
+        'pages_reused': pages_reused,
+        'listings': len(all_listings)
+    })
+    logger.info(f"Cycle report: {len(all_listings)} listings from {len(SS_LV_URLS)} pages ({pages_skipped} unchanged, skipped; {pages_reused} reused)")
+    
+    if not pages_ok:
         logger.error("Failed to fetch listings from all URLs")
         return None
     
+    if not all_listings and not only_changed:
+        logger.error("No listings found on any URL")
+        return None
+    
     logger.info(f"Total scraped {len(all_listings)} listings from all sources")
     return all_listings
 
 
+def get_search_index() -> ListingIndex:
+    """
+    Search index over the current listing snapshot
+    
+    The snapshot is what the scheduled checks last parsed for every source
+    (source_listings), filtered like the notifications (filter_all_listings)
+    and without duplicates of listings shown on several pages. The index is
+    rebuilt only after a source page has changed.
+    
+    Returns:
+        ListingIndex of the snapshot
+    """
+    global search_index, search_index_version
+    
+    with source_listings_lock:
+        version = source_listings_version
+        pages = [source_listings.get(url, []) for url in SS_LV_URLS]
+    
+    if search_index is None or search_index_version != version:
+        unique = {}
+        for page_listings in pages:
+            for listing in page_listings:
+                unique.setdefault(listing.get('id') or listing['link'], listing)
+        search_index = ListingIndex(filter_all_listings(list(unique.values())))
+        search_index_version = version
+        logger.info(f"Search index rebuilt: {len(search_index)} listings")
+    return search_index
+
+
+def snapshot_age() -> Optional[float]:
+    """Seconds since the least recently checked source was fetched, None before the first check"""
+    if not source_fetched_at:
+        return None
+    return time.monotonic() - min(source_fetched_at.values())
+
+
+async def run_in_worker(func, *args, timeout: float, on_finished=None):
+    """
+    Run a blocking scrape function in scrape_executor without blocking the
+    event loop
+    
+    The function is called with a threading.Event as ``cancel``. If the
+    caller times out or is cancelled the event is set, and the scrape stops
+    at its next checkpoint instead of running on in the background.
+    
+    Args:
+        func: Blocking function accepting a ``cancel`` keyword argument
+        *args: Positional arguments for func
+        timeout: Seconds to wait for the result
+        on_finished: Called on the event loop once func has really returned
+            (after a timeout that is later than this coroutine)
+    
+    Returns:
+        Return value of func
+    
+    Raises:
+        asyncio.TimeoutError: func did not finish within timeout
+    """
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+    
+    def work():
+        try:
+            return func(*args, cancel=cancel)
+        finally:
+            if on_finished is not None:
+                try:
+                    loop.call_soon_threadsafe(on_finished)
+                except RuntimeError:
+                    pass  # event loop already closed
+    
+    future = loop.run_in_executor(scrape_executor, work)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except BaseException:
+        cancel.set()
+        raise
+
+
 def filter_defective_cars(listings: List[Dict[str, str]]) -> List[Dict[str, str]]:
     """
     Filter listings for Land Cruiser and Hilux with "defekti" keyword
@@ -746,12 +1195,17 @@ def filter_all_listings(listings: List[Dict[str, str]]) -> List[Dict[str, str]]:
     return all_filtered
 
 
-def format_listings_message(listings: List[Dict[str, str]]) -> tuple:
+def format_listings_message(listings: List[Dict[str, str]], start: int = 1, total: Optional[int] = None) -> tuple:
     """
     Format listings into a clean Telegram message with inline keyboard buttons
     
+    The text is Markdown (send it with parse_mode=ParseMode.MARKDOWN);
+    listing texts are escaped.
+    
     Args:
         listings: List of car listings
+        start: Number of the first listing (for later pages of a result set)
+        total: Size of the whole result set (default len(listings))
         
     Returns:
         Tuple of (formatted message string, inline keyboard markup)
@@ -759,39 +1213,40 @@ def format_listings_message(listings: List[Dict[str, str]]) -> tuple:
     if not listings:
         return ("Nav jaunu sludinājumu / No new listings found.", None)
     
-    message = f"🚗 *Jauni Toyota sludinājumi* ({len(listings)} gab.)\n\n"
+    message = f"🚗 *Jauni Toyota sludinājumi* ({total if total is not None else len(listings)} gab.)\n\n"
     keyboard_buttons = []
     
-    for i, listing in enumerate(listings, 1):
-        title = listing['title']
-        price = listing['price']
-        link = listing['link']
-        
-        # Generate crash labels
-        crash_labels = generate_crash_labels(listing)
-        
-        message += f"{i}. *{title}*\n"
-        
-        # Add crash labels if available
-        if crash_labels:
-            message += f"🏷️ {crash_labels}\n"
-        
-        # Add car details for crash listings
-        car_make = listing.get('car_make', '')
-        car_model = listing.get('car_model', '')
-        car_year = listing.get('car_year', '')
-        if car_make and car_model:
-            message += f"🚗 {car_make} {car_model}" + (f" ({car_year})" if car_year else "") + "\n"
-        
-        message += f"💰 Cena: `{price}`\n\n"
+    for i, listing in enumerate(listings, start):
+        message += format_listing_entry(i, listing)
         
         # Add button for this listing
-        keyboard_buttons.append([InlineKeyboardButton(f"🔗 Skatīt {i}", url=link)])
+        keyboard_buttons.append([InlineKeyboardButton(f"🔗 Skatīt {i}", url=listing['link'])])
     
     keyboard = InlineKeyboardMarkup(keyboard_buttons) if keyboard_buttons else None
     return (message, keyboard)
 
 
+def format_listing_entry(number: int, listing: Dict[str, str]) -> str:
+    """One numbered listing of format_listings_message (Markdown)"""
+    title = escape_markdown(listing['title'])
+    price = listing['price'].replace('`', "'")
+    entry = f"{number}. *{title}*\n"
+    
+    # Add crash labels if available
+    crash_labels = generate_crash_labels(listing)
+    if crash_labels:
+        entry += f"🏷️ {crash_labels}\n"
+    
+    # Add car details for crash listings
+    car_make = escape_markdown(listing.get('car_make', ''))
+    car_model = escape_markdown(listing.get('car_model', ''))
+    car_year = escape_markdown(listing.get('car_year', ''))
+    if car_make and car_model:
+        entry += f"🚗 {car_make} {car_model}" + (f" ({car_year})" if car_year else "") + "\n"
+    
+    return entry + f"💰 Cena: `{price}`\n\n"
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle /start command - greet user and explain bot usage
@@ -810,7 +1265,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "/start - Show this welcome message\n"
             "/subscribe - Get instant notifications for new listings\n"
             "/unsubscribe - Stop receiving notifications\n"
-            "/search - Search current matching listings\n\n"
+            "/search - Search current matching listings\n"
+            "   e.g. /search hilux <15000 2010-\n"
+            "/filter - Only get notified about your own criteria\n"
+            "   e.g. /filter hilux <15000, land cruiser dīzelis\n\n"
             "⚡ Instant notifications - get alerts within 40 seconds!\n\n"
             "🔍 Monitoring:\n"
             "• 🚘 All Petrol/Benzin Toyotas\n"
@@ -828,7 +1286,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "/start - Show this welcome message\n"
             "/subscribe - Get instant notifications for new listings\n"
             "/unsubscribe - Stop receiving notifications\n"
-            "/search - Search current matching listings\n\n"
+            "/search - Search current matching listings\n"
+            "   e.g. /search hilux <15000 2010-\n"
+            "/filter - Only get notified about your own criteria\n"
+            "   e.g. /filter hilux <15000, land cruiser dīzelis\n\n"
             "⚡ Instant notifications - get alerts within 40 seconds!\n\n"
             "🔍 Monitoring:\n"
             "• All petrol/gasoline Toyotas\n"
@@ -860,6 +1321,7 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
     else:
         subscribed_users.add(user_id)
+        notification_outbox.revive(user_id)
         message = (
             "✅ Subscribed to instant notifications!\n\n"
             "You will receive alerts for:\n"
@@ -882,6 +1344,7 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     if user_id in subscribed_users:
         subscribed_users.remove(user_id)
+        notification_outbox.cancel_chat(user_id)
         message = "❌ Unsubscribed from notifications."
     else:
         message = "You are not currently subscribed to notifications."
@@ -890,43 +1353,124 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     logger.info(f"User {user_id} unsubscribed from notifications")
 
 
+async def filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handle /filter command - save, show or clear the user's own criteria
+    
+    /filter hilux <15000 2010-, land cruiser dīzelis  saves two filters
+    (same syntax as /search, separated by commas); the user then only gets
+    notifications for listings matching one of them. /filter shows the
+    saved filters, /filter off goes back to the default rules.
+    """
+    user_id = update.effective_user.id
+    auto_subscribe_user(user_id)
+    args = context.args or []
+    
+    if not args:
+        queries = subscription_index.get(user_id)
+        if queries:
+            message = "🎯 Your filters:\n" + "\n".join(f"• {query.describe()}" for query in queries)
+        else:
+            message = "🎯 No filters saved - you get all listings matching the default rules."
+        await update.message.reply_text(
+            message + "\n\n"
+            "Usage: /filter [model] [fuel] [defekts] [price] [year], ...\n"
+            "Example: /filter hilux <15000 2010-, land cruiser dīzelis\n"
+            "/filter off - back to the default rules"
+        )
+        return
+    
+    if len(args) == 1 and args[0].lower() in ('off', 'clear', 'reset'):
+        subscription_index.remove(user_id)
+        save_filters()
+        await update.message.reply_text("🎯 Filters removed - you get all listings matching the default rules.")
+        logger.info(f"User {user_id} removed their filters")
+        return
+    
+    try:
+        queries = parse_filters(args)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❓ {e}\n\n"
+            "Usage: /filter [model] [fuel] [defekts] [price] [year], ...\n"
+            "Example: /filter hilux <15000 2010-, land cruiser dīzelis"
+        )
+        return
+    
+    subscription_index.set(user_id, queries)
+    save_filters()
+    await update.message.reply_text(
+        "✅ Filters saved. You will be notified about new listings matching:\n"
+        + "\n".join(f"• {query.describe()}" for query in queries)
+    )
+    logger.info(f"User {user_id} saved filters: {[query.describe() for query in queries]}")
+
+
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle /search command - search for matching Toyota listings
+    
+    Answers from the in-memory snapshot kept up to date by the scheduled
+    checks, so no request is sent to ss.lv. Only while some source has not
+    been parsed yet (right after a start) the missing sources are scraped
+    once, shared with concurrent /search calls.
+    
+    Optional arguments narrow the results, e.g. /search hilux <15000 2010-
+    (see listing_index.parse_search_query).
     """
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} requested search listings")
+    logger.info(f"User {user_id} requested search listings {context.args or ''}")
     
     # Auto-subscribe user if enabled
     newly_subscribed = auto_subscribe_user(user_id)
     
-    await update.message.reply_text("🔍 Searching for matching listings...")
+    try:
+        query = parse_search_query(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❓ {e}\n\n"
+            "Usage: /search [model] [fuel] [defekts] [price] [year]\n"
+            "Example: /search hilux dīzelis <15000 2010-"
+        )
+        return
     
     try:
-        listings = scrape_listings()
-        
-        if listings is None:
-            error_message = (
-                "❌ Failed to fetch listings from ss.lv.\n"
-                "Please try again later or check your internet connection."
+        if any(url not in source_listings for url in SS_LV_URLS):
+            await update.message.reply_text("🔍 Searching for matching listings...")
+            # Shared with every /search arriving while this scrape runs
+            listings = await search_flight.run(
+                'listings',
+                lambda: run_in_worker(partial(scrape_listings, max_age=SEARCH_MAX_AGE), timeout=SEARCH_TIMEOUT)
             )
-            await update.message.reply_text(error_message)
-            return
+            
+            if listings is None:
+                error_message = (
+                    "❌ Failed to fetch listings from ss.lv.\n"
+                    "Please try again later or check your internet connection."
+                )
+                await update.message.reply_text(error_message)
+                return
         
-        benzina_listings = filter_all_listings(listings)
-        message, keyboard = format_listings_message(benzina_listings)
+        # Results stay server-side; the buttons page through them
+        age = snapshot_age()
+        cursor_id = search_cursors.create(
+            get_search_index().search(query),
+            header=f"🔎 {escape_markdown(query.describe())}\n\n" if not query.is_empty() else '',
+            snapshot_at=time.monotonic() - age if age is not None else None
+        )
+        message, keyboard = render_search_page(cursor_id, 0)
         
         # Add subscription notice if user was auto-subscribed
         if newly_subscribed:
             message += "\n\n✅ You've been automatically subscribed to notifications!"
         
-        if len(message) > 4096:
-            parts = [message[i:i+4096] for i in range(0, len(message), 4096)]
-            for part in parts:
-                await update.message.reply_text(part)
-        else:
-            await update.message.reply_text(message, reply_markup=keyboard)
+        await update.message.reply_text(message, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
             
+    except asyncio.TimeoutError:
+        logger.error(f"Search scrape timed out after {SEARCH_TIMEOUT}s")
+        await update.message.reply_text(
+            "⌛ ss.lv is responding slowly. Please try again in a minute."
+        )
     except Exception as e:
         logger.error(f"Error in search_command: {e}")
         await update.message.reply_text(
@@ -934,22 +1478,128 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
-async def send_notifications_async(context: ContextTypes.DEFAULT_TYPE, new_listings: List[Dict[str, str]]) -> None:
+def render_search_page(cursor_id: str, page: int) -> Optional[tuple]:
     """
-    Asynchronously send notifications to all subscribed users
+    One page of a stored /search result set with Prev / Next buttons
     
     Args:
-        context: Telegram context
-        new_listings: List of new listings to send
+        cursor_id: Cursor from search_cursors
+        page: Page number (0-based, clamped to the valid range)
+    
+    A page holds up to SEARCH_PAGE_SIZE listings, as many as fit in one
+    Telegram message (long titles make for shorter pages).
+    
+    Returns:
+        Tuple of (Markdown message, inline keyboard markup), or None if
+        the cursor has expired
     """
-    if not subscribed_users or not new_listings:
+    entry = search_cursors.get(cursor_id)
+    if entry is None:
+        return None
+    budget = TELEGRAM_MESSAGE_LIMIT - SEARCH_PAGE_RESERVE - len(entry.get('header', ''))
+    
+    def size(listing):
+        return len(format_listing_entry(len(entry['results']), listing))
+    
+    listings, page, pages = search_cursors.page(cursor_id, page, SEARCH_PAGE_SIZE, size=size, budget=budget)
+    start = search_cursors.page_starts(entry, SEARCH_PAGE_SIZE, size, budget)[page]
+    
+    message, keyboard = format_listings_message(listings, start=start + 1, total=len(entry['results']))
+    if entry.get('header'):
+        message = entry['header'] + message
+    if entry.get('snapshot_at') is not None:
+        message += f"\n🕒 Updated {int(time.monotonic() - entry['snapshot_at'])}s ago"
+    
+    rows = list(keyboard.inline_keyboard) if keyboard else []
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"search:{cursor_id}:{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="search:noop"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("Next ➡️", callback_data=f"search:{cursor_id}:{page + 1}"))
+        rows.append(navigation)
+    
+    return (message, InlineKeyboardMarkup(rows) if rows else None)
+
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handle the Prev / Next buttons of /search results
+    
+    The page is cut from the cached result set of the cursor; nothing is
+    scraped or filtered again.
+    """
+    callback = update.callback_query
+    parts = callback.data.split(':')
+    if len(parts) != 3 or not parts[2].isdigit():
+        await callback.answer()
+        return
+    
+    page = render_search_page(parts[1], int(parts[2]))
+    if page is None:
+        await callback.answer("⌛ These results have expired, please send /search again.")
         return
     
-    logger.info(f"Sending async notifications to {len(subscribed_users)} users about {len(new_listings)} new listings")
+    await callback.answer()
+    message, keyboard = page
+    await callback.edit_message_text(message, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+
+
+def forget_subscriber(user_id: int) -> None:
+    """Drop a user who blocked the bot from the subscribers"""
+    logger.warning(f"User {user_id} blocked the bot - removed from subscribers")
+    subscribed_users.discard(user_id)
+
+
+def get_notification_dispatcher(bot) -> NotificationDispatcher:
+    """
+    Dispatcher sending through ``bot`` (a new one after the application was
+    restarted with a new bot instance); with EXTRA_BOT_TOKENS a BotPool of
+    ``bot`` and the extra bots
+    """
+    global notification_dispatcher
+    if notification_dispatcher is None or notification_dispatcher.send != bot.send_message:
+        options = dict(
+            on_forbidden=forget_subscriber,
+            chat_rates={BROADCAST_CHAT_ID: GROUP_RATE} if BROADCAST_CHAT_ID else None,
+        )
+        if EXTRA_BOT_TOKENS:
+            notification_dispatcher = BotPool(
+                [bot] + [Bot(token) for token in EXTRA_BOT_TOKENS],
+                primary_only=notification_outbox.primary_only_chats(),
+                on_primary_only=notification_outbox.mark_primary_only,
+                **options,
+            )
+        else:
+            notification_dispatcher = NotificationDispatcher(bot.send_message, **options)
+    return notification_dispatcher
+
+
+async def close_notification_dispatcher(application: Application) -> None:
+    """Stop the dispatcher and shut down the extra bots of a BotPool (post_shutdown)"""
+    global notification_dispatcher
+    if notification_dispatcher is not None:
+        await notification_dispatcher.close()
+        notification_dispatcher = None
+
+
+def queue_notifications(new_listings: List[Dict[str, str]], recipients: Optional[Dict[str, set]] = None) -> int:
+    """
+    Store the notifications about new listings in the outbox
+    
+    A (listing, user) pair is queued only once: a listing found again (by
+    another source, or after a restart) adds no second delivery.
     
-    # Create all notification tasks
-    tasks = []
+    Args:
+        new_listings: List of new listings to notify about
+        recipients: Chats to notify per listing ID (default: all subscribed
+            users, or the broadcast channel and the users with filters)
     
+    Returns:
+        Number of deliveries added
+    """
+    queued = 0
     for listing in new_listings:
         # Generate crash labels for notification
         crash_labels = generate_crash_labels(listing)
@@ -976,23 +1626,83 @@ async def send_notifications_async(context: ContextTypes.DEFAULT_TYPE, new_listi
         # Create inline keyboard with link button
         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🔗 Skatīt sludinājumu", url=link)]])
         
-        # Create tasks for sending to all users for this listing
-        for user_id in subscribed_users.copy():
-            task = context.bot.send_message(chat_id=user_id, text=notification, reply_markup=keyboard)
-            tasks.append(task)
-    
-    if tasks:
-        # Execute all tasks concurrently with proper error handling
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Process results and handle errors
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Error sending async notification {i}: {result}")
-                # Handle blocked users
-                if "Forbidden" in str(result):
-                    # Find which user to remove (this is simplified)
-                    logger.warning("User blocked bot - removed from subscribers")
+        listing_id = listing.get('id', link)
+        if recipients is not None:
+            chat_ids = recipients[listing_id]
+        else:
+            chat_ids = default_recipients() | (subscribed_users & subscription_index.users())
+        queued += notification_outbox.enqueue(listing_id, chat_ids, message_payload(notification, reply_markup=keyboard))
+    return queued
+
+
+async def deliver_notifications(bot) -> Dict[str, int]:
+    """
+    Send every due outbox row through the NotificationDispatcher
+    
+    Each row is marked sent (or scheduled for a retry) as soon as its own
+    message went out, so a restart resumes exactly with the rows that were
+    not delivered yet. A user who blocked the bot loses all pending rows at
+    once and is unsubscribed.
+    
+    Args:
+        bot: Bot to send with
+    
+    Returns:
+        Outcome counts ('sent', 'retry', 'failed', 'dead')
+    """
+    dispatcher = get_notification_dispatcher(bot)
+    outcomes = await drain_outbox(notification_outbox, dispatcher)
+    if any(outcomes.values()):
+        stats = dispatcher.stats()
+        logger.info(
+            f"Outbox: {outcomes} "
+            f"({stats['throughput']:.1f} msg/s, {stats['flood_waits']} flood waits so far)"
+        )
+    return outcomes
+
+
+async def send_notifications_async(context: ContextTypes.DEFAULT_TYPE, new_listings: List[Dict[str, str]]) -> None:
+    """
+    Send notifications about new listings to all subscribed users (or to
+    the broadcast channel, see BROADCAST_CHAT_ID)
+    
+    The notifications are stored in the outbox first and then delivered
+    through the NotificationDispatcher: Telegram's global and per-chat rate
+    limits are respected, a RetryAfter only delays the chat it came from,
+    and users who blocked the bot are unsubscribed.
+    
+    Args:
+        context: Telegram context
+        new_listings: List of new listings to send
+    """
+    if not (subscribed_users or BROADCAST_CHAT_ID) or not new_listings:
+        return
+    
+    target = f"channel {BROADCAST_CHAT_ID}" if BROADCAST_CHAT_ID else f"{len(subscribed_users)} users"
+    logger.info(f"Sending async notifications to {target} about {len(new_listings)} new listings")
+    
+    queue_notifications(new_listings)
+    await deliver_notifications(context.bot)
+
+
+async def drain_outbox_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Scheduled task delivering outbox rows that are due: rows left over from
+    before a restart and retries after failed sends. Also drops finished
+    rows older than a week.
+    """
+    try:
+        await deliver_notifications(context.bot)
+        notification_outbox.purge()
+    except Exception as e:
+        logger.error(f"Error draining the outbox: {e}")
+
+
+async def log_handler_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Scheduled task logging the latency of every command handler so far"""
+    processor = context.application.update_processor
+    if isinstance(processor, PerChatUpdateProcessor) and processor.stats():
+        logger.info(f"Handler latency (at most {processor.max_running} at once):\n{processor.summary()}")
 
 
 async def auto_start_monitoring(application) -> None:
@@ -1006,59 +1716,107 @@ async def auto_start_monitoring(application) -> None:
         logger.info("Auto-start disabled")
 
 
+async def process_source_listings(context: ContextTypes.DEFAULT_TYPE, url: str, listings: List[Dict[str, str]]) -> None:
+    """
+    Filter freshly scraped listings of one source and notify about new ones
+    
+    Args:
+        context: Telegram context
+        url: Source URL the listings came from
+        listings: Listings scraped from that source
+    """
+    # seen_listing_ids starts empty: in broadcast mode the channel would get
+    # every listing again after a restart, so the first check of a source
+    # only records what is already listed
+    seeding = bool(BROADCAST_CHAT_ID) and url not in seeded_sources
+    seeded_sources.add(url)
+    
+    # Smart filtering based on source URL (the default rules)
+    defective_listings = filter_all_listings(listings)
+    default_ids = {listing.get('id', listing['link']) for listing in defective_listings}
+    
+    # Find NEW listings (not seen before) and who wants each of them: all
+    # listings, saved filters may match ones the default rules leave out
+    new_listings = []
+    recipients = {}
+    for listing in listings:
+        listing_id = listing.get('id', listing['link'])
+        if listing_id not in seen_listing_ids:
+            new_listings.append(listing)
+            recipients[listing_id] = notification_recipients(listing, listing_id in default_ids)
+    to_notify = [listing for listing in new_listings if recipients[listing.get('id', listing['link'])]]
+    new_matching = [listing for listing in new_listings if listing.get('id', listing['link']) in default_ids]
+    
+    # Only send notifications if some subscribed user wants them
+    if seeding:
+        logger.info(f"First check of {url}: {len(new_listings)} listings marked as seen, nothing posted to the channel")
+        to_notify = []
+    elif to_notify:
+        users = set().union(*recipients.values())
+        logger.info(f"Found {len(to_notify)} NEW listings on {url} - sending to {len(users)} users")
+        
+        # Queue the notifications durably BEFORE marking as seen: after a crash
+        # in between the listings are found again and the outbox ignores them
+        queue_notifications(to_notify, recipients)
+    elif new_matching:
+        logger.info(f"Found {len(new_matching)} new listings on {url}, but no subscribed user wants them")
+    else:
+        logger.info(f"No new listings on {url}. Total matching: {len(defective_listings)}, all previously seen")
+    
+    for listing in new_listings:
+        seen_listing_ids.add(listing.get('id', listing['link']))
+    
+    if to_notify:
+        # Deliver everything due (these listings and any older pending rows)
+        await deliver_notifications(context.bot)
+    
+    # Update context
+    context.bot_data.setdefault('last_check', {})[url] = {
+        'time': datetime.now(),
+        'total': len(defective_listings),
+        'new': len(new_matching),
+        'status': source_status.get(url)
+    }
+
+
 async def scheduled_check(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Scheduled task to check for new Toyota listings
+    Scheduled task to check one source (context.job.data) for new Toyota listings
     Sends instant notifications to subscribed users for new listings only
+    
+    Every source has its own job. The scrape runs in a worker thread and is
+    waited for at most SOURCE_CHECK_TIMEOUT seconds (then cancelled), so a
+    slow or hung source never delays the checks of the other sources. A run
+    is skipped while the previous scrape of the same source is still in
+    progress.
     """
-    logger.info("Running scheduled check for new Toyota listings")
+    url = context.job.data
+    
+    if url in sources_in_progress:
+        logger.warning(f"Previous check of {url} is still running, skipping this run")
+        return
+    
+    logger.info(f"Running scheduled check of {url}")
+    sources_in_progress.add(url)
     
     try:
-        listings = scrape_listings()
+        # The guard is released when the scrape really finishes, even after a timeout
+        listings = await run_in_worker(
+            scrape_source, url, True,
+            timeout=SOURCE_CHECK_TIMEOUT,
+            on_finished=lambda: sources_in_progress.discard(url)
+        )
         
         if listings is None:
-            logger.warning("Scheduled check: Failed to fetch listings")
+            logger.warning(f"Scheduled check: Failed to fetch listings from {url}")
             return
         
-        # Smart filtering based on source URL
-        defective_listings = filter_all_listings(listings)
-        
-        # Find NEW listings (not seen before)
-        new_listings = []
-        for listing in defective_listings:
-            listing_id = listing.get('id', listing['link'])
-            if listing_id not in seen_listing_ids:
-                new_listings.append(listing)
-        
-        # Only send notifications if there are subscribed users
-        if new_listings and subscribed_users:
-            logger.info(f"Found {len(new_listings)} NEW listings - sending to {len(subscribed_users)} users")
-            
-            # Mark all as seen BEFORE sending (to avoid duplicates)
-            for listing in new_listings:
-                listing_id = listing.get('id', listing['link'])
-                seen_listing_ids.add(listing_id)
-            
-            # Send all notifications asynchronously
-            await send_notifications_async(context, new_listings)
-        elif new_listings:
-            logger.info(f"Found {len(new_listings)} new listings, but no subscribed users")
-            # Still mark them as seen
-            for listing in new_listings:
-                listing_id = listing.get('id', listing['link'])
-                seen_listing_ids.add(listing_id)
-        else:
-            logger.info(f"No new listings found. Total matching: {len(defective_listings)}, all previously seen")
-        
-        # Update context
-        context.bot_data['last_check'] = {
-            'time': datetime.now(),
-            'total': len(defective_listings),
-            'new': len(new_listings)
-        }
+        await process_source_listings(context, url, listings)
     
+    except asyncio.TimeoutError:
+        logger.error(f"Scheduled check of {url} timed out after {SOURCE_CHECK_TIMEOUT}s")
     except Exception as e:
-        logger.error(f"Error in scheduled check: {e}")
+        logger.error(f"Error in scheduled check of {url}: {e}")
 
 
 def main() -> None:
@@ -1075,11 +1833,28 @@ def main() -> None:
     if not create_lock_file():
         return
     
+    # Pending notifications survive restarts in the outbox file
+    global notification_outbox
+    for state_file in (OUTBOX_FILE, FILTERS_FILE):
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+    notification_outbox = Outbox(OUTBOX_FILE)
+    if BROADCAST_CHAT_ID and notification_outbox.revive(BROADCAST_CHAT_ID):
+        logger.info(f"Broadcast chat {BROADCAST_CHAT_ID} was marked dead - trying it again")
+    logger.info(f"Outbox: {notification_outbox.counts()}")
+    load_filters()
+    
     try:
         while True:
             try:
                 # Create application
-                application = Application.builder().token(TELEGRAM_TOKEN).build()
+                # Handlers run concurrently (a slow /search doesn't hold up other users),
+                # the updates of one chat still one after another
+                builder = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(
+                    PerChatUpdateProcessor()
+                ).post_shutdown(close_notification_dispatcher)
+                if TELEGRAM_API_URL:
+                    builder = builder.base_url(f"{TELEGRAM_API_URL}/bot")
+                application = builder.build()
                 
                 # Add error handler for conflicts and other errors
                 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1107,6 +1882,9 @@ def main() -> None:
                 application.add_handler(CommandHandler("subscribe", subscribe_command))
                 application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
                 application.add_handler(CommandHandler("search", search_command))
+                application.add_handler(CommandHandler("filter", filter_command))
+                application.add_handler(CallbackQueryHandler(search_page_callback, pattern=r'^search:'))
+                application.update_processor.track_commands(application)
                 
                 # Setup job queue for scheduled tasks
                 job_queue = application.job_queue
@@ -1125,18 +1903,24 @@ def main() -> None:
                         when=5  # Wait 5 seconds for bot to be ready
                     )
                 
-                # Add scheduled job for instant notifications (runs every 40 seconds)
-                async def scheduled_check_wrapper(context):
-                    try:
-                        await scheduled_check(context)
-                    except Exception as e:
-                        logger.error(f"Error in scheduled_check_wrapper: {e}")
-                
+                # Outbox rows left over from the last run are sent right away,
+                # failed sends are retried by the same job
+                job_queue.run_repeating(drain_outbox_job, interval=OUTBOX_DRAIN_INTERVAL, first=1, name="outbox")
                 job_queue.run_repeating(
-                    scheduled_check_wrapper,
-                    interval=CHECK_INTERVAL,
-                first=30  # First run after 30 seconds
-            )
+                    log_handler_metrics, interval=HANDLER_METRICS_INTERVAL, first=HANDLER_METRICS_INTERVAL,
+                    name="handler metrics"
+                )
+                
+                # One scheduled job per source, each with its own interval;
+                # first runs are staggered so the sources don't start together
+                for i, url in enumerate(SS_LV_URLS):
+                    job_queue.run_repeating(
+                        scheduled_check,
+                        interval=SOURCE_CHECK_INTERVALS.get(url, CHECK_INTERVAL),
+                        first=30 + i * 5,  # First run after 30 seconds
+                        data=url,
+                        name=f"check {url}"
+                    )
                 
                 logger.info("Bot started successfully with instant notifications!")
                 print("🤖 Toyota Notifier Bot is running...")
@@ -1146,7 +1930,8 @@ def main() -> None:
                 print(f"   3. Toyota Hilux (sell)")
                 print(f"   4. Toyota Land Cruiser (sell)")
                 print(f"⛽ Filters: Petrol/Benzin Toyotas + Diesel Hilux/Land Cruiser + ANY Toyota from crash page")
-                print(f"⚡ Checking for new cars every {CHECK_INTERVAL} seconds")
+                for url in SS_LV_URLS:
+                    print(f"⚡ Checking {url} every {SOURCE_CHECK_INTERVALS.get(url, CHECK_INTERVAL)} seconds")
                 
                 if AUTO_START:
                     print("🚀 Auto-start: ENABLED - Monitoring active")
@@ -1161,6 +1946,14 @@ def main() -> None:
                 print(f"📝 Logging to: toyota_bot.log")
                 print("Press Ctrl+C to stop")
                 
+                if WEBHOOK_URL:
+                    # Updates are pushed to the webhook server: no polling, no getUpdates conflicts
+                    print(f"🌐 Webhook mode: {WEBHOOK_URL} -> port {WEBHOOK_PORT}")
+                    asyncio.run(run_webhook(application, WEBHOOK_URL, port=WEBHOOK_PORT))
+                    logger.info("Bot stopped")
+                    remove_lock_file()
+                    break
+                
                 # Run the bot with improved settings
                 application.run_polling(
                     drop_pending_updates=True,
@@ -1186,6 +1979,8 @@ def main() -> None:
         print(f"\n❌ Fatal error: {e}")
         logger.error(f"Fatal error in main: {e}")
         remove_lock_file()
+    finally:
+        phone_browsers.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,188 @@
+"""
+Concurrent update handling, in order within each chat
+
+By default PTB handles one update at a time: a /search waiting for a
+scrape holds up every other user's /start. PerChatUpdateProcessor (for
+``Application.builder().concurrent_updates(...)``) runs up to
+``max_concurrent_updates`` handlers at once, while the updates of one
+chat still run one after another, in the order they arrived.
+
+Updates of a chat wait for their turn on a per-chat lock (FIFO) before
+they take one of the handler slots. A user sending many updates
+therefore occupies one slot, not all of them. PTB's own semaphore only
+bounds the updates in progress, waiting ones included, to
+``max_pending``.
+
+Handler latency is recorded per command (or callback prefix / update
+type): time waiting for the chat and a slot, and time in the handler.
+Commands the bot doesn't handle (see track_commands) are counted as
+"/other", and at most MAX_HANDLER_KEYS keys are kept, so user input
+can't grow the metrics without bound.
+
+The number of handlers running at once comes from the UPDATE_CONCURRENCY
+environment variable, read when the processor is created (after .env is
+loaded).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler
+
+UPDATE_CONCURRENCY = 32  # handlers running at once, unless UPDATE_CONCURRENCY is set
+MIN_CONCURRENCY = 2  # 1 is PTB's sequential mode; smaller values are raised to this
+MAX_PENDING_FACTOR = 8  # updates in progress (waiting included) per handler slot
+LATENCY_SAMPLES = 500  # latest samples kept per handler
+MAX_HANDLER_KEYS = 64  # metrics keys kept; later new keys are counted as "other"
+OTHER_COMMAND = "/other"
+
+logger = logging.getLogger(__name__)
+
+
+def update_concurrency() -> int:
+    """Handlers running at once: UPDATE_CONCURRENCY from the environment
+
+    A value that isn't a number falls back to the default, one below
+    MIN_CONCURRENCY is raised to it; both are logged, not raised, so a
+    typo in .env doesn't stop the bot from starting.
+    """
+    value = os.getenv("UPDATE_CONCURRENCY", str(UPDATE_CONCURRENCY))
+    try:
+        concurrency = int(value)
+    except ValueError:
+        logger.warning(f"UPDATE_CONCURRENCY={value!r} is not a number - using {UPDATE_CONCURRENCY}")
+        return UPDATE_CONCURRENCY
+    if concurrency < MIN_CONCURRENCY:
+        logger.warning(f"UPDATE_CONCURRENCY={concurrency} is below {MIN_CONCURRENCY} - using {MIN_CONCURRENCY}")
+        return MIN_CONCURRENCY
+    return concurrency
+
+
+def handler_key(update: object) -> str:
+    """Metrics key: "/command", "callback:<prefix>", "message" or the update type"""
+    if isinstance(update, Update):
+        message = update.effective_message
+        if update.callback_query is not None:
+            return "callback:" + (update.callback_query.data or "").split(":", 1)[0]
+        if message is not None and message.text and message.text.startswith("/"):
+            return message.text.split()[0].split("@", 1)[0].lower()
+        if message is not None:
+            return "message"
+    return type(update).__name__
+
+
+def update_chat(update: object) -> Optional[Hashable]:
+    """Chat (or user) whose updates are kept in order; None: no ordering"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+    return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: Optional[int] = None, max_pending: Optional[int] = None):
+        max_concurrent_updates = max_concurrent_updates or update_concurrency()
+        if max_concurrent_updates < MIN_CONCURRENCY:
+            raise ValueError("max_concurrent_updates must be at least 2 (1 is PTB's sequential mode)")
+        super().__init__(max_pending or max_concurrent_updates * MAX_PENDING_FACTOR)
+        self.handler_limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat -> [lock, updates holding or waiting for it]
+        self._chats: Dict[Hashable, List[Any]] = {}
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}  # key -> latest (wait, handling)
+        self._counts: Dict[str, int] = {}
+        self.commands: Optional[Set[str]] = None  # "/command" keys recorded as such (None: any)
+        self.running = 0
+        self.max_running = 0
+
+    def track_commands(self, application: Application) -> None:
+        """Record latency per command only for the commands ``application`` handles"""
+        self.commands = {
+            "/" + command
+            for handlers in application.handlers.values()
+            for handler in handlers
+            if isinstance(handler, CommandHandler)
+            for command in handler.commands
+        }
+
+    def _metrics_key(self, update: object) -> str:
+        key = handler_key(update)
+        if key.startswith("/") and self.commands is not None and key not in self.commands:
+            key = OTHER_COMMAND
+        if key not in self._samples and len(self._samples) >= MAX_HANDLER_KEYS:
+            key = OTHER_COMMAND if key.startswith("/") else "other"
+        return key
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        arrived = time.monotonic()
+        chat = update_chat(update)
+        if chat is None:
+            await self._run(update, coroutine, arrived)
+            return
+        entry = self._chats.setdefault(chat, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(update, coroutine, arrived)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat]
+
+    async def _run(self, update: object, coroutine: Awaitable[Any], arrived: float) -> None:
+        async with self._slots:
+            started = time.monotonic()
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                key = self._metrics_key(update)
+                self._counts[key] = self._counts.get(key, 0) + 1
+                samples = self._samples.setdefault(key, deque(maxlen=LATENCY_SAMPLES))
+                samples.append((started - arrived, time.monotonic() - started))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per handler key: updates handled, p50 / p95 / max of the total
+        latency and mean wait (seconds) over the latest LATENCY_SAMPLES
+        """
+        result = {}
+        for key, samples in self._samples.items():
+            totals = [wait + handling for wait, handling in samples]
+            result[key] = {
+                "count": self._counts[key],
+                "p50": _percentile(totals, 0.5),
+                "p95": _percentile(totals, 0.95),
+                "max": max(totals),
+                "wait": sum(wait for wait, _ in samples) / len(samples),
+            }
+        return result
+
+    def summary(self) -> str:
+        """One line per handler key, slowest (p95) first"""
+        stats = sorted(self.stats().items(), key=lambda item: item[1]["p95"], reverse=True)
+        return "\n".join(
+            f"{key}: {s['count']}x, p50 {s['p50'] * 1000:.0f} ms, p95 {s['p95'] * 1000:.0f} ms, "
+            f"max {s['max'] * 1000:.0f} ms, waiting {s['wait'] * 1000:.0f} ms"
+            for key, s in stats
+        )
@@ -0,0 +1,203 @@
+"""
+Webhook mode: Telegram pushes updates to a local HTTP server
+
+With long polling the bot keeps a getUpdates request open all the time,
+and a second instance polling with the same token makes both fail with
+"Conflict". With a webhook, Telegram POSTs every update as JSON to
+WEBHOOK_URL. The update goes straight onto the application's update
+queue, so nothing is polled.
+
+WebhookServer is a small HTTP/1.1 server on asyncio streams. It
+understands what Telegram sends: POST with a Content-Length body, on
+keep-alive connections. It needs no web framework (PTB's own
+run_webhook requires tornado). The secret token header is checked on
+every request. GET /health answers "ok" for container health checks.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import signal
+from typing import Dict, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PORT = 8080
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY = 1024 * 1024  # bytes; updates are a few KB
+READ_TIMEOUT = 60  # seconds an idle keep-alive connection is kept
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+def default_secret(token: str) -> str:
+    """Secret token derived from the bot token (the same after every restart)"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+class WebhookServer:
+    """Receives updates on ``path`` and puts them on ``application.update_queue``"""
+
+    def __init__(
+        self,
+        application: Application,
+        path: str = "/telegram",
+        host: str = "0.0.0.0",
+        port: int = WEBHOOK_PORT,
+        secret_token: Optional[str] = None,
+    ):
+        self.application = application
+        self.path = path
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.received = 0
+        self.rejected = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):  # idle keep-alive connections
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), timeout=READ_TIMEOUT)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.handle(method, path, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: text/plain\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], Optional[bytes]]]:
+        """
+        Request line, headers (lower-case names) and body (None: too large,
+        not read); None at the end of the connection
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY:
+            headers["connection"] = "close"  # the unread body ends the connection
+            body = None
+        else:
+            body = await reader.readexactly(length)
+        return method, urlsplit(target).path, headers, body
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: Optional[bytes]) -> Tuple[int, bytes]:
+        """Status and response body for one request"""
+        if path == "/health" and method == "GET":
+            return 200, b"ok"
+        if path != self.path:
+            return 404, b""
+        if method != "POST":
+            return 405, b""
+        if body is None:
+            return 413, b""
+        if self.secret_token and headers.get(SECRET_HEADER) != self.secret_token:
+            self.rejected += 1
+            logger.warning("Webhook request with a wrong secret token rejected")
+            return 403, b""
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid webhook update: {e}")
+            return 400, b""
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return 200, b""
+
+
+async def run_webhook(
+    application: Application,
+    webhook_url: str,
+    port: int = WEBHOOK_PORT,
+    host: str = "0.0.0.0",
+    secret_token: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+    stop_signals: Sequence[int] = (signal.SIGINT, signal.SIGTERM),
+) -> None:
+    """
+    Run ``application`` on webhook updates until ``stop`` is set or a stop
+    signal arrives
+
+    Registers ``webhook_url`` with Telegram (pending updates are dropped,
+    as with polling). Serves the path of the URL on ``host``:``port``;
+    a reverse proxy or tunnel forwards the public HTTPS URL there. The
+    application's post_init / post_stop / post_shutdown hooks run as with
+    run_polling.
+    """
+    stop = stop or asyncio.Event()
+    secret_token = secret_token or default_secret(application.bot.token)
+    server = WebhookServer(application, urlsplit(webhook_url).path or "/", host, port, secret_token)
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in stop_signals:
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            pass  # not the main thread / not supported here
+
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        await application.bot.set_webhook(
+            webhook_url, secret_token=secret_token, drop_pending_updates=True, allowed_updates=Update.ALL_TYPES
+        )
+        await application.start()
+        logger.info(f"Webhook mode: updates arrive at {webhook_url}")
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        for sig in installed:
+            loop.remove_signal_handler(sig)